@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Online Anomaly Detection
+逐筆更新每台伺服器的 EWMA 平均 / 變異數與單邊 CUSUM (每個指標 O(1) 狀態)，
+結果偏離該伺服器自己學到的基準時產生異常紀錄；狀態存成 JSON，重新啟動後延續
+"""
+
+import argparse
+import datetime as dt
+import json
+import math
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+STATE_VERSION = 1
+# 指標與方向：True 表示越高越好 (下降才算異常)
+METRICS = (
+    ("steady_mbit_s", True),
+    ("download_mbps", True),
+    ("ping_ms", False),
+    ("ttfb_ms", False),
+    ("total_ms", False),
+)
+DEFAULT_ALPHA = 0.1
+DEFAULT_WARMUP = 5
+# 單筆偏離超過 z 個標準差視為突發異常
+DEFAULT_Z_THRESHOLD = 4.0
+# CUSUM 的容許偏移 k 與警戒值 h (以標準差為單位)，用來抓逐漸劣化
+DEFAULT_CUSUM_K = 0.5
+DEFAULT_CUSUM_H = 5.0
+# 標準差下限 (平均值的比例)，避免非常穩定的伺服器因微小波動就告警
+MIN_RELATIVE_STD = 0.05
+
+class MetricBaseline:
+    """單一伺服器、單一指標的基準"""
+
+    __slots__ = ("count", "mean", "var", "cusum")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, var: float = 0.0, cusum: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.var = var
+        self.cusum = cusum
+
+    def std(self) -> float:
+        return max(math.sqrt(max(self.var, 0.0)), abs(self.mean) * MIN_RELATIVE_STD, 1e-9)
+
+    def update(self, value: float, alpha: float):
+        # 前幾筆以 1/n 權重初始化，之後固定為 alpha
+        weight = max(alpha, 1.0 / (self.count + 1))
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"count": self.count, "mean": self.mean, "var": self.var, "cusum": self.cusum}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MetricBaseline":
+        return cls(int(data["count"]), float(data["mean"]), float(data["var"]), float(data.get("cusum", 0.0)))
+
+def server_id(record: Dict[str, Any]) -> Optional[str]:
+    """基準的鍵值；下載結果依測試大小與 quick 模式分開，fleet 的結果依代理程式分開"""
+    name = record.get("server_key") or record.get("host")
+    if not name:
+        return None
+    if record.get("test_size"):
+        # 100MB 與 1GB、quick 與完整測試的速度分布不同，不共用基準
+        name = f"{name}@{record['test_size']}{'/quick' if record.get('quick_test') else ''}"
+    return f"{record['agent']}/{name}" if record.get("agent") else name
+
+def record_metrics(record: Dict[str, Any]) -> List[tuple]:
+    """可用來學習的指標值 [(名稱, 值, 越高越好)]"""
+    if not record.get("success", "download_mbps" in record) or record.get("skipped") or record.get("cached"):
+        return []
+    # 用戶端 CPU 吃滿時的速度反映的是本機效能，中斷或取消的部分結果也不完整，都不列入基準
+    if record.get("client_limited") or record.get("partial_reason") not in (None, "deadline"):
+        return []
+    # 限速 (--max-rate) 與目標速率 (--target-rate) 的結果反映的是設定值，不是線路
+    if record.get("max_rate_mbit_s") is not None or record.get("target_rate") is not None:
+        return []
+    values = []
+    for name, higher_is_better in METRICS:
+        value = record.get(name)
+        if name == "download_mbps" and record.get("steady_mbit_s") is not None:
+            continue  # 有穩態吞吐量時不重複判斷
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            values.append((name, float(value), higher_is_better))
+    return values
+
+class AnomalyDetector:
+    """逐筆觀察結果並維護每台伺服器的基準
+
+    observe() 會在結果中加上 baseline (各指標的基準與偏離程度)，
+    有異常時再加上 anomalies；state_path 不為 None 時每次更新都寫回檔案。
+    """
+
+    def __init__(self, state_path: Optional[str] = None, alpha: float = DEFAULT_ALPHA, warmup: int = DEFAULT_WARMUP,
+                 z_threshold: float = DEFAULT_Z_THRESHOLD, cusum_k: float = DEFAULT_CUSUM_K,
+                 cusum_h: float = DEFAULT_CUSUM_H,
+                 on_anomaly: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.state_path = state_path
+        self.alpha = alpha
+        self.warmup = warmup
+        self.z_threshold = z_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.on_anomaly = on_anomaly
+        self.servers: Dict[str, Dict[str, MetricBaseline]] = {}
+        self.lock = threading.Lock()
+        if state_path and os.path.exists(state_path):
+            self.load(state_path)
+
+    def load(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            raise ValueError(f"unsupported anomaly state version in {path}: {state.get('version')}")
+        self.servers = {
+            server: {metric: MetricBaseline.from_dict(data) for metric, data in metrics.items()}
+            for server, metrics in state.get("servers", {}).items()
+        }
+
+    def save(self, path: Optional[str] = None):
+        """先寫暫存檔再改名，寫到一半中斷也不會毀損狀態"""
+        path = path or self.state_path
+        if not path:
+            return
+        state = {
+            "version": STATE_VERSION,
+            "updated": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "servers": {server: {metric: baseline.to_dict() for metric, baseline in metrics.items()}
+                        for server, metrics in self.servers.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def check(self, server: str, metric: str, value: float, higher_is_better: bool,
+              baseline: MetricBaseline) -> tuple:
+        """比較新值與基準並更新；回傳 (偏離資訊, 異常紀錄或 None)"""
+        if baseline.count < self.warmup:
+            baseline.update(value, self.alpha)
+            return {"mean": baseline.mean, "std": baseline.std(), "count": baseline.count, "warmup": True}, None
+
+        std = baseline.std()
+        z = (value - baseline.mean) / std
+        # 正值代表往劣化的方向偏離
+        worse = -z if higher_is_better else z
+        baseline.cusum = max(0.0, baseline.cusum + worse - self.cusum_k)
+        info = {"mean": baseline.mean, "std": std, "count": baseline.count, "z": z, "cusum": baseline.cusum}
+
+        detector = None
+        if worse > self.z_threshold:
+            detector = "ewma"
+        elif baseline.cusum > self.cusum_h:
+            detector = "cusum"
+        anomaly = None
+        if detector is not None:
+            anomaly = {
+                "type": "anomaly",
+                "server": server,
+                "metric": metric,
+                "value": value,
+                "baseline_mean": baseline.mean,
+                "baseline_std": std,
+                "z": z,
+                "cusum": baseline.cusum,
+                "detector": detector,
+                "direction": "drop" if higher_is_better else "rise",
+                "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(),
+            }
+            # 告警後重新累積，持續劣化時會再次告警
+            baseline.cusum = 0.0
+
+        # 極端值先截到門檻再更新，單次突波不會拉壞基準；持續的位移仍會逐漸被學進來
+        limit = self.z_threshold * std
+        baseline.update(min(max(value, baseline.mean - limit), baseline.mean + limit), self.alpha)
+        return info, anomaly
+
+    def observe(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """更新基準並把 baseline / anomalies 加到結果中；回傳這筆結果的異常紀錄"""
+        server = server_id(record)
+        metrics = record_metrics(record)
+        if server is None or not metrics:
+            return []
+        anomalies = []
+        baseline_info = {}
+        with self.lock:
+            baselines = self.servers.setdefault(server, {})
+            for metric, value, higher_is_better in metrics:
+                baseline = baselines.setdefault(metric, MetricBaseline())
+                info, anomaly = self.check(server, metric, value, higher_is_better, baseline)
+                baseline_info[metric] = info
+                if anomaly is not None:
+                    anomalies.append(anomaly)
+            self.save()
+        record["baseline"] = baseline_info
+        if anomalies:
+            record["anomalies"] = anomalies
+            if self.on_anomaly is not None:
+                for anomaly in anomalies:
+                    self.on_anomaly(anomaly)
+        return anomalies
+
+    def __call__(self, event):
+        """可直接訂閱 SpeedTestEngine：收到 RESULT 事件時觀察結果 (需在輸出結果的監聽者之前訂閱)"""
+        if event.kind == "result":
+            self.observe(event.data["result"])
+
+def format_anomaly(anomaly: Dict[str, Any]) -> str:
+    return (f"{anomaly['metric']} {anomaly['value']:.1f} vs baseline {anomaly['baseline_mean']:.1f} "
+            f"± {anomaly['baseline_std']:.1f} (z {anomaly['z']:+.1f}, {anomaly['detector']})")
+
+class AnomalyLog:
+    """把異常紀錄附加寫入 NDJSON 檔"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, anomaly: Dict[str, Any]):
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(anomaly, ensure_ascii=False) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or seed per-server anomaly baselines")
+    parser.add_argument("state", help="Anomaly state JSON file (created if missing)")
+    parser.add_argument("--seed", nargs="+", metavar="FILE",
+                        help="Learn from saved results (JSON or NDJSON, in time order) and report anomalies found")
+    args = parser.parse_args()
+
+    detector = AnomalyDetector(args.state)
+    if args.seed:
+        from result_set import iter_records
+        count = 0
+        for path in args.seed:
+            for record in iter_records(path):
+                for anomaly in detector.observe(record):
+                    print(f"{record.get('timestamp', '')} {anomaly['server']}: {format_anomaly(anomaly)}")
+                count += 1
+        detector.save()
+        print(f"Learned from {count} results")
+
+    print(f"{'server':<28} {'metric':<15} {'count':>6} {'mean':>10} {'std':>10} {'cusum':>7}")
+    print("-" * 80)
+    for server in sorted(detector.servers):
+        for metric, baseline in sorted(detector.servers[server].items()):
+            print(f"{server:<28} {metric:<15} {baseline.count:>6} {baseline.mean:>10.1f} "
+                  f"{baseline.std():>10.1f} {baseline.cusum:>7.2f}")
+
+if __name__ == "__main__":
+    main()
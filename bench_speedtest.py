@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Speed Test Benchmark Suite
+對本機替身伺服器量測工具本身的熱點：下載迴圈每 GB 的 CPU 時間、迴路最大吞吐量、
+netcheck 掃描時間與並行數的關係、--list 冷啟動時間與機房目錄查詢成本；
+結果存成 JSON 基準檔，之後的結果可與基準比較找出效能退化
+"""
+
+import argparse
+import datetime as dt
+import http.server
+import json
+import os
+import platform
+import re
+import resource
+import socketserver
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+BASELINE_VERSION = 1
+GROUPS = ("download", "netcheck", "startup", "lookup")
+DEFAULT_TOLERANCE = 10.0
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """/<N>MB.bin 回應 N MiB 的資料，其他路徑回應小型頁面；可注入回應延遲與限速"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "BenchStandIn/1.0"
+    BLOCK = bytes(256 * 1024)
+
+    def do_GET(self):
+        # 注入的延遲加在回應標頭之前，對用戶端來說相當於較長的 TTFB
+        if self.server.latency_s:
+            time.sleep(self.server.latency_s)
+        match = re.search(r"(\d+)MB\.bin", self.path)
+        if match is None:
+            body = b"<html><body>ok</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        size = int(match.group(1)) * 1024 * 1024
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        rate = self.server.rate_bytes
+        sent = 0
+        start = time.perf_counter()
+        try:
+            while sent < size:
+                length = min(len(self.BLOCK), size - sent)
+                self.wfile.write(self.BLOCK[:length])
+                sent += length
+                if rate:
+                    ahead = sent / rate - (time.perf_counter() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class StandInServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, rate_mbit_s: Optional[float] = None, latency_ms: float = 0.0):
+        super().__init__(address, StandInHandler)
+        self.rate_bytes = rate_mbit_s * 1e6 / 8 if rate_mbit_s else None
+        self.latency_s = latency_ms / 1000
+
+class StandInProcess:
+    """在子行程中執行替身伺服器，量測到的 CPU 時間只包含用戶端"""
+
+    def __init__(self, rate_mbit_s: Optional[float] = None, latency_ms: float = 0.0):
+        command = [sys.executable, os.path.abspath(__file__), "serve", "--port", "0", "--latency", str(latency_ms)]
+        if rate_mbit_s:
+            command += ["--rate", str(rate_mbit_s)]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        line = self.process.stdout.readline()
+        if not line.startswith("listening"):
+            self.process.kill()
+            raise RuntimeError("stand-in server failed to start")
+        self.port = int(line.split(":")[-1])
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+    def __enter__(self) -> "StandInProcess":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def process_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def metric(value: float, unit: str, better: str, samples: Optional[List[float]] = None) -> Dict[str, Any]:
+    entry = {"value": value, "unit": unit, "better": better}
+    if samples is not None:
+        entry["samples"] = samples
+    return entry
+
+def measured_mbit_s(result: Dict[str, Any]) -> float:
+    """穩態吞吐量 (SI Mbit/s)；傳輸太短沒有穩態值時改用整段平均"""
+    return result.get("steady_mbit_s") or result["downloaded_bytes"] * 8 / 1e6 / result["elapsed_seconds"]
+
+def bench_download(settings: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """下載迴圈：無限速時的 CPU / GB 與最大吞吐量，以及限速時的量測誤差"""
+    from vultr_speedtest import SpeedTest
+
+    size_mb = settings["download_mb"]
+    cpu_per_gb = []
+    throughput = []
+    with StandInProcess() as server:
+        for _ in range(settings["repeat"]):
+            speed_test = SpeedTest()
+            cpu_start = process_cpu_seconds()
+            result = speed_test.download_test("127.0.0.1", show_progress=False,
+                                              custom_url=f"{server.base_url}/{size_mb}MB.bin")
+            cpu = process_cpu_seconds() - cpu_start
+            if not result.get("success"):
+                raise RuntimeError(f"download benchmark failed: {result.get('error')}")
+            cpu_per_gb.append(cpu / (result["downloaded_bytes"] / 1e9))
+            throughput.append(measured_mbit_s(result))
+
+    paced_errors = []
+    rate = settings["paced_rate"]
+    with StandInProcess(rate_mbit_s=rate, latency_ms=settings["latency_ms"]) as server:
+        # 約 3 秒的傳輸量
+        paced_mb = max(1, int(rate * 3 / 8))
+        for _ in range(settings["repeat"]):
+            result = SpeedTest().download_test("127.0.0.1", show_progress=False,
+                                               custom_url=f"{server.base_url}/{paced_mb}MB.bin")
+            if not result.get("success"):
+                raise RuntimeError(f"paced download benchmark failed: {result.get('error')}")
+            paced_errors.append(abs(measured_mbit_s(result) - rate) / rate * 100)
+
+    return {
+        "download.cpu_s_per_gb": metric(statistics.median(cpu_per_gb), "s/GB", "lower", cpu_per_gb),
+        "download.loopback_mbit_s": metric(max(throughput), "Mbit/s", "higher", throughput),
+        "download.paced_error_pct": metric(statistics.median(paced_errors), "%", "lower", paced_errors),
+    }
+
+def bench_netcheck(settings: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """netcheck 掃描：同樣數量的目標在不同並行數下的總時間 (替身伺服器注入回應延遲)"""
+    from simple_netcheck import test_connection_speed
+
+    targets = settings["netcheck_targets"]
+    results = {}
+    with StandInProcess(latency_ms=settings["latency_ms"]) as server:
+        for concurrency in settings["concurrency"]:
+            samples = []
+            for _ in range(settings["repeat"]):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    checks = list(pool.map(lambda _: test_connection_speed("127.0.0.1", 5.0, port=server.port),
+                                           range(targets)))
+                samples.append(time.perf_counter() - start)
+                if not all(check["success"] for check in checks):
+                    raise RuntimeError("netcheck benchmark: connection to the stand-in server failed")
+            results[f"netcheck.sweep_s.c{concurrency}"] = metric(statistics.median(samples), "s", "lower", samples)
+    return results
+
+def bench_startup(settings: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """冷啟動：新的直譯器執行 --list 到結束的時間"""
+    results = {}
+    for script in ("vultr_speedtest.py", "simple_netcheck.py"):
+        samples = []
+        for _ in range(settings["repeat"]):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(HERE, script), "--list"], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            samples.append(time.perf_counter() - start)
+        name = os.path.splitext(script)[0]
+        results[f"startup.{name}_list_s"] = metric(min(samples), "s", "lower", samples)
+    return results
+
+def time_call(func: Callable[[], Any], number: int) -> float:
+    """單次呼叫的時間 (µs)，取 5 輪中最快的一輪"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+def bench_lookup(settings: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """機房目錄查詢：以最後才會找到的鍵值 (最差情況) 與找不到的鍵值計時"""
+    from test_plan import netcheck_site
+    from vultr_speedtest import VULTR_SERVERS, get_server_by_key, get_server_by_key_with_zone, get_test_url
+
+    last_key = list(list(VULTR_SERVERS.values())[-1])[-1]
+    server = get_server_by_key(last_key)
+    number = settings["lookup_calls"]
+    return {
+        "lookup.get_server_by_key_us": metric(time_call(lambda: get_server_by_key(last_key), number), "µs", "lower"),
+        "lookup.get_server_by_key_miss_us": metric(time_call(lambda: get_server_by_key("no-such-key"), number),
+                                                   "µs", "lower"),
+        "lookup.with_zone_us": metric(time_call(lambda: get_server_by_key_with_zone(last_key, "vultr"), number),
+                                      "µs", "lower"),
+        "lookup.get_test_url_us": metric(time_call(lambda: get_test_url(server, "1GB"), number), "µs", "lower"),
+        "lookup.netcheck_site_us": metric(time_call(lambda: netcheck_site("www.example.com", {}, None), number),
+                                          "µs", "lower"),
+    }
+
+BENCHMARKS = {
+    "download": bench_download,
+    "netcheck": bench_netcheck,
+    "startup": bench_startup,
+    "lookup": bench_lookup,
+}
+
+def run_benchmarks(groups: List[str], settings: Dict[str, Any]) -> Dict[str, Any]:
+    benchmarks = {}
+    for group in groups:
+        print(f"[{group}]", flush=True)
+        for name, entry in BENCHMARKS[group](settings).items():
+            benchmarks[name] = entry
+            print(f"  {name:<34} {entry['value']:12.3f} {entry['unit']}", flush=True)
+    return {
+        "version": BASELINE_VERSION,
+        "created": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+        "benchmarks": benchmarks,
+    }
+
+def compare_runs(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """比較兩次結果；往不好的方向變化超過 tolerance (%) 時標記為 regression"""
+    rows = []
+    for name, entry in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None or not base["value"]:
+            rows.append({"name": name, "baseline": None, "current": entry["value"], "unit": entry["unit"],
+                         "change_pct": None, "status": "new"})
+            continue
+        change = (entry["value"] - base["value"]) / base["value"] * 100
+        worse = change if entry["better"] == "lower" else -change
+        if worse > tolerance:
+            status = "regression"
+        elif worse < -tolerance:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append({"name": name, "baseline": base["value"], "current": entry["value"], "unit": entry["unit"],
+                     "change_pct": change, "status": status})
+    return rows
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> int:
+    """輸出比較表，回傳退化的項目數"""
+    if baseline.get("settings") != current.get("settings"):
+        print("⚠️  Benchmark settings differ from the baseline; numbers may not be comparable")
+    if (baseline.get("platform"), baseline.get("python")) != (current.get("platform"), current.get("python")):
+        print(f"⚠️  Baseline was recorded on {baseline.get('platform')} / Python {baseline.get('python')}")
+    print(f"\n{'benchmark':<34} {'baseline':>12} {'current':>12} {'change':>8}  status (±{tolerance:.0f}%)")
+    print("-" * 84)
+    rows = compare_runs(baseline, current, tolerance)
+    for row in rows:
+        base = f"{row['baseline']:12.3f}" if row["baseline"] is not None else f"{'-':>12}"
+        change = f"{row['change_pct']:+7.1f}%" if row["change_pct"] is not None else f"{'-':>8}"
+        marker = {"regression": "❌ ", "improved": "✅ "}.get(row["status"], "")
+        print(f"{row['name']:<34} {base} {row['current']:12.3f} {change}  {marker}{row['status']}")
+    regressions = sum(1 for row in rows if row["status"] == "regression")
+    print(f"\n{regressions} regression(s)")
+    return regressions
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"unsupported baseline version in {path}: {baseline.get('version')}")
+    return baseline
+
+def run_serve_command(args):
+    server = StandInServer(("127.0.0.1", args.port), args.rate, args.latency)
+    # 父行程讀取這一行取得連接埠
+    print(f"listening on 127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def run_bench_command(args) -> int:
+    settings = {
+        "repeat": args.repeat,
+        "download_mb": args.download_mb,
+        "paced_rate": args.paced_rate,
+        "latency_ms": args.latency,
+        "netcheck_targets": args.targets,
+        "concurrency": args.concurrency,
+        "lookup_calls": args.lookup_calls,
+    }
+    current = run_benchmarks(args.only or list(GROUPS), settings)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+    if args.compare:
+        regressions = print_comparison(load_baseline(args.compare), current, args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the speed test tools against local stand-in servers")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Run benchmarks (optionally save / compare a JSON baseline)")
+    run_parser.add_argument("--only", nargs="+", choices=GROUPS, help="Benchmark groups to run (default: all)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Repetitions per benchmark (default: 3)")
+    run_parser.add_argument("--download-mb", type=int, default=512,
+                            help="Download size in MiB for the unthrottled download benchmark (default: 512)")
+    run_parser.add_argument("--paced-rate", type=float, default=200.0,
+                            help="Stand-in server rate (Mbit/s) for the measurement accuracy benchmark (default: 200)")
+    run_parser.add_argument("--latency", type=float, default=20.0,
+                            help="Response latency (ms) injected for netcheck and paced downloads (default: 20)")
+    run_parser.add_argument("--targets", type=int, default=32, help="Targets per netcheck sweep (default: 32)")
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                            help="Netcheck sweep concurrency levels (default: 1 4 16)")
+    run_parser.add_argument("--lookup-calls", type=int, default=2000, help="Calls per lookup timing (default: 2000)")
+    run_parser.add_argument("--save", metavar="FILE", help="Save the results as a JSON baseline")
+    run_parser.add_argument("--compare", metavar="FILE", help="Compare against a saved baseline (exit 1 on regression)")
+    run_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                            help=f"Allowed change in the worse direction, in percent (default: {DEFAULT_TOLERANCE:.0f})")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two saved baselines")
+    compare_parser.add_argument("baseline", help="Older baseline JSON")
+    compare_parser.add_argument("current", help="Newer baseline JSON")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                                help=f"Allowed change in the worse direction, in percent (default: {DEFAULT_TOLERANCE:.0f})")
+
+    serve_parser = subparsers.add_parser("serve", help="Run a stand-in HTTP server (used by the benchmarks)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port on 127.0.0.1 (0 picks a free port)")
+    serve_parser.add_argument("--rate", type=float, help="Per-connection rate limit (Mbit/s)")
+    serve_parser.add_argument("--latency", type=float, default=0.0, help="Delay before each response (ms)")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        sys.exit(run_bench_command(args))
+    elif args.command == "compare":
+        regressions = print_comparison(load_baseline(args.baseline), load_baseline(args.current), args.tolerance)
+        sys.exit(1 if regressions else 0)
+    elif args.command == "serve":
+        run_serve_command(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Catalog Doctor
+並行以 HEAD 檢查機房目錄中的每個測試檔 URL：狀態碼、轉址、Content-Length 與宣告大小是否相符、
+Accept-Ranges 與回應時間；結果依 TTL 快取，測速時可先略過已知失效的項目
+附帶模擬目錄伺服器 (mock)，不需要外部網路也能測試各種失效情況
+"""
+
+import argparse
+import datetime as dt
+import http.client
+import http.server
+import json
+import os
+import re
+import socketserver
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+from result_cache import format_age, parse_duration, record_age
+from vultr_speedtest import (DEFAULT_HEALTH_PATH, HINET_SERVERS, LINODE_SERVERS, VULTR_SERVERS,
+                             get_server_by_key_with_zone, get_test_url)
+
+HEALTH_VERSION = 1
+DEFAULT_TTL = 6 * 3600
+DEFAULT_CONCURRENCY = 16
+DEFAULT_SLOW_MS = 2000.0
+MAX_REDIRECTS = 5
+# 100MB 與 100MiB 相差約 4.9%，容許範圍內都算符合宣告大小
+SIZE_TOLERANCE = 0.05
+SIZES = ("100MB", "1GB")
+USER_AGENT = "Vultr-SpeedTest/1.0"
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# 檔名中的大小：M 為 MiB，G 與 test_plan 的 TEST_SIZE_BYTES 相同以 1000 MiB 計
+SIZE_PATTERN = re.compile(r"(\d+)\s*([mg])b?(?![a-z])", re.IGNORECASE)
+SEVERITY_ORDER = {"ok": 0, "warn": 1, "bad": 2}
+
+def declared_bytes(url: str, label: Optional[str] = None) -> Optional[int]:
+    """由檔名 (vultr.com.100MB.bin、test_250m.zip、1GB-tokyo2.bin) 或大小標籤推算宣告的位元組數"""
+    for text in (os.path.basename(urlparse(url).path), label or ""):
+        match = SIZE_PATTERN.search(text)
+        if match is not None:
+            value = int(match.group(1))
+            return value * 1024 ** 2 if match.group(2).lower() == "m" else value * 1000 * 1024 ** 2
+    return None
+
+def catalog_entries(servers: Dict[str, Dict[str, Any]], sizes: Tuple[str, ...] = SIZES) -> Iterator[Dict[str, Any]]:
+    """已補齊 key / region / provider 的伺服器設定展開成 (伺服器, 大小, URL) 項目，相同 URL 只出現一次"""
+    seen = set()
+    for key, server in servers.items():
+        if "test_urls" in server:
+            urls = [(size, url) for size, url in server["test_urls"].items() if size in sizes]
+        elif "test_url" in server:
+            urls = [(server.get("file_size", "-"), server["test_url"])]
+        else:
+            urls = [(size, get_test_url(server, size)) for size in sizes]
+        for size, url in urls:
+            if not url or url in seen:
+                continue
+            seen.add(url)
+            yield {"key": key, "provider": server.get("provider", "custom"), "region": server.get("region", "custom"),
+                   "size": size, "url": url, "expected_bytes": declared_bytes(url, size)}
+
+def builtin_servers(zone: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """內建目錄 (與 --all 相同順序：HiNet、Linode、Vultr)"""
+    servers = {}
+    for provider, catalog in (("hinet", HINET_SERVERS), ("linode", LINODE_SERVERS), ("vultr", VULTR_SERVERS)):
+        if zone and zone != provider:
+            continue
+        for region, entries in catalog.items():
+            for key, server in entries.items():
+                servers.setdefault(key, dict(server, key=key, region=region, provider=provider))
+    return servers
+
+def load_catalog_file(path: str) -> Dict[str, Dict[str, Any]]:
+    """與測試計畫相同的 {"servers": {鍵值: {host, test_url | test_urls, ...}}} 格式"""
+    with open(path, encoding="utf-8") as f:
+        servers = json.load(f)["servers"]
+    for key, server in servers.items():
+        server.setdefault("key", key)
+        server.setdefault("region", "custom")
+        server.setdefault("provider", "custom")
+    return servers
+
+def head_request(url: str, timeout: float, method: str = "HEAD") -> Tuple[int, http.client.HTTPMessage]:
+    parsed = urlparse(url)
+    if parsed.scheme == "https":
+        conn = http.client.HTTPSConnection(parsed.hostname, parsed.port, timeout=timeout,
+                                           context=ssl.create_default_context())
+    else:
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=timeout)
+    headers = {"User-Agent": USER_AGENT, "Connection": "close"}
+    if method == "GET":
+        headers["Range"] = "bytes=0-0"
+    try:
+        conn.request(method, (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else ""), headers=headers)
+        response = conn.getresponse()
+        if method == "GET":
+            response.read(1)
+        return response.status, response.headers
+    finally:
+        conn.close()
+
+def probe_url(url: str, timeout: float = 10.0) -> Dict[str, Any]:
+    """以 HEAD 探測 URL 並手動追蹤轉址；不支援 HEAD (405 / 501) 時改以 GET Range: bytes=0-0 取得大小"""
+    probe: Dict[str, Any] = {"redirects": [], "method": "HEAD"}
+    current = url
+    start = time.perf_counter()
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers = head_request(current, timeout, probe["method"])
+            if status in (405, 501) and probe["method"] == "HEAD":
+                probe["method"] = "GET"
+                status, headers = head_request(current, timeout, "GET")
+            location = headers.get("Location")
+            if status in REDIRECT_STATUSES and location:
+                current = urljoin(current, location)
+                probe["redirects"].append({"status": status, "location": current})
+                continue
+            break
+        else:
+            probe["error"] = f"more than {MAX_REDIRECTS} redirects"
+            return probe
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        probe["error"] = f"unreachable: {str(e) or type(e).__name__}"
+        probe["unreachable"] = True
+        return probe
+    finally:
+        probe["response_ms"] = (time.perf_counter() - start) * 1000
+
+    probe["status"] = status
+    probe["final_url"] = current
+    length = headers.get("Content-Length")
+    content_range = headers.get("Content-Range", "")
+    if status == 206 and "/" in content_range:
+        length = content_range.rsplit("/", 1)[1]
+    probe["content_length"] = int(length) if length and length.isdigit() else None
+    probe["accept_ranges"] = headers.get("Accept-Ranges") or ("bytes" if status == 206 else None)
+    return probe
+
+def evaluate(entry: Dict[str, Any], probe: Dict[str, Any], slow_ms: float = DEFAULT_SLOW_MS) -> Dict[str, Any]:
+    """依探測結果判定 ok / warn / bad，problems 列出每個問題"""
+    problems = []
+    if "error" in probe:
+        problems.append(("bad", probe["error"]))
+    elif probe["status"] >= 400 or probe["status"] in REDIRECT_STATUSES:
+        problems.append(("bad", f"HTTP {probe['status']}"))
+    else:
+        if probe["redirects"]:
+            final_host = urlparse(probe["final_url"]).hostname
+            where = final_host if final_host != urlparse(entry["url"]).hostname else probe["final_url"]
+            problems.append(("warn", f"redirected ({len(probe['redirects'])}x) to {where}"))
+        expected = entry["expected_bytes"]
+        length = probe["content_length"]
+        if length is None:
+            problems.append(("warn", "no Content-Length"))
+        elif expected and abs(length - expected) > expected * SIZE_TOLERANCE:
+            problems.append(("bad", f"Content-Length {length / 1024 ** 2:.1f} MiB, declared {expected / 1024 ** 2:.0f} MiB"))
+        if (probe["accept_ranges"] or "none").lower() == "none":
+            problems.append(("warn", "no Accept-Ranges"))
+        if probe["method"] == "GET":
+            problems.append(("warn", "HEAD not supported"))
+    if probe["response_ms"] > slow_ms:
+        problems.append(("warn", f"slow response ({probe['response_ms']:.0f} ms)"))
+
+    health = max((severity for severity, _ in problems), key=SEVERITY_ORDER.get, default="ok")
+    return dict(entry, **probe, health=health, problems=[message for _, message in problems],
+                timestamp=dt.datetime.now(dt.timezone.utc).isoformat())
+
+def check_entry(entry: Dict[str, Any], timeout: float = 10.0, slow_ms: float = DEFAULT_SLOW_MS) -> Dict[str, Any]:
+    return evaluate(entry, probe_url(entry["url"], timeout), slow_ms)
+
+class HealthCache:
+    """各測試檔 URL 最近一次的檢查結果，存成 JSON (先寫暫存檔再改名)；超過各自的 ttl_s 即失效"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_HEALTH_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("version") == HEALTH_VERSION:
+            self.entries = state.get("entries", {})
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            state = {"version": HEALTH_VERSION, "entries": dict(self.entries)}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """尚未過期的檢查結果"""
+        with self.lock:
+            record = self.entries.get(url)
+        if record is None:
+            return None
+        age = record_age(record)
+        if age is None or age < 0 or age > record.get("ttl_s", DEFAULT_TTL):
+            return None
+        return dict(record, cached=True, cached_age_s=age)
+
+    def store(self, record: Dict[str, Any], ttl: float):
+        with self.lock:
+            self.entries[record["url"]] = dict(record, ttl_s=ttl)
+
+    def known_bad(self, url: str) -> Optional[Dict[str, Any]]:
+        record = self.lookup(url)
+        return record if record is not None and record["health"] == "bad" else None
+
+def looks_offline(checked: List[Dict[str, Any]]) -> bool:
+    """新檢查的項目全部無法連線：多半是本機網路中斷，而不是整個目錄失效"""
+    return len(checked) >= 2 and all(result.get("unreachable") for result in checked)
+
+def run_doctor(entries: List[Dict[str, Any]], cache: HealthCache, ttl: float = DEFAULT_TTL,
+               concurrency: int = DEFAULT_CONCURRENCY, timeout: float = 10.0, slow_ms: float = DEFAULT_SLOW_MS,
+               refresh: bool = False, on_result=None) -> List[Dict[str, Any]]:
+    """並行檢查所有項目；TTL 內的結果直接沿用 (refresh 時全部重新檢查)，回傳依目錄順序排列的結果
+
+    looks_offline 時不寫入快取，以免測速時略過整個目錄。
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+    pending = []
+    for index, entry in enumerate(entries):
+        cached = None if refresh else cache.lookup(entry["url"])
+        if cached is not None:
+            results[index] = cached
+            if on_result is not None:
+                on_result(cached)
+        else:
+            pending.append(index)
+
+    checked = []
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = {pool.submit(check_entry, entries[index], timeout, slow_ms): index for index in pending}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            checked.append(result)
+            if on_result is not None:
+                on_result(result)
+    finally:
+        pool.shutdown(wait=False)
+        if not looks_offline(checked):
+            for result in checked:
+                cache.store(result, ttl)
+            cache.save()
+    return [result for result in results if result is not None]
+
+def skip_known_bad(server_keys: List[str], zone: Optional[str], test_size: str,
+                   cache: HealthCache) -> Tuple[List[str], List[Tuple[str, Dict[str, Any]]]]:
+    """測速前略過測試檔最近被判定為失效的伺服器，回傳 (保留的鍵值, [(略過的鍵值, 檢查結果)])"""
+    kept, skipped = [], []
+    for key in server_keys:
+        server = get_server_by_key_with_zone(key, zone)
+        url = get_test_url(server, test_size) if server else None
+        record = cache.known_bad(url) if url else None
+        if record is None:
+            kept.append(key)
+        else:
+            skipped.append((key, record))
+    return kept, skipped
+
+def format_result(result: Dict[str, Any]) -> str:
+    mark = {"ok": "✅", "warn": "⚠️ ", "bad": "❌"}[result["health"]]
+    status = result.get("status", "-")
+    length = f"{result['content_length'] / 1024 ** 2:.0f} MiB" if result.get("content_length") is not None else "-"
+    cached = f" [cached, {format_age(result['cached_age_s'])}]" if result.get("cached") else ""
+    problems = f"  {'; '.join(result['problems'])}" if result["problems"] else ""
+    return (f"{mark} {result['key']:<16} {result['size']:<6} {status!s:>4} {result['response_ms']:7.0f} ms "
+            f"{length:>9}{cached}{problems}")
+
+class MockCatalogHandler(http.server.BaseHTTPRequestHandler):
+    """模擬目錄的測試檔伺服器：/<N>MB.bin 為正常檔案，路徑前綴注入各種失效情況
+
+    /moved/ 轉址、/loop/ 無限轉址、/missing/ 404、/error/ 503、/truncated/ 大小只有宣告的十分之一、
+    /noranges/ 不回報 Accept-Ranges、/slow/ 延遲回應、/nohead/ 不支援 HEAD
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "MockCatalog/1.0"
+    BLOCK = bytes(256 * 1024)
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def respond(self, head: bool):
+        path = self.path
+        if path.startswith("/slow/"):
+            time.sleep(self.server.slow_s)
+            path = path[len("/slow"):]
+        if path.startswith("/moved/"):
+            return self.send_empty(302, Location=path[len("/moved"):])
+        if path.startswith("/loop/"):
+            return self.send_empty(302, Location=path)
+        if path.startswith("/missing/"):
+            return self.send_empty(404)
+        if path.startswith("/error/"):
+            return self.send_empty(503)
+        if path.startswith("/nohead/") and head:
+            return self.send_empty(405, Allow="GET")
+        match = re.search(r"(\d+)MB\.bin", path)
+        if match is None:
+            return self.send_empty(404)
+
+        size = int(match.group(1)) * 1024 ** 2
+        if path.startswith("/truncated/"):
+            size //= 10
+        start, end = 0, size - 1
+        range_match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        status = 200
+        if range_match is not None and not head:
+            status = 206
+            start = int(range_match.group(1))
+            end = min(int(range_match.group(2) or end), end)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if not path.startswith("/noranges/"):
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if head:
+            return
+        remaining = end - start + 1
+        try:
+            while remaining > 0:
+                length = min(len(self.BLOCK), remaining)
+                self.wfile.write(self.BLOCK[:length])
+                remaining -= length
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_empty(self, status: int, **headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class MockCatalogServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, slow_ms: float = DEFAULT_SLOW_MS * 1.5):
+        super().__init__(address, MockCatalogHandler)
+        self.slow_s = slow_ms / 1000
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "MockCatalogServer":
+        """在背景執行緒中執行 (check --mock 用)"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def mock_catalog(base_url: str) -> Dict[str, Any]:
+    """指向模擬伺服器的目錄，每種失效情況各一台；down 指向沒有服務的埠"""
+    catalog = {"good": {"host": "127.0.0.1", "test_url": f"{base_url}/100MB.bin", "file_size": "100MB"},
+               "good_1g": {"host": "127.0.0.1", "test_url": f"{base_url}/1000MB.bin", "file_size": "1GB"},
+               "down": {"host": "127.0.0.1", "test_url": "http://127.0.0.1:9/100MB.bin", "file_size": "100MB"}}
+    for fault in ("moved", "loop", "missing", "error", "truncated", "noranges", "slow", "nohead"):
+        catalog[fault] = {"host": "127.0.0.1", "test_url": f"{base_url}/{fault}/100MB.bin", "file_size": "100MB"}
+    return {"servers": catalog}
+
+def run_check_command(args):
+    mock = None
+    if args.mock:
+        mock = MockCatalogServer(("127.0.0.1", 0), args.slow_ms * 1.5).start()
+        servers = mock_catalog(mock.base_url)["servers"]
+        for key, server in servers.items():
+            server.update(key=key, region="mock", provider="mock")
+    elif args.catalog:
+        servers = load_catalog_file(args.catalog)
+    else:
+        servers = builtin_servers(args.zone)
+    entries = list(catalog_entries(servers, tuple(args.sizes)))
+    # 模擬目錄的結果只留在記憶體，不寫入測速時使用的健康狀態檔
+    cache = HealthCache(None if mock is not None else args.health_file)
+    print(f"Checking {len(entries)} test URLs ({args.concurrency} at a time, results kept {format_age(args.ttl)})")
+    print("-" * 80)
+
+    def on_result(result: Dict[str, Any]):
+        print(format_result(result), flush=True)
+
+    try:
+        results = run_doctor(entries, cache, args.ttl, args.concurrency, args.timeout, args.slow_ms,
+                             args.refresh, on_result)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted (checked results saved to {cache.path})" if cache.path else "\nInterrupted")
+        return 1
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    counts = {health: sum(1 for r in results if r["health"] == health) for health in SEVERITY_ORDER}
+    print("-" * 80)
+    print(f"{counts['ok']} ok, {counts['warn']} warnings, {counts['bad']} bad "
+          f"({sum(1 for r in results if r.get('cached'))} from cache)")
+    bad = [r["key"] for r in results if r["health"] == "bad"]
+    if looks_offline([r for r in results if not r.get("cached")]):
+        print("Every probe failed to connect; check this host's network. Results were not cached.")
+    elif bad and cache.path:
+        print(f"Sweeps will skip until re-checked: {', '.join(bad)}")
+    elif bad:
+        print(f"Bad: {', '.join(bad)}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results saved to {args.output}")
+    return 1 if bad else 0
+
+def run_mock_command(args):
+    server = MockCatalogServer((args.host, args.port), args.slow_ms)
+    catalog = mock_catalog(server.base_url)
+    if args.write:
+        with open(args.write, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=2)
+        print(f"Mock catalog written to {args.write}")
+    print(f"Mock catalog server listening on {server.server_address[0]}:{server.server_address[1]} (Ctrl+C to stop)",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Health-check every test file URL in the server catalog")
+    subparsers = parser.add_subparsers(dest="command")
+
+    check_parser = subparsers.add_parser("check", help="HEAD-probe catalog entries concurrently")
+    source = check_parser.add_mutually_exclusive_group()
+    source.add_argument("--zone", choices=["vultr", "linode", "hinet"], help="Only check one provider")
+    source.add_argument("--catalog", metavar="FILE",
+                        help="Check a catalog file ({\"servers\": {...}}, the test plan server format) instead")
+    source.add_argument("--mock", action="store_true",
+                        help="Start a local mock catalog with one entry per failure mode and check it")
+    check_parser.add_argument("--sizes", nargs="+", choices=SIZES, default=list(SIZES),
+                              help="Test file sizes to check (default: both)")
+    check_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                              help=f"Concurrent probes (default: {DEFAULT_CONCURRENCY})")
+    check_parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds (default: 10)")
+    check_parser.add_argument("--slow-ms", type=float, default=DEFAULT_SLOW_MS,
+                              help=f"Warn when the response takes longer than this (default: {DEFAULT_SLOW_MS:.0f})")
+    check_parser.add_argument("--ttl", type=parse_duration, default=DEFAULT_TTL, metavar="AGE",
+                              help="Reuse check results younger than AGE, e.g. 30m, 6h (default: 6h)")
+    check_parser.add_argument("--refresh", action="store_true", help="Ignore cached results and re-check everything")
+    check_parser.add_argument("--health-file", default=DEFAULT_HEALTH_PATH, metavar="FILE",
+                              help=f"Where check results are kept (default: {DEFAULT_HEALTH_PATH})")
+    check_parser.add_argument("--output", help="Save results as JSON")
+
+    mock_parser = subparsers.add_parser("mock", help="Serve the mock catalog for manual testing")
+    mock_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    mock_parser.add_argument("--port", type=int, default=0, help="Port to listen on (default: any free port)")
+    mock_parser.add_argument("--slow-ms", type=float, default=DEFAULT_SLOW_MS * 1.5,
+                             help=f"Delay of the /slow/ entry (default: {DEFAULT_SLOW_MS * 1.5:.0f})")
+    mock_parser.add_argument("--write", metavar="FILE", help="Write the matching catalog file (use with check --catalog)")
+
+    args = parser.parse_args()
+    if args.command == "check":
+        if args.concurrency <= 0:
+            parser.error("--concurrency must be positive")
+        raise SystemExit(run_check_command(args))
+    elif args.command == "mock":
+        run_mock_command(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
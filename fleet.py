@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Fleet Orchestration
+協調器 / 代理程式模式：代理程式以 HTTP/JSON 接收測試計畫，邊測邊以 NDJSON 串流回傳結果；
+協調器依上行鏈路 (uplink) 分組排程，共用上行的節點不會同時測速
+"""
+
+import argparse
+import hmac
+import http.client
+import http.server
+import ipaddress
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from test_plan import KINDS, PlanOutputs, PlanRunner, count_tests, format_result, validate_plan
+from vultr_speedtest import SpeedTestEngine
+
+PROTOCOL_VERSION = 2
+DEFAULT_PORT = 8780
+NDJSON_TYPE = "application/x-ndjson"
+
+class FleetAgent:
+    """在本機執行測試計畫 (test_plan 格式)；同一時間只接受一份計畫"""
+
+    def __init__(self, name: str, uplink: Optional[str] = None, lang: str = "en", token: Optional[str] = None,
+                 engine_factory: Callable[..., SpeedTestEngine] = SpeedTestEngine):
+        self.name = name
+        self.uplink = uplink
+        self.lang = lang
+        self.token = token
+        self.engine_factory = engine_factory
+        self.lock = threading.Lock()
+        self.current_plan: Optional[str] = None
+        self.runner: Optional[PlanRunner] = None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "uplink": self.uplink,
+            "busy": self.current_plan is not None,
+            "plan_id": self.current_plan,
+            "kinds": list(KINDS),
+            "protocol": PROTOCOL_VERSION,
+        }
+
+    def acquire(self, plan_id: str) -> bool:
+        with self.lock:
+            if self.current_plan is not None:
+                return False
+            self.current_plan = plan_id
+            return True
+
+    def release(self):
+        with self.lock:
+            self.current_plan = None
+            self.runner = None
+
+    def cancel(self, reason: str = "cancelled"):
+        runner = self.runner
+        if runner is not None:
+            runner.cancel(reason)
+
+    def run_plan(self, plan: Dict[str, Any], emit: Callable[[Dict[str, Any]], None]):
+        """執行已驗證的計畫，每完成一項就呼叫 emit；emit 拋出例外 (協調器斷線) 時中止其餘測試"""
+        index = 0
+
+        def on_result(record: Dict[str, Any]):
+            nonlocal index
+            with self.lock:
+                record.update({"agent": self.name, "uplink": self.uplink, "test_index": index})
+                index += 1
+            try:
+                emit(record)
+            except OSError:
+                runner.cancel("coordinator disconnected")
+                raise
+
+        # 計畫中的輸出由協調器寫入，代理程式只串流結果
+        runner = PlanRunner(plan, self.lang, show_progress=False, engine_factory=self.engine_factory,
+                            on_result=on_result, write_outputs=False)
+        self.runner = runner
+        started = time.time()
+        results = runner.run()
+        emit({"event": "plan_end", "agent": self.name, "plan_id": plan["id"],
+              "completed": len(results), "total": count_tests(plan), "elapsed_seconds": time.time() - started})
+
+class AgentRequestHandler(http.server.BaseHTTPRequestHandler):
+    """GET /info 回傳代理程式狀態；POST /run 執行計畫並以 NDJSON 串流回傳結果"""
+
+    server_version = "FleetAgent/1.0"
+
+    @property
+    def agent(self) -> FleetAgent:
+        return self.server.agent
+
+    def send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorized(self) -> bool:
+        if not self.agent.token:
+            return True
+        # 以固定時間比較，避免由回應時間逐字猜出權杖
+        expected = f"Bearer {self.agent.token}".encode("utf-8")
+        if hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), expected):
+            return True
+        self.send_json(401, {"error": "unauthorized"})
+        return False
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if self.path == "/info":
+            self.send_json(200, self.agent.info())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path == "/cancel":
+            self.agent.cancel("coordinator")
+            self.send_json(200, self.agent.info())
+            return
+        if self.path != "/run":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            plan = validate_plan(json.loads(self.rfile.read(length).decode("utf-8")))
+        except (ValueError, UnicodeDecodeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        if not self.agent.acquire(plan["id"]):
+            self.send_json(409, {"error": "busy", "plan_id": self.agent.current_plan})
+            return
+
+        # 沒有 Content-Length，以關閉連線表示串流結束
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", NDJSON_TYPE)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.flush()
+
+            def emit(record: Dict[str, Any]):
+                self.wfile.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+            self.agent.run_plan(plan, emit)
+        except (BrokenPipeError, ConnectionResetError):
+            self.log_message("coordinator disconnected, plan %s stopped", plan["id"])
+        finally:
+            self.agent.release()
+
+class AgentServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], agent: FleetAgent):
+        if ":" in address[0]:
+            self.address_family = socket.AF_INET6
+        super().__init__(address, AgentRequestHandler)
+        self.agent = agent
+
+def parse_listen(value: str) -> Tuple[str, int]:
+    """解析 "HOST:PORT" 或 "PORT" (只給連接埠時只監聽本機)"""
+    host, _, port = value.rpartition(":")
+    try:
+        return host.strip("[]") or "127.0.0.1", int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid listen address '{value}', expected HOST:PORT")
+
+class AgentEndpoint:
+    """協調器端看到的一個代理程式"""
+
+    def __init__(self, url: str, name: Optional[str] = None, uplink: Optional[str] = None):
+        if "://" not in url:
+            url = f"http://{url}"
+        parsed = urlparse(url)
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or DEFAULT_PORT
+        self.name = name or f"{self.host}:{self.port}"
+        self.uplink = uplink
+        self.error: Optional[str] = None
+
+    @property
+    def uplink_group(self) -> str:
+        # 沒有指定上行鏈路的節點自成一組，可與其他節點同時執行
+        return self.uplink or f"node:{self.name}"
+
+    def connect(self, timeout: float) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+def load_agents(path: Optional[str], urls: List[str]) -> List[AgentEndpoint]:
+    """由 JSON 檔 ([{"url": ..., "name": ..., "uplink": ...}]) 與 --agent 參數建立代理程式列表"""
+    agents = []
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for entry in json.load(f):
+                if isinstance(entry, str):
+                    entry = {"url": entry}
+                agents.append(AgentEndpoint(entry["url"], entry.get("name"), entry.get("uplink")))
+    agents.extend(AgentEndpoint(url) for url in urls)
+    return agents
+
+def schedule(agents: List[AgentEndpoint]) -> List[List[AgentEndpoint]]:
+    """依上行鏈路分組：組內依序執行，不同組可同時執行"""
+    groups: Dict[str, List[AgentEndpoint]] = {}
+    for agent in agents:
+        groups.setdefault(agent.uplink_group, []).append(agent)
+    return list(groups.values())
+
+class Coordinator:
+    """把同一份計畫派送給所有代理程式，並集中收集串流回來的結果"""
+
+    def __init__(self, agents: List[AgentEndpoint], plan: Dict[str, Any], token: Optional[str] = None,
+                 timeout: float = 600.0, parallel: int = 0,
+                 on_record: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """plan 為原始的計畫 JSON；先在本機驗證，各代理程式收到後會再對照自己的機房目錄驗證一次"""
+        self.agents = agents
+        validated = validate_plan(plan)
+        self.plan = dict(plan, id=validated["id"])
+        self.total = count_tests(validated)
+        self.token = token
+        self.timeout = timeout
+        self.parallel = parallel
+        self.on_record = on_record
+        self.records: List[Dict[str, Any]] = []
+        self.runs: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def fetch_info(self, agent: AgentEndpoint) -> Dict[str, Any]:
+        conn = agent.connect(10.0)
+        try:
+            conn.request("GET", "/info", headers=self.headers())
+            response = conn.getresponse()
+            body = json.loads(response.read().decode("utf-8"))
+            if response.status != 200:
+                raise RuntimeError(body.get("error", f"HTTP {response.status}"))
+            return body
+        finally:
+            conn.close()
+
+    def discover(self):
+        """向代理程式查詢名稱與上行鏈路 (清單中已指定的值優先)"""
+        for agent in self.agents:
+            try:
+                info = self.fetch_info(agent)
+            except (OSError, ValueError, RuntimeError) as e:
+                agent.error = str(e)
+                continue
+            if agent.name == f"{agent.host}:{agent.port}":
+                agent.name = info.get("name") or agent.name
+            agent.uplink = agent.uplink or info.get("uplink")
+
+    def collect(self, record: Dict[str, Any]):
+        with self.lock:
+            self.records.append(record)
+        if self.on_record is not None:
+            self.on_record(record)
+
+    def run_agent(self, agent: AgentEndpoint):
+        """派送計畫並逐行讀取結果"""
+        run = {"agent": agent.name, "uplink": agent.uplink, "started": time.time(),
+               "completed": 0, "total": self.total, "error": None}
+        conn = agent.connect(self.timeout)
+        try:
+            conn.request("POST", "/run", body=json.dumps(self.plan).encode("utf-8"), headers=self.headers())
+            response = conn.getresponse()
+            if response.status != 200:
+                body = response.read().decode("utf-8", "replace")
+                try:
+                    run["error"] = json.loads(body).get("error", body)
+                except ValueError:
+                    run["error"] = body or f"HTTP {response.status}"
+            else:
+                ended = False
+                for line in iter(response.readline, b""):
+                    if not line.strip():
+                        continue
+                    record = json.loads(line.decode("utf-8"))
+                    if record.get("event") == "plan_end":
+                        ended = True
+                        continue
+                    run["completed"] += 1
+                    self.collect(record)
+                    if self.stop_event.is_set():
+                        break
+                if not ended and not self.stop_event.is_set():
+                    run["error"] = "stream ended before plan_end"
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            run["error"] = str(e) or e.__class__.__name__
+        finally:
+            conn.close()
+            run["finished"] = time.time()
+            with self.lock:
+                self.runs.append(run)
+        if run["error"]:
+            self.collect({"agent": agent.name, "uplink": agent.uplink, "plan_id": self.plan["id"],
+                          "success": False, "error": run["error"]})
+
+    def run_group(self, group: List[AgentEndpoint], slots: Optional[threading.Semaphore]):
+        for agent in group:
+            if self.stop_event.is_set():
+                return
+            if agent.error:
+                self.collect({"agent": agent.name, "uplink": agent.uplink, "plan_id": self.plan["id"],
+                              "success": False, "error": agent.error})
+                continue
+            if slots is not None:
+                with slots:
+                    self.run_agent(agent)
+            else:
+                self.run_agent(agent)
+
+    def run(self) -> List[Dict[str, Any]]:
+        self.discover()
+        return self.dispatch()
+
+    def dispatch(self) -> List[Dict[str, Any]]:
+        """每個上行鏈路分組一個執行緒；--parallel 限制同時執行的分組數"""
+        groups = schedule(self.agents)
+        slots = threading.Semaphore(self.parallel) if self.parallel > 0 else None
+        threads = [threading.Thread(target=self.run_group, args=(group, slots), daemon=True) for group in groups]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.2)
+        except KeyboardInterrupt:
+            self.stop_event.set()
+            self.cancel_all()
+            raise
+        return self.records
+
+    def cancel_all(self):
+        """通知所有代理程式中止目前的計畫"""
+        for agent in self.agents:
+            try:
+                conn = agent.connect(5.0)
+                conn.request("POST", "/cancel", headers=self.headers())
+                conn.getresponse().read()
+                conn.close()
+            except (OSError, http.client.HTTPException):
+                pass
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def run_agent_command(args):
+    # 代理程式會對任意伺服器執行收到的計畫，對外開放時必須設定權杖
+    if not args.token and not is_loopback(args.listen[0]):
+        sys.exit(f"refusing to listen on {args.listen[0]} without --token (only loopback is allowed without one)")
+    agent = FleetAgent(args.name, args.uplink, args.lang, args.token)
+    server = AgentServer(args.listen, agent)
+    print(f"Fleet agent '{agent.name}' (uplink {agent.uplink or '-'}) listening on "
+          f"{args.listen[0]}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nAgent stopped")
+    finally:
+        server.server_close()
+
+def run_coordinator_command(args):
+    agents = load_agents(args.agents, args.agent or [])
+    if not agents:
+        sys.exit("no agents given (use --agent URL or --agents FILE)")
+    try:
+        with open(args.plan, encoding="utf-8") as f:
+            raw_plan = json.load(f)
+        plan = validate_plan(raw_plan)
+    except (OSError, ValueError) as e:
+        sys.exit(f"invalid plan {args.plan}: {e}")
+
+    # 計畫中的 outputs 與 --output 都在協調器端寫入
+    outputs = PlanOutputs(plan["outputs"] + ([{"type": "ndjson", "path": args.output}] if args.output else []))
+    outputs.open()
+
+    def on_record(record: Dict[str, Any]):
+        # 收到就寫入，協調器中斷時已收到的結果不會遺失
+        outputs.write(record)
+        print(format_result(record), flush=True)
+
+    coordinator = Coordinator(agents, raw_plan, args.token, args.timeout, args.parallel, on_record)
+    try:
+        coordinator.discover()
+        print(f"Plan '{coordinator.plan['id']}': {coordinator.total} tests x {len(agents)} agents "
+              f"in {len(schedule(agents))} uplink groups", flush=True)
+        coordinator.dispatch()
+    except KeyboardInterrupt:
+        print("\nInterrupted, agents asked to cancel")
+    finally:
+        outputs.close()
+
+    print("\n" + "=" * 60)
+    for run in sorted(coordinator.runs, key=lambda r: r["started"]):
+        status = run["error"] or "ok"
+        print(f"{run['agent']:<20} {run['uplink'] or '-':<12} {run['completed']}/{run['total']} "
+              f"{run['finished'] - run['started']:6.1f}s  {status}")
+    if outputs.paths:
+        print(f"\nResults written to {', '.join(outputs.paths)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run speed tests across many nodes (coordinator / agent)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    agent_parser = subparsers.add_parser("agent", help="Serve test plans over HTTP/JSON on this node")
+    agent_parser.add_argument("--listen", type=parse_listen, default=("127.0.0.1", DEFAULT_PORT), metavar="HOST:PORT",
+                              help=f"Address to listen on (default: 127.0.0.1:{DEFAULT_PORT}); "
+                                   "non-loopback addresses require --token")
+    agent_parser.add_argument("--name", default=socket.gethostname(), help="Agent name (default: hostname)")
+    agent_parser.add_argument("--uplink", help="Uplink group; agents in the same group never test at the same time")
+    agent_parser.add_argument("--token", help="Shared secret required in the Authorization header")
+    agent_parser.add_argument("--lang", choices=["en", "zh", "ja"], default="en", help="Language of error messages")
+
+    run_parser = subparsers.add_parser("run", help="Send a plan to agents and collect their results")
+    run_parser.add_argument("--plan", required=True, help="Test plan JSON file")
+    run_parser.add_argument("--agent", action="append", metavar="URL", help="Agent URL (repeatable)")
+    run_parser.add_argument("--agents", metavar="FILE",
+                            help='JSON list of agents: [{"url": ..., "name": ..., "uplink": ...}]')
+    run_parser.add_argument("--output", help="Append results as NDJSON while they stream in")
+    run_parser.add_argument("--token", help="Shared secret sent to agents")
+    run_parser.add_argument("--timeout", type=float, default=600.0,
+                            help="Seconds to wait for the next result from an agent (default: 600)")
+    run_parser.add_argument("--parallel", type=int, default=0,
+                            help="Maximum uplink groups testing at once (default: no limit)")
+
+    args = parser.parse_args()
+    if args.command == "agent":
+        run_agent_command(args)
+    elif args.command == "run":
+        run_coordinator_command(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Geo helpers
+機房座標、大圓距離與光纖中的最小 RTT，用於距離篩選與 RTT 異常標記
+"""
+
+import math
+from typing import Any, Dict, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+# 光在光纖中的速度約為真空中的 2/3
+FIBER_KM_PER_MS = 200.0
+
+# 實測 RTT 超過 最小 RTT x 倍數 + 容許值 時視為路由異常
+# (一般網路路徑約為大圓距離的 1.5-2 倍，另有排隊與處理延遲)
+ANOMALY_FACTOR = 3.0
+ANOMALY_SLACK_MS = 15.0
+
+def parse_origin(value: str) -> Tuple[float, float]:
+    """解析 "LAT,LON" 格式的起點座標"""
+    try:
+        lat, lon = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError(f"invalid origin '{value}', expected LAT,LON")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"origin out of range: {value}")
+    return lat, lon
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """兩點間的大圓距離 (公里)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def min_rtt_ms(distance_km: float) -> float:
+    """沿大圓走光纖來回一趟的理論最小 RTT"""
+    return 2 * distance_km / FIBER_KM_PER_MS
+
+def locate(site: Dict[str, Any], origin: Optional[Tuple[float, float]]) -> Optional[Dict[str, float]]:
+    """計算起點到機房的距離與最小 RTT；沒有座標或起點時回傳 None"""
+    if origin is None or site.get("lat") is None or site.get("lon") is None:
+        return None
+    distance = haversine_km(origin[0], origin[1], site["lat"], site["lon"])
+    return {"distance_km": round(distance, 1), "min_rtt_ms": round(min_rtt_ms(distance), 2)}
+
+def rtt_anomaly(measured_ms: Optional[float], minimum_ms: float,
+                factor: float = ANOMALY_FACTOR, slack_ms: float = ANOMALY_SLACK_MS) -> Dict[str, Any]:
+    """比較實測 RTT 與物理下限
+
+    status: "ok"、"slow_path" (遠高於下限，可能繞路) 或
+    "below_minimum" (低於光速下限，座標或 anycast 有問題)
+    """
+    if measured_ms is None or measured_ms <= 0:
+        return {"rtt_stretch": None, "rtt_anomaly": None}
+    stretch = measured_ms / minimum_ms if minimum_ms > 0 else None
+    if measured_ms > minimum_ms * factor + slack_ms:
+        status = "slow_path"
+    elif measured_ms < minimum_ms * 0.9:
+        status = "below_minimum"
+    else:
+        status = "ok"
+    return {"rtt_stretch": round(stretch, 2) if stretch is not None else None, "rtt_anomaly": status}
+
+def within_distance(site: Dict[str, Any], origin: Optional[Tuple[float, float]], max_distance_km: float) -> bool:
+    """距離篩選；沒有座標的站點 (例如 anycast CDN) 一律保留"""
+    location = locate(site, origin)
+    return location is None or location["distance_km"] <= max_distance_km
@@ -9,13 +9,22 @@ import os
 import time
 import json
 import argparse
+import select
+import socket
+import threading
+import urllib.request
 import datetime as dt
+from urllib.parse import urlparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Any
 from vultr_speedtest import (
-    VULTR_SERVERS, HINET_SERVERS, LINODE_SERVERS, test_single_server,
-    test_multiple_servers, get_server_by_key, get_server_by_key_with_zone, DEFAULT_TEST_SET,
-    get_server_name
+    VULTR_SERVERS, HINET_SERVERS, LINODE_SERVERS, get_server_by_key_with_zone, DEFAULT_TEST_SET,
+    get_server_name, SpeedTestEngine, SpeedTestEvent, SpeedTestResult, CancelToken, SpeedTest, get_test_url
 )
+from result_cache import DEFAULT_CACHE_PATH, ResultCache, format_age, parse_duration
+from test_plan import PlanError, PlanRunner, count_tests, describe_plan, format_result, load_plan, succeeded
+from tracing import TRACE_FORMATS, export_tracing, get_tracer, start_tracing
 
 # 多語言支持
 LANGUAGES = {
@@ -31,8 +40,10 @@ LANGUAGES = {
             "specific_server": "4. Select Specific Server",
             "full_test": "5. Full Test (All servers)",
             "custom_test": "6. Custom Test Combination",
+            "refresh_cache": "7. Refresh Session Cache (DNS / latency / file size)",
+            "run_plan": "8. Run Test Plan File (JSON)",
             "exit": "0. Exit",
-            "choose": "Please select (0-6): "
+            "choose": "Please select (0-8): "
         },
         "invalid_choice": "Invalid choice, please try again",
         "invalid_number": "Please enter a valid number",
@@ -127,7 +138,32 @@ LANGUAGES = {
         },
         "quick_test": {
             "running": "Running quick test (recommended servers)..."
-        }
+        },
+        "background": {
+            "commands": "Commands: [Enter] refresh status | s = skip current server | c = cancel remaining | a <codes> = queue more servers",
+            "status": "Status: {}/{} done | current: {}",
+            "idle": "idle",
+            "skipping": "Skipping {}...",
+            "cancelling": "Cancelling remaining tests, completed results are kept",
+            "queued": "Queued: {}",
+            "skipped": "skipped",
+            "unknown_command": "Unknown command"
+        },
+        "cache": {
+            "refreshing": "Refreshing session cache for {} servers...",
+            "done": "Cache refreshed: {} addresses, {} latencies, {} file sizes (TTL {:.0f}s)",
+            "ago": "{}s ago",
+            "cached_ping": "cached",
+            "cached_result": "cached result, {}"
+        },
+        "plan": {
+            "enter_path": "Test plan file: ",
+            "invalid": "❌ Invalid test plan:",
+            "running": "Running plan '{}' ({} tests)...",
+            "summary": "Plan finished: {}/{} tests succeeded, {} skipped"
+        },
+        "trace_saved_to": "🧭 Trace saved to",
+        "client_limited": "⚠️  Client-limited (CPU saturated, exclude from capacity reports):"
     },
     "zh": {
         "title": "🌐 全球網路速度測試工具",
@@ -141,8 +177,10 @@ LANGUAGES = {
             "specific_server": "4. 選擇特定機房",
             "full_test": "5. 完整測試 (所有機房)",
             "custom_test": "6. 自訂測試組合",
+            "refresh_cache": "7. 更新工作階段快取 (DNS / 延遲 / 檔案大小)",
+            "run_plan": "8. 執行測試計畫檔 (JSON)",
             "exit": "0. 退出",
-            "choose": "請選擇 (0-6): "
+            "choose": "請選擇 (0-8): "
         },
         "invalid_choice": "無效的選擇，請重新輸入",
         "invalid_number": "請輸入有效的數字",
@@ -237,7 +275,32 @@ LANGUAGES = {
         },
         "quick_test": {
             "running": "執行快速測試 (推薦機房)..."
-        }
+        },
+        "background": {
+            "commands": "指令: [Enter] 更新狀態 | s = 跳過目前機房 | c = 取消剩餘測試 | a <代碼> = 加入更多機房",
+            "status": "狀態: 已完成 {}/{} | 目前: {}",
+            "idle": "閒置",
+            "skipping": "正在跳過 {}...",
+            "cancelling": "正在取消剩餘測試，已完成的結果會保留",
+            "queued": "已加入: {}",
+            "skipped": "已跳過",
+            "unknown_command": "未知的指令"
+        },
+        "cache": {
+            "refreshing": "正在更新 {} 個機房的工作階段快取...",
+            "done": "快取已更新: {} 個位址、{} 筆延遲、{} 個檔案大小 (TTL {:.0f} 秒)",
+            "ago": "{} 秒前",
+            "cached_ping": "快取",
+            "cached_result": "沿用快取結果，{}"
+        },
+        "plan": {
+            "enter_path": "測試計畫檔: ",
+            "invalid": "❌ 測試計畫不合法:",
+            "running": "執行計畫 '{}' ({} 項測試)...",
+            "summary": "計畫完成: {}/{} 項測試成功，{} 項略過"
+        },
+        "trace_saved_to": "🧭 追蹤記錄已儲存到",
+        "client_limited": "⚠️  受限於用戶端 CPU (請勿列入容量報表):"
     },
     "ja": {
         "title": "🌐 グローバルネットワーク速度テストツール",
@@ -251,8 +314,10 @@ LANGUAGES = {
             "specific_server": "4. 特定サーバー選択",
             "full_test": "5. フルテスト（全サーバー）",
             "custom_test": "6. カスタムテスト組み合わせ",
+            "refresh_cache": "7. セッションキャッシュを更新 (DNS / 遅延 / ファイルサイズ)",
+            "run_plan": "8. テスト計画ファイルを実行 (JSON)",
             "exit": "0. 終了",
-            "choose": "選択してください (0-6): "
+            "choose": "選択してください (0-8): "
         },
         "invalid_choice": "無効な選択です。再入力してください",
         "invalid_number": "有効な数字を入力してください",
@@ -347,7 +412,32 @@ LANGUAGES = {
         },
         "quick_test": {
             "running": "クイックテスト（推奨サーバー）を実行中..."
-        }
+        },
+        "background": {
+            "commands": "コマンド: [Enter] 状態更新 | s = 現在のサーバーをスキップ | c = 残りをキャンセル | a <コード> = サーバーを追加",
+            "status": "状態: 完了 {}/{} | 現在: {}",
+            "idle": "待機中",
+            "skipping": "{} をスキップ中...",
+            "cancelling": "残りのテストをキャンセルしています。完了した結果は保持されます",
+            "queued": "追加しました: {}",
+            "skipped": "スキップ",
+            "unknown_command": "不明なコマンド"
+        },
+        "cache": {
+            "refreshing": "{} 台のサーバーのセッションキャッシュを更新中...",
+            "done": "キャッシュ更新完了: アドレス {} 件、遅延 {} 件、ファイルサイズ {} 件 (TTL {:.0f} 秒)",
+            "ago": "{} 秒前",
+            "cached_ping": "キャッシュ",
+            "cached_result": "キャッシュ結果、{}"
+        },
+        "plan": {
+            "enter_path": "テスト計画ファイル: ",
+            "invalid": "❌ テスト計画が不正です:",
+            "running": "計画 '{}' を実行中 ({} テスト)...",
+            "summary": "計画完了: {}/{} テスト成功、{} 件スキップ"
+        },
+        "trace_saved_to": "🧭 トレースを保存しました",
+        "client_limited": "⚠️  クライアント CPU 律速 (容量レポートから除外):"
     }
 }
 
@@ -361,10 +451,217 @@ def get_text(key: str, lang: str = "en") -> str:
             break
     return result
 
+class BackgroundRunner:
+    """在背景執行緒依序執行測試佇列，可跳過目前測試、取消剩餘測試或追加機房"""
+
+    def __init__(self, engine: SpeedTestEngine):
+        self.engine = engine
+        self.pending = deque()
+        self.results = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.current_key = None
+        self.current_token = None
+        self.progress = None
+        engine.subscribe(self.on_event)
+
+    def on_event(self, event: SpeedTestEvent):
+        """只記錄最新進度，由前景的狀態列負責顯示"""
+        if event.kind == SpeedTestEvent.PROGRESS:
+            self.progress = event.data
+        elif event.kind == SpeedTestEvent.PHASE_START and event.data["phase"] == "server":
+            self.progress = None
+
+    def enqueue(self, server_keys: List[str]):
+        # 與 worker 結束共用同一把鎖：執行緒仍在時由它接手新項目 (取消後也一樣)，
+        # 已結束 (thread 為 None) 時才啟動新的執行緒
+        with self.lock:
+            self.pending.extend(server_keys)
+            self.stop_event.clear()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, daemon=True)
+                self.thread.start()
+
+    def worker(self):
+        try:
+            while True:
+                with self.lock:
+                    if self.stop_event.is_set() or not self.pending:
+                        self.current_key = None
+                        self.thread = None
+                        return
+                    key = self.pending.popleft()
+                    self.current_key = key
+                    self.current_token = CancelToken()
+                try:
+                    result = self.engine.run_server(key, self.current_token)
+                except Exception as e:
+                    # 例如事件處理器寫入狀態檔失敗：記為該機房的錯誤，繼續執行佇列
+                    result = SpeedTestResult(server_key=key, server_name=key,
+                                             error=f"{e.__class__.__name__}: {e}")
+                with self.lock:
+                    self.results.append(result)
+                    self.current_key = None
+                    has_more = bool(self.pending)
+                # 測試間隔，可被取消打斷
+                if has_more and self.engine.cooldown > 0:
+                    with get_tracer().span("cooldown", seconds=self.engine.cooldown):
+                        self.stop_event.wait(self.engine.cooldown)
+        finally:
+            # 非預期地結束時也要清除，否則之後的 enqueue 不會再啟動執行緒
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.current_key = None
+                    self.thread = None
+
+    def skip_current(self) -> Optional[str]:
+        with self.lock:
+            key, token = self.current_key, self.current_token
+        if key is not None and token is not None:
+            token.cancel("skipped")
+        return key
+
+    def cancel_all(self):
+        with self.lock:
+            self.pending.clear()
+        self.stop_event.set()
+        self.skip_current()
+
+    def is_running(self) -> bool:
+        thread = self.thread
+        return thread is not None and thread.is_alive()
+
+    def wait(self, timeout: Optional[float] = None):
+        # worker 結束時會把 thread 設為 None，先取得參照再等待
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "completed": len(self.results),
+                "total": len(self.results) + len(self.pending) + (1 if self.current_key else 0),
+                "current": self.current_key,
+                "progress": self.progress if self.current_key else None
+            }
+
+class SessionCache:
+    """工作階段內的快取：DNS 解析結果、延遲與 HEAD 取得的檔案大小，超過 TTL 即失效"""
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[Any, tuple]] = {"dns": {}, "ping": {}, "size": {}}
+
+    def get(self, kind: str, key: Any) -> Any:
+        with self.lock:
+            entry = self.entries[kind].get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[kind][key]
+                return None
+            return value
+
+    def put(self, kind: str, key: Any, value: Any):
+        with self.lock:
+            self.entries[kind][key] = (value, time.monotonic())
+
+    def age(self, kind: str, key: Any) -> Optional[float]:
+        """快取項目的存在時間 (秒)；沒有或已過期時回傳 None"""
+        if self.get(kind, key) is None:
+            return None
+        with self.lock:
+            return time.monotonic() - self.entries[kind][key][1]
+
+    def count(self, kind: str) -> int:
+        with self.lock:
+            return len(self.entries[kind])
+
+    def clear(self):
+        with self.lock:
+            for entries in self.entries.values():
+                entries.clear()
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """與 socket.getaddrinfo 介面相同，結果依 TTL 快取"""
+        key = (host, port, family, type, proto, flags)
+        infos = self.get("dns", key)
+        if infos is None:
+            infos = socket.getaddrinfo(host, port, family, type, proto, flags)
+            self.put("dns", key, infos)
+        return infos
+
+    def address(self, host: str) -> Optional[str]:
+        """已快取的第一個 IP 位址 (不會觸發解析)"""
+        with self.lock:
+            keys = [key for key in self.entries["dns"] if key[0] == host]
+        for key in keys:
+            infos = self.get("dns", key)
+            if infos:
+                return infos[0][4][0]
+        return None
+
+    def probe_size(self, url: str, timeout: float = 10.0) -> Optional[int]:
+        """以 HEAD 請求取得測試檔案大小"""
+        size = self.get("size", url)
+        if size is None:
+            request = urllib.request.Request(url, method="HEAD")
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                length = response.headers.get("Content-Length")
+            if length is None:
+                return None
+            size = int(length)
+            self.put("size", url, size)
+        return size
+
+class CachedSpeedTestEngine(SpeedTestEngine):
+    """使用工作階段快取的測速引擎：沿用已解析的位址與延遲，並記錄檔案大小"""
+
+    def __init__(self, cache: SessionCache, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.ping_cached = False
+        self.subscribe(self.remember_size)
+
+    def create_speed_test(self) -> SpeedTest:
+        # 沿用基底類別的設定 (含 recorder)，只改用快取的名稱解析
+        speed_test = super().create_speed_test()
+        speed_test.use_resolver(self.cache.getaddrinfo)
+        return speed_test
+
+    def measure_ping(self, server: Dict[str, Any], speed_test: SpeedTest,
+                     cancel_token: Optional[CancelToken] = None) -> float:
+        ping_ms = self.cache.get("ping", server["host"])
+        self.ping_cached = ping_ms is not None
+        if ping_ms is None:
+            ping_ms = speed_test.ping_test(server["host"], cancel_token)
+            if ping_ms > 0:
+                self.cache.put("ping", server["host"], ping_ms)
+        return ping_ms
+
+    def build_result(self, *args, **kwargs):
+        result = super().build_result(*args, **kwargs)
+        if self.ping_cached:
+            result["ping_cached"] = True
+        return result
+
+    def remember_size(self, event: SpeedTestEvent):
+        if event.kind == SpeedTestEvent.PHASE_START and event.data.get("phase") == "transfer":
+            self.cache.put("size", event.data["test_url"], event.data["total_bytes"])
+
 class InteractiveVultrTest:
-    def __init__(self, lang: str = "en", zone: str = None):
+    def __init__(self, lang: str = "en", zone: str = None, cache_ttl: float = 300.0,
+                 max_age: Optional[float] = None, cache_file: str = DEFAULT_CACHE_PATH):
         self.lang = lang
         self.zone = zone
+        self.cache = SessionCache(cache_ttl)
+        # --max-age：跨執行沿用夠新的下載結果 (result_cache.ResultCache)
+        self.max_age = max_age
+        self.result_cache = ResultCache(cache_file) if max_age is not None else None
         self.region_mapping = {
             1: ("asia", get_text("region_menu.asia", lang)),
             2: ("europe", get_text("region_menu.europe", lang)),
@@ -378,6 +675,11 @@ class InteractiveVultrTest:
         """Get localized text for this instance's language"""
         return get_text(key, self.lang)
 
+    def create_engine(self, *args, **kwargs) -> "CachedSpeedTestEngine":
+        engine = CachedSpeedTestEngine(self.cache, *args, **kwargs)
+        engine.result_cache, engine.max_age = self.result_cache, self.max_age
+        return engine
+
     def clear_screen(self):
         """清除螢幕"""
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -397,6 +699,8 @@ class InteractiveVultrTest:
         print(get_text("main_menu.specific_server", self.lang))
         print(get_text("main_menu.full_test", self.lang))
         print(get_text("main_menu.custom_test", self.lang))
+        print(get_text("main_menu.refresh_cache", self.lang))
+        print(get_text("main_menu.run_plan", self.lang))
         print(get_text("main_menu.exit", self.lang))
         print("-" * 60)
 
@@ -445,7 +749,7 @@ class InteractiveVultrTest:
 
         for i, (server_key, server_info) in enumerate(servers.items(), 1):
             server_name = get_server_name(server_info, self.lang)
-            print(f" {i:2}. {server_name} ({server_key})")
+            print(f" {i:2}. {server_name} ({server_key}){self.format_cached(server_info, 'vultr')}")
         print(f" {get_text('region_servers.return', self.lang)}")
         print(f"{get_text('region_servers.test_all', self.lang)}")
 
@@ -460,7 +764,7 @@ class InteractiveVultrTest:
             for server_key, server_info in servers.items():
                 server_name = get_server_name(server_info, self.lang)
                 server_list.append((server_key, server_name))
-                print(f" {len(server_list):2}. {server_name} ({server_key})")
+                print(f" {len(server_list):2}. {server_name} ({server_key}){self.format_cached(server_info, 'linode')}")
 
         # 顯示 Vultr 伺服器
         print(f"\nVULTR:")
@@ -470,12 +774,67 @@ class InteractiveVultrTest:
             for server_key, server_info in servers.items():
                 server_name = get_server_name(server_info, self.lang)
                 server_list.append((server_key, server_name))
-                print(f" {len(server_list):2}. {server_name} ({server_key})")
+                print(f" {len(server_list):2}. {server_name} ({server_key}){self.format_cached(server_info, 'vultr')}")
 
         print(f" {get_text('all_servers.return', self.lang)}")
         print(f"{get_text('all_servers.test_all', self.lang)}")
         return server_list
 
+    def format_cached(self, server: Dict[str, Any], provider: str) -> str:
+        """機房列表旁顯示的快取資訊：延遲、檔案大小、IP 與快取時間"""
+        host = server["host"]
+        parts = []
+        ping_ms = self.cache.get("ping", host)
+        if ping_ms is not None:
+            parts.append(f"{ping_ms:.1f} ms")
+        size = self.cache.get("size", get_test_url(dict(server, provider=provider)))
+        if size is not None:
+            parts.append(f"{size / 1024 / 1024:.0f} MB")
+        address = self.cache.address(host)
+        if address is not None:
+            parts.append(address)
+        if not parts:
+            return ""
+        age = self.cache.age("ping", host)
+        if age is not None:
+            parts.append(get_text('cache.ago', self.lang).format(int(age)))
+        return f" [{', '.join(parts)}]"
+
+    def refresh_cache(self):
+        """重新解析、量測延遲並以 HEAD 取得所有機房的檔案大小"""
+        servers = []
+        for provider, catalog in (("hinet", HINET_SERVERS), ("linode", LINODE_SERVERS), ("vultr", VULTR_SERVERS)):
+            for region_servers in catalog.values():
+                for server in region_servers.values():
+                    servers.append(dict(server, provider=provider))
+        self.cache.clear()
+        print(f"\n{get_text('cache.refreshing', self.lang).format(len(servers))}")
+
+        def probe(server: Dict[str, Any]):
+            url = get_test_url(server)
+            parsed = urlparse(url or f"http://{server['host']}/")
+            try:
+                # 與下載時相同的 (host, port) 鍵值，測試時才能直接沿用
+                self.cache.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80),
+                                       0, socket.SOCK_STREAM)
+            except OSError:
+                return
+            ping_ms = SpeedTest().ping_test(server["host"])
+            if ping_ms > 0:
+                self.cache.put("ping", server["host"], ping_ms)
+            if url:
+                try:
+                    self.cache.probe_size(url)
+                except Exception:
+                    pass
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(probe, servers))
+        print(get_text('cache.done', self.lang).format(
+            self.cache.count("dns"), self.cache.count("ping"),
+            self.cache.count("size"), self.cache.ttl))
+        input(f"\n{get_text('press_enter', self.lang)}")
+
     def get_test_settings(self):
         """獲取測試設定"""
         print(f"\n{get_text('test_settings', self.lang)}")
@@ -509,9 +868,22 @@ class InteractiveVultrTest:
         else:
             print(f"\n{get_text('testing_multiple', self.lang).format(len(server_keys))}")
 
+        engine = self.create_engine(test_size, quick_test, self.lang, self.zone, cooldown)
+        engine.subscribe(self.print_result_event)
+        runner = BackgroundRunner(engine)
+        runner.enqueue(server_keys)
+        print(get_text('background.commands', self.lang))
+
         try:
-            results = test_multiple_servers(server_keys, test_size, cooldown, True, quick_test, self.lang, self.zone)
+            self.monitor_runner(runner)
+        except KeyboardInterrupt:
+            # Ctrl+C 只停止測試，已完成的結果仍然保留
+            print(f"\n\n{get_text('test_interrupted', self.lang)}")
+            runner.cancel_all()
+            runner.wait()
 
+        results = list(runner.results)
+        try:
             # 詢問是否儲存結果
             save_choice = input(f"\n{get_text('save_results', self.lang)}").strip().lower()
             if save_choice in ['y', 'yes']:
@@ -522,22 +894,99 @@ class InteractiveVultrTest:
                 print(get_text('results_saved', self.lang).format(filename))
 
             # 顯示測試摘要
-            successful_tests = [r for r in results if "download_mbps" in r]
+            successful_tests = [r for r in results if r.success]
+            skipped = sum(1 for r in results if r.get("cancelled") or r.partial_reason == "skipped")
             print(f"\n{get_text('test_summary', self.lang)}")
-            print(f"{get_text('successful_tests', self.lang)} {len(successful_tests)}/{len(results)} {get_text('servers', self.lang)}")
+            print(f"{get_text('successful_tests', self.lang)} {len(successful_tests)}/{len(results)} {get_text('servers', self.lang)}"
+                  + (f" ({skipped} {get_text('background.skipped', self.lang)})" if skipped else ""))
 
             if successful_tests:
-                avg_speed = sum(r["download_mbps"] for r in successful_tests) / len(successful_tests)
+                avg_speed = sum(r.download_mbps for r in successful_tests) / len(successful_tests)
                 print(f"{get_text('avg_download_speed', self.lang)} {avg_speed:.1f} Mbps")
 
-                fastest = max(successful_tests, key=lambda x: x["download_mbps"])
-                print(f"{get_text('fastest_server', self.lang)} {fastest['server_name']} ({fastest['download_mbps']:.1f} Mbps)")
+                fastest = max(successful_tests, key=lambda x: x.download_mbps)
+                print(f"{get_text('fastest_server', self.lang)} {fastest.server_name} ({fastest.download_mbps:.1f} Mbps)")
+
+                limited = [r.server_name for r in successful_tests if r.client_limited]
+                if limited:
+                    print(f"{get_text('client_limited', self.lang)} {', '.join(limited)}")
 
         except KeyboardInterrupt:
             print(f"\n\n{get_text('test_interrupted', self.lang)}")
 
         input(f"\n{get_text('press_enter', self.lang)}")
 
+    def print_result_event(self, event: SpeedTestEvent):
+        """背景測試完成一台機房時輸出結果"""
+        if event.kind != SpeedTestEvent.RESULT:
+            return
+        result = event.data["result"]
+        cached = f" ({get_text('cache.cached_ping', self.lang)})" if result.get("ping_cached") else ""
+        if result.get("cached"):
+            cached = f" ({get_text('cache.cached_result', self.lang).format(format_age(result['cached_age_s']))})"
+        if result.success and result.partial:
+            print(f"\r  ⚠️  {result.server_name}: ↓ {result.download_mbps:.1f} Mbps | ping {result.ping_ms:.1f} ms{cached} "
+                  f"({result.downloaded_bytes / 1024 / 1024:.1f}MB, {result.partial_reason})")
+        elif result.success:
+            limited = " (CPU)" if result.client_limited else ""
+            print(f"\r  ✅ {result.server_name}: ↓ {result.download_mbps:.1f} Mbps{limited} | ping {result.ping_ms:.1f} ms{cached}")
+        elif result.get("cancelled"):
+            print(f"\r  ⏭️  {result.server_name}: {get_text('background.skipped', self.lang)}")
+        else:
+            print(f"\r  ❌ {result.server_name}: {result.error}")
+
+    def format_status(self, runner: BackgroundRunner) -> str:
+        """組合狀態列文字"""
+        status = runner.status()
+        current = status["current"] or get_text('background.idle', self.lang)
+        progress = status["progress"]
+        if progress:
+            percent = progress["downloaded_bytes"] / progress["total_bytes"] * 100
+            current += f" {percent:.1f}% | {progress['speed_mbps']:.1f} Mbps"
+        return get_text('background.status', self.lang).format(status["completed"], status["total"], current)
+
+    def handle_runner_command(self, runner: BackgroundRunner, command: str):
+        """處理背景測試期間輸入的指令"""
+        parts = command.split()
+        if not parts:
+            print(self.format_status(runner))
+        elif parts[0] == "s":
+            key = runner.skip_current()
+            if key:
+                print(get_text('background.skipping', self.lang).format(key))
+        elif parts[0] == "c":
+            print(get_text('background.cancelling', self.lang))
+            runner.cancel_all()
+        elif parts[0] == "a" and len(parts) > 1:
+            valid_keys = [key for key in parts[1:] if get_server_by_key_with_zone(key, self.zone) is not None]
+            invalid_keys = [key for key in parts[1:] if key not in valid_keys]
+            if invalid_keys:
+                print(get_text('custom_test.invalid_codes', self.lang).format(invalid_keys))
+            if valid_keys:
+                runner.enqueue(valid_keys)
+                print(get_text('background.queued', self.lang).format(" ".join(valid_keys)))
+        else:
+            print(get_text('background.unknown_command', self.lang))
+
+    def monitor_runner(self, runner: BackgroundRunner):
+        """背景測試執行期間顯示即時狀態並接受指令"""
+        if os.name == 'nt' or not sys.stdin.isatty():
+            # 無法以 select 讀取 stdin 時只顯示狀態，仍可用 Ctrl+C 停止
+            while runner.is_running():
+                print(f"\r{self.format_status(runner)}", end="", flush=True)
+                runner.wait(1.0)
+            print()
+            return
+
+        while runner.is_running():
+            # 每秒更新一次狀態列，有輸入時才讀取指令
+            print(f"\r{self.format_status(runner)}\033[K", end="", flush=True)
+            readable, _, _ = select.select([sys.stdin], [], [], 1.0)
+            if readable:
+                print("\r\033[K", end="")
+                self.handle_runner_command(runner, sys.stdin.readline().strip())
+        print("\r\033[K", end="")
+
     def quick_test(self):
         """快速測試"""
         test_size, quick_test, cooldown = self.get_test_settings()
@@ -694,6 +1143,39 @@ class InteractiveVultrTest:
 
         self.run_tests(server_keys, test_size, quick_test, cooldown)
 
+    def plan_test(self, path: Optional[str] = None):
+        """執行 JSON 測試計畫；下載步驟沿用工作階段快取"""
+        path = path or input(f"\n{get_text('plan.enter_path', self.lang)}").strip()
+        if not path:
+            return
+        try:
+            plan = load_plan(path)
+        except (OSError, PlanError) as e:
+            print(get_text('plan.invalid', self.lang))
+            for error in getattr(e, "errors", [str(e)]):
+                print(f"  - {error}")
+            input(f"\n{get_text('press_enter', self.lang)}")
+            return
+
+        print(f"\n{get_text('plan.running', self.lang).format(plan['id'], count_tests(plan))}")
+        print("\n".join(describe_plan(plan)[1:]))
+
+        def on_result(record: Dict[str, Any]):
+            # 下載結果由 print_result_event 顯示
+            if record.get("kind") != "download" or record.get("skipped"):
+                print(f"  {format_result(record)}", flush=True)
+
+        runner = PlanRunner(plan, self.lang, False, self.create_engine, listeners=[self.print_result_event],
+                            on_result=on_result)
+        results = runner.run()
+        if runner.interrupted:
+            print(f"\n\n{get_text('test_interrupted', self.lang)}")
+        skipped = sum(1 for r in results if r.get("skipped"))
+        print(f"\n{get_text('plan.summary', self.lang).format(sum(1 for r in results if succeeded(r)), count_tests(plan), skipped)}")
+        for output in plan["outputs"]:
+            print(get_text('results_saved', self.lang).format(output["path"]))
+        input(f"\n{get_text('press_enter', self.lang)}")
+
     def run(self):
         """主執行迴圈"""
         print(f"{self.get_text('common.welcome')}")
@@ -702,7 +1184,7 @@ class InteractiveVultrTest:
             while True:
                 self.print_main_menu()
 
-                choice = self.get_user_input(f"{self.get_text('main_menu.choose')}", range(0, 7))
+                choice = self.get_user_input(f"{self.get_text('main_menu.choose')}", range(0, 9))
 
                 if choice == 0:
                     print(f"{self.get_text('common.goodbye')}")
@@ -719,6 +1201,10 @@ class InteractiveVultrTest:
                     self.full_test()
                 elif choice == 6:
                     self.custom_test()
+                elif choice == 7:
+                    self.refresh_cache()
+                elif choice == 8:
+                    self.plan_test()
 
         except KeyboardInterrupt:
             print(f"\n\n{self.get_text('common.interrupted')}")
@@ -729,10 +1215,32 @@ def main():
                         help='Language for display (default: en)')
     parser.add_argument('--zone', choices=['vultr', 'linode', 'hinet'],
                        help='Specify provider zone (vultr/linode/hinet). When server key conflicts, this determines which provider to use.')
+    parser.add_argument('--cache-ttl', type=float, default=300.0,
+                        help='Seconds to reuse resolved addresses, latency and file sizes within a session (default: 300)')
+    parser.add_argument('--max-age', type=parse_duration, metavar='AGE',
+                        help='Reuse download results younger than AGE (e.g. 90s, 15m, 2h) from the result cache '
+                             'across runs instead of re-testing')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_PATH,
+                        help=f'Result cache file used with --max-age (default: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--plan', metavar='FILE',
+                        help='Run this JSON test plan before showing the menu (same as menu option 8)')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Record phase timings of all tests in this session to a trace file')
+    parser.add_argument('--trace-format', choices=TRACE_FORMATS, default='chrome',
+                        help='Trace file format: chrome (Perfetto / chrome://tracing) or otlp (OTLP-JSON) (default: chrome)')
     args = parser.parse_args()
-
-    app = InteractiveVultrTest(lang=args.lang, zone=args.zone)
-    app.run()
+    if args.trace:
+        start_tracing("interactive_vultr_test")
+
+    app = InteractiveVultrTest(lang=args.lang, zone=args.zone, cache_ttl=args.cache_ttl,
+                               max_age=args.max_age, cache_file=args.cache_file)
+    try:
+        if args.plan:
+            app.plan_test(args.plan)
+        app.run()
+    finally:
+        if export_tracing(args.trace, args.trace_format):
+            print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
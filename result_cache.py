@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Result Cache
+以 (伺服器鍵值, 提供商, 測試種類, 大小) 為鍵保存最近一次成功的結果；
+指定 --max-age 時，夠新的結果直接沿用 (標記 "cached": true)，只重測過期的項目
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "global_speedtest", "result_cache.json")
+# 數量上限與保存期限，超過時從最舊的開始淘汰
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_RETENTION = 7 * 86400
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# 與當次執行相關的欄位 (異常偵測的基準比對)，沿用時不應重複出現
+TRANSIENT_FIELDS = ("baseline", "anomalies")
+
+def parse_duration(value: str) -> float:
+    """'90'、'90s'、'15m'、'2h'、'1d' 轉為秒數 (argparse 的 type)"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(value).lower())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value} (use e.g. 90s, 15m, 2h, 1d)")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+
+def format_age(seconds: float) -> str:
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 5400:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds / 3600:.1f}h"
+
+def cache_key(server_key: str, provider: Optional[str], kind: str, size: Optional[str] = None) -> str:
+    return "|".join((server_key, provider or "-", kind, size or "-"))
+
+def reusable(record: Dict[str, Any]) -> bool:
+    """只保存完整量測的成功結果 (中斷、取消與略過的不算)"""
+    if record.get("cached") or record.get("skipped") or record.get("replayed"):
+        return False
+    if not record.get("success", "download_mbps" in record):
+        return False
+    return record.get("partial_reason") in (None, "deadline")
+
+def record_age(record: Dict[str, Any], now: Optional[dt.datetime] = None) -> Optional[float]:
+    try:
+        stamp = dt.datetime.fromisoformat(record["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=dt.timezone.utc)
+    return ((now or dt.datetime.now(dt.timezone.utc)) - stamp).total_seconds()
+
+class ResultCache:
+    """最近結果的快取，存成 JSON (先寫暫存檔再改名)
+
+    每個鍵只保留最新一筆；數量超過 max_entries 或超過 retention 秒的項目會被淘汰。
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 retention: float = DEFAULT_RETENTION):
+        self.path = path
+        self.max_entries = max_entries
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            # 毀損的快取直接捨棄，重新量測即可
+            return
+        if state.get("version") != CACHE_VERSION:
+            return
+        for key, record in state.get("entries", []):
+            self.entries[key] = record
+        self.evict()
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {"version": CACHE_VERSION, "entries": list(self.entries.items())}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def evict(self):
+        """依保存期限與數量上限淘汰 (entries 依寫入順序排列，最舊的在前)"""
+        now = dt.datetime.now(dt.timezone.utc)
+        for key in list(self.entries):
+            age = record_age(self.entries[key], now)
+            if age is None or age > self.retention:
+                del self.entries[key]
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def lookup(self, key: str, max_age: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        """不超過 max_age 秒的結果與其經過秒數；沒有時回傳 None"""
+        with self.lock:
+            record = self.entries.get(key)
+            age = record_age(record) if record is not None else None
+            if age is None or age > max_age or age < 0:
+                return None
+            return dict(record), age
+
+    def fresh(self, key: str, max_age: float) -> Optional[Dict[str, Any]]:
+        """沿用的結果：加上 cached、cached_age_s"""
+        found = self.lookup(key, max_age)
+        if found is None:
+            return None
+        record, age = found
+        record["cached"] = True
+        record["cached_age_s"] = age
+        return record
+
+    def store(self, key: str, record: Dict[str, Any]):
+        if not reusable(record):
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = {name: value for name, value in record.items() if name not in TRANSIENT_FIELDS}
+            self.evict()
+            self.save()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the local result cache used by --max-age")
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_PATH, help=f"Cache file (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--clear", action="store_true", help="Remove all cached results")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache_file)
+    if args.clear:
+        cache.entries.clear()
+        cache.save()
+        print(f"Cleared {args.cache_file}")
+        return
+    print(f"{'key':<48} {'age':>7}  result")
+    print("-" * 80)
+    for key, record in reversed(list(cache.entries.items())):
+        if "download_mbps" in record:
+            summary = f"{record['download_mbps']:.1f} Mbps, ping {record.get('ping_ms', -1):.1f} ms"
+        else:
+            summary = f"{record.get('total_ms', 0):.1f} ms"
+        print(f"{key:<48} {format_age(record_age(record) or 0):>7}  {summary}")
+    print(f"\n{len(cache.entries)} entries (max {cache.max_entries}, kept {format_age(cache.retention)})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+Columnar Result Set
+以欄式 (typed array) 結構載入大量歷史測試結果，並提供分組統計
+"""
+
+import argparse
+import csv
+import datetime as dt
+import json
+import math
+import os
+import random
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+try:
+    # 有 numpy 時使用向量化的分組統計；沒有時退回純 Python 實作
+    import numpy as np
+except ImportError:
+    np = None
+
+NAN = float("nan")
+
+# 數值欄位 (缺少時以 NaN 表示)
+NUMERIC_COLUMNS = ("download_mbps", "steady_mbit_s", "end_to_end_mbit_s", "disk_mbit_s", "ttfb_ms", "setup_ms", "ping_ms", "bufferbloat_ms", "total_ms", "dns_ms", "tcp_ms", "http_ms", "timestamp")
+# 可彙整的指標 (timestamp 只用於 hour 分組，不是量測值)
+METRIC_COLUMNS = tuple(name for name in NUMERIC_COLUMNS if name != "timestamp")
+# 字串欄位 (以整數代碼儲存，字串本身只保存一次)
+KEY_COLUMNS = ("server", "region", "provider", "tool")
+GROUP_BY_CHOICES = KEY_COLUMNS + ("hour",)
+DEFAULT_STATS = ("count", "mean", "p50", "p90", "p99")
+# 矩陣每格最多保留的樣本數 (超過時以 reservoir sampling 估計中位數)
+DEFAULT_RESERVOIR = 1024
+# 熱圖色階 (256 色背景)，由差到好
+HEATMAP_COLORS = (196, 202, 208, 214, 220, 226, 190, 154, 118, 46)
+
+def iter_records(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """逐筆讀取 JSON 陣列或 NDJSON 檔案，不會一次載入整個檔案；"-" 代表從標準輸入讀取 NDJSON"""
+    if path == "-":
+        for line in sys.stdin:
+            if line.strip():
+                yield json.loads(line)
+        return
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        stripped = buffer.lstrip()
+        if not stripped.startswith("["):
+            # NDJSON：一行一筆
+            lines = (buffer + f.readline()).splitlines()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        # JSON 陣列：逐一 raw_decode 陣列元素
+        buffer = stripped[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buffer += more
+                continue
+            yield record
+            buffer = buffer[end:]
+            if not buffer and not eof:
+                more = f.read(chunk_size)
+                eof = not more
+                buffer = more
+
+def parse_timestamp(value: Optional[str]) -> float:
+    """ISO 8601 時間字串轉為 epoch 秒，失敗時回傳 NaN"""
+    if not value:
+        return NAN
+    try:
+        parsed = dt.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return NAN
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt.timezone.utc)
+    return parsed.timestamp()
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """把 vultr_speedtest 與 simple_netcheck 的結果整理成相同欄位"""
+    if "server_key" in record:
+        tool = "speedtest"
+        server = record["server_key"]
+        provider = record.get("provider", "")
+    else:
+        tool = "netcheck" if "total_ms" in record else "unknown"
+        server = record.get("host", "")
+        provider = record.get("provider") or ("vultr" if server.endswith(".vultr.com") else "web")
+    # 測試計畫的 latency 結果沒有下載速度，以 success 欄位判斷
+    success = bool(record.get("success", "download_mbps" in record)) if tool == "speedtest" else bool(record.get("success"))
+    normalized = {
+        "server": server,
+        "region": record.get("region", ""),
+        "provider": provider,
+        "tool": tool,
+        "success": success,
+        # 用戶端 CPU 吃滿時的速度反映的是本機效能，不列入容量統計
+        "client_limited": bool(record.get("client_limited")),
+        "timestamp": parse_timestamp(record.get("timestamp")),
+    }
+    for name in NUMERIC_COLUMNS:
+        if name != "timestamp":
+            value = record.get(name)
+            normalized[name] = float(value) if isinstance(value, (int, float)) else NAN
+    # ping_test 失敗時回傳 -1，不應計入統計
+    if normalized["ping_ms"] < 0:
+        normalized["ping_ms"] = NAN
+    return normalized
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """已排序數列的百分位數 (線性內插，與 numpy 預設相同)"""
+    if not sorted_values:
+        return NAN
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+class KeyInterner:
+    """字串與整數代碼的雙向對照表"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+class ResultSet:
+    """欄式結果集：每個欄位是一個 array，字串欄位以代碼儲存"""
+
+    def __init__(self):
+        self.keys = {name: KeyInterner() for name in KEY_COLUMNS}
+        self.codes = {name: array("I") for name in KEY_COLUMNS}
+        self.numeric = {name: array("d") for name in NUMERIC_COLUMNS}
+        self.success = array("b")
+        self.client_limited = array("b")
+        self.hour = array("b")  # UTC 小時，未知為 -1
+
+    def __len__(self):
+        return len(self.success)
+
+    def append(self, record: Dict[str, Any]):
+        if record.get("cached"):
+            return  # --max-age 沿用的結果是先前量測的副本，不重複計入
+        row = normalize_record(record)
+        for name in KEY_COLUMNS:
+            self.codes[name].append(self.keys[name].code(row[name]))
+        for name in NUMERIC_COLUMNS:
+            self.numeric[name].append(row[name])
+        self.success.append(1 if row["success"] else 0)
+        self.client_limited.append(1 if row["client_limited"] else 0)
+        timestamp = row["timestamp"]
+        self.hour.append(-1 if math.isnan(timestamp) else dt.datetime.fromtimestamp(timestamp, dt.timezone.utc).hour)
+
+    def extend(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self.append(record)
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str]) -> "ResultSet":
+        result_set = cls()
+        for path in paths:
+            result_set.extend(iter_records(path))
+        return result_set
+
+    def nbytes(self) -> int:
+        """欄位資料佔用的位元組數 (不含代碼表)"""
+        columns = list(self.codes.values()) + list(self.numeric.values()) + [self.success, self.client_limited, self.hour]
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def group_codes(self, by: str):
+        """回傳 (每列的分組代碼, 分組名稱列表)"""
+        if by == "hour":
+            return self.hour, [f"{hour:02d}:00" for hour in range(24)]
+        return self.codes[by], self.keys[by].values
+
+    def group_by(self, by: str, metric: str, stats: Sequence[str] = DEFAULT_STATS,
+                 success_only: bool = True, include_client_limited: bool = False) -> Dict[str, Dict[str, float]]:
+        """依 server / region / provider / tool / hour 分組，計算 metric 的統計值
+
+        預設排除標記為 client_limited 的結果。
+        """
+        if by not in GROUP_BY_CHOICES:
+            raise ValueError(f"unknown group-by column: {by}")
+        if metric not in METRIC_COLUMNS:
+            raise ValueError(f"unknown metric column: {metric}")
+        codes, labels = self.group_codes(by)
+        values = self.numeric[metric]
+        if np is not None:
+            groups = self._group_by_numpy(codes, values, len(labels), stats, success_only, include_client_limited)
+        else:
+            groups = self._group_by_python(codes, values, len(labels), stats, success_only, include_client_limited)
+        return {labels[code]: summary for code, summary in groups.items()}
+
+    def _group_by_numpy(self, codes, values, ngroups, stats, success_only, include_client_limited):
+        code_arr = np.frombuffer(codes, dtype=np.int8 if codes.typecode == "b" else np.uint32).astype(np.int64)
+        value_arr = np.frombuffer(values, dtype=np.float64)
+        mask = ~np.isnan(value_arr) & (code_arr >= 0)
+        if success_only:
+            mask &= np.frombuffer(self.success, dtype=np.int8).astype(bool)
+        if not include_client_limited:
+            mask &= ~np.frombuffer(self.client_limited, dtype=np.int8).astype(bool)
+        code_arr, value_arr = code_arr[mask], value_arr[mask]
+        counts = np.bincount(code_arr, minlength=ngroups)
+        sums = np.bincount(code_arr, weights=value_arr, minlength=ngroups)
+        # 依 (代碼, 數值) 排序後，每個分組是一段連續區間
+        order = np.lexsort((value_arr, code_arr))
+        sorted_values = value_arr[order]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        groups = {}
+        for code in np.nonzero(counts)[0]:
+            segment = sorted_values[starts[code]:starts[code] + counts[code]]
+            groups[int(code)] = self._summarize(segment, counts[code], sums[code], stats,
+                                                lambda q: float(np.percentile(segment, q)))
+        return groups
+
+    def _group_by_python(self, codes, values, ngroups, stats, success_only, include_client_limited):
+        buckets: List[List[float]] = [[] for _ in range(ngroups)]
+        success = self.success
+        client_limited = self.client_limited
+        for i, (code, value) in enumerate(zip(codes, values)):
+            if value != value or code < 0 or (success_only and not success[i]):
+                continue
+            if not include_client_limited and client_limited[i]:
+                continue
+            buckets[code].append(value)
+        groups = {}
+        for code, bucket in enumerate(buckets):
+            if bucket:
+                bucket.sort()
+                groups[code] = self._summarize(bucket, len(bucket), sum(bucket), stats,
+                                               lambda q, bucket=bucket: percentile(bucket, q))
+        return groups
+
+    @staticmethod
+    def _summarize(segment, count, total, stats, percentile_of) -> Dict[str, float]:
+        summary = {}
+        for stat in stats:
+            if stat == "count":
+                summary[stat] = int(count)
+            elif stat == "mean":
+                summary[stat] = float(total) / count
+            elif stat == "min":
+                summary[stat] = float(segment[0])
+            elif stat == "max":
+                summary[stat] = float(segment[-1])
+            elif stat.startswith("p"):
+                summary[stat] = percentile_of(float(stat[1:]))
+            else:
+                raise ValueError(f"unknown statistic: {stat}")
+        return summary
+
+class Reservoir:
+    """固定容量的均勻抽樣 (Algorithm R)；樣本數不超過容量時中位數是精確值"""
+
+    __slots__ = ("values", "seen", "capacity")
+
+    def __init__(self, capacity: int = DEFAULT_RESERVOIR):
+        self.values = array("d")
+        self.seen = 0
+        self.capacity = capacity
+
+    def add(self, value: float, rng: random.Random):
+        self.seen += 1
+        if len(self.values) < self.capacity:
+            self.values.append(value)
+        else:
+            slot = rng.randrange(self.seen)
+            if slot < self.capacity:
+                self.values[slot] = value
+
+    def median(self) -> float:
+        return percentile(sorted(self.values), 50)
+
+class ResultMatrix:
+    """來源節點 x 機房的中位數矩陣，逐筆合併任意數量的結果檔
+
+    來源為結果的 agent 欄位 (fleet.py 收集的結果)，沒有時使用檔名。
+    """
+
+    def __init__(self, metric: str = "download_mbps", capacity: int = DEFAULT_RESERVOIR,
+                 include_client_limited: bool = False, seed: int = 0):
+        if metric not in METRIC_COLUMNS:
+            raise ValueError(f"unknown metric column: {metric}")
+        self.metric = metric
+        self.capacity = capacity
+        self.include_client_limited = include_client_limited
+        self.rng = random.Random(seed)
+        self.cells: Dict[Tuple[str, str], Reservoir] = {}
+        self.rows: Dict[str, None] = {}
+        self.columns: Dict[str, None] = {}
+
+    @property
+    def lower_is_better(self) -> bool:
+        return self.metric.endswith("_ms")
+
+    def add(self, source: str, record: Dict[str, Any]):
+        if record.get("cached"):
+            return
+        row = normalize_record(record)
+        value = row[self.metric]
+        if not row["success"] or value != value or (row["client_limited"] and not self.include_client_limited):
+            return
+        source = record.get("agent") or source
+        key = (source, row["server"])
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = Reservoir(self.capacity)
+            self.rows.setdefault(source)
+            self.columns.setdefault(row["server"])
+        cell.add(value, self.rng)
+
+    def add_file(self, path: str):
+        source = "stdin" if path == "-" else os.path.splitext(os.path.basename(path))[0]
+        for record in iter_records(path):
+            self.add(source, record)
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str], metric: str = "download_mbps", **kwargs) -> "ResultMatrix":
+        matrix = cls(metric, **kwargs)
+        for path in paths:
+            matrix.add_file(path)
+        return matrix
+
+    def medians(self) -> Dict[str, Dict[str, float]]:
+        """{來源: {機房: 中位數}}"""
+        table: Dict[str, Dict[str, float]] = {row: {} for row in self.rows}
+        for (row, column), cell in self.cells.items():
+            table[row][column] = cell.median()
+        return table
+
+    def best_sources(self, table: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, Tuple[str, float]]:
+        """每個機房表現最好的來源 (延遲取最小，吞吐量取最大)"""
+        table = table if table is not None else self.medians()
+        sign = 1 if self.lower_is_better else -1
+        best: Dict[str, Tuple[str, float]] = {}
+        for row, cells in table.items():
+            for column, value in cells.items():
+                if column not in best or sign * value < sign * best[column][1]:
+                    best[column] = (row, value)
+        return best
+
+    def write_csv(self, f: TextIO):
+        """每列一個來源，最後兩列為各機房的最佳來源與其數值"""
+        table = self.medians()
+        best = self.best_sources(table)
+        columns = sorted(self.columns)
+        writer = csv.writer(f)
+        writer.writerow(["source"] + columns)
+        for row in sorted(table):
+            writer.writerow([row] + [f"{table[row][c]:.3f}" if c in table[row] else "" for c in columns])
+        writer.writerow(["best_source"] + [best[c][0] for c in columns])
+        writer.writerow(["best_value"] + [f"{best[c][1]:.3f}" for c in columns])
+
+    def render_heatmap(self, color: bool = True, width: int = 9) -> str:
+        """以 ANSI 背景色顯示矩陣；色階以整個矩陣的最小/最大值為範圍，* 標記各機房的最佳來源"""
+        table = self.medians()
+        best = self.best_sources(table)
+        columns = sorted(self.columns)
+        values = [value for cells in table.values() for value in cells.values()]
+        if not values:
+            return "(no data)"
+        low, high = min(values), max(values)
+        row_width = max([len("source")] + [len(row) for row in table])
+        lines = [f"{'source':<{row_width}} " + " ".join(f"{c[:width]:>{width}}" for c in columns)]
+        for row in sorted(table):
+            cells = []
+            for column in columns:
+                if column not in table[row]:
+                    cells.append(" " * width)
+                    continue
+                value = table[row][column]
+                marker = "*" if best[column][0] == row else " "
+                text = f"{value:>{width - 1}.1f}{marker}"
+                if color:
+                    position = (value - low) / (high - low) if high > low else 1.0
+                    if self.lower_is_better:
+                        position = 1.0 - position
+                    shade = HEATMAP_COLORS[min(int(position * len(HEATMAP_COLORS)), len(HEATMAP_COLORS) - 1)]
+                    text = f"\033[30;48;5;{shade}m{text}\033[0m"
+                cells.append(text)
+            lines.append(f"{row:<{row_width}} " + " ".join(cells))
+        lines.append(f"{'best':<{row_width}} " + " ".join(f"{best[c][0][:width]:>{width}}" for c in columns))
+        return "\n".join(lines)
+
+def run_matrix(args):
+    matrix = ResultMatrix.from_files(args.files, args.metric, capacity=args.reservoir,
+                                     include_client_limited=args.include_client_limited)
+    if args.csv:
+        if args.csv == "-":
+            matrix.write_csv(sys.stdout)
+        else:
+            with open(args.csv, "w", encoding="utf-8", newline="") as f:
+                matrix.write_csv(f)
+    if args.json:
+        table = matrix.medians()
+        best = {column: {"source": source, "value": value} for column, (source, value) in matrix.best_sources(table).items()}
+        print(json.dumps({"metric": args.metric, "medians": table, "best": best}, ensure_ascii=False, indent=2))
+    elif args.csv != "-":
+        print(f"{args.metric} median: {len(matrix.rows)} sources x {len(matrix.columns)} servers "
+              f"({'lower' if matrix.lower_is_better else 'higher'} is better, * = best source)")
+        print(matrix.render_heatmap(color=args.color or (not args.no_color and sys.stdout.isatty())))
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate saved speed test / netcheck results")
+    parser.add_argument("files", nargs="+", help="JSON (--output) or NDJSON result files ('-' for NDJSON on stdin)")
+    parser.add_argument("--group-by", choices=GROUP_BY_CHOICES, default="server",
+                        help="Group results by column (default: server)")
+    parser.add_argument("--metric", choices=METRIC_COLUMNS, default="download_mbps",
+                        help="Metric to aggregate (default: download_mbps)")
+    parser.add_argument("--stats", default=",".join(DEFAULT_STATS),
+                        help="Comma separated statistics: count,mean,min,max,pNN (default: count,mean,p50,p90,p99)")
+    parser.add_argument("--include-failed", action="store_true", help="Include failed tests")
+    parser.add_argument("--include-client-limited", action="store_true",
+                        help="Include results flagged client_limited (client CPU saturated)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--matrix", action="store_true",
+                        help="Build a source node x server median matrix (rows from the agent field or file name)")
+    parser.add_argument("--csv", metavar="FILE", help="With --matrix: write the matrix as CSV ('-' for stdout)")
+    parser.add_argument("--reservoir", type=int, default=DEFAULT_RESERVOIR,
+                        help=f"With --matrix: samples kept per cell (default: {DEFAULT_RESERVOIR})")
+    parser.add_argument("--color", action="store_true", help="With --matrix: force ANSI colors")
+    parser.add_argument("--no-color", action="store_true", help="With --matrix: disable ANSI colors")
+    args = parser.parse_args()
+
+    if args.matrix:
+        run_matrix(args)
+        return
+
+    result_set = ResultSet.from_files(args.files)
+    stats = [stat.strip() for stat in args.stats.split(",") if stat.strip()]
+    groups = result_set.group_by(args.group_by, args.metric, stats, not args.include_failed,
+                                 args.include_client_limited)
+
+    if args.json:
+        print(json.dumps(groups, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{len(result_set)} rows, {result_set.nbytes() / 1024:.1f} KB columnar")
+    print(f"{args.group_by:<20} " + " ".join(f"{stat:>10}" for stat in stats))
+    print("-" * (21 + 11 * len(stats)))
+    for label in sorted(groups):
+        summary = groups[label]
+        cells = " ".join(f"{summary[stat]:>10}" if stat == "count" else f"{summary[stat]:>10.1f}" for stat in stats)
+        print(f"{label:<20} {cells}")
+
+if __name__ == "__main__":
+    main()
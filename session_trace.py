@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Session Record / Replay
+記錄下載每次讀取的時間與位元組數、連線各階段與延遲量測，存成精簡的二進位檔；
+重播時把同樣的輸入送回 SpeedTest.download_test 與摘要、評分邏輯 (以虛擬時鐘快速執行，
+或由本機伺服器依記錄的節奏重送)，修改終止條件、評分或排名後可以在相同的輸入上比較
+"""
+
+import argparse
+import collections
+import http.server
+import json
+import os
+import re
+import socketserver
+import struct
+import threading
+import time
+import urllib.error
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from simple_netcheck import calculate_score, print_ranking
+from vultr_speedtest import (CancelToken, SpeedTest, SpeedTestEngine, SpeedTestEvent, get_test_url,
+                             print_summary)
+
+MAGIC = b"GSTR"
+VERSION = 1
+FILE_HEADER = struct.Struct("!4sBxH")
+SESSION_HEADER = struct.Struct("!BII")  # 種類、中繼資料長度、讀取次數
+KIND_DOWNLOAD = 1
+KIND_NETCHECK = 2
+KINDS = {KIND_DOWNLOAD: "download", KIND_NETCHECK: "netcheck"}
+# 與記錄結果比較的欄位
+COMPARE_FIELDS = ("download_mbps", "steady_mbit_s", "downloaded_bytes", "test_duration", "partial_reason")
+
+def encode_varint(value: int, out: bytearray):
+    """LEB128 無號整數 (小於 128 只佔 1 位元組)"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+class TraceWriter:
+    """附加寫入記錄檔；檔案不存在或為空時先寫入檔頭"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sessions = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                read_file_header(f, path)
+        else:
+            with open(path, "wb") as f:
+                f.write(FILE_HEADER.pack(MAGIC, VERSION, 0))
+
+    def write(self, kind: int, meta: Dict[str, Any], reads: List[Tuple[float, int]] = ()):
+        """reads 為 (相對於開始下載的秒數, 位元組數)，以微秒差值與位元組數的 varint 儲存"""
+        body = bytearray()
+        previous_us = 0
+        for offset, size in reads:
+            offset_us = max(previous_us, int(round(offset * 1e6)))
+            encode_varint(offset_us - previous_us, body)
+            encode_varint(size, body)
+            previous_us = offset_us
+        meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with self.lock, open(self.path, "ab") as f:
+            f.write(SESSION_HEADER.pack(kind, len(meta_bytes), len(reads)))
+            f.write(meta_bytes)
+            f.write(body)
+            self.sessions += 1
+
+def read_file_header(f, path: str):
+    header = f.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise ValueError(f"{path}: not a session trace")
+    magic, version, _ = FILE_HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a session trace")
+    if version != VERSION:
+        raise ValueError(f"{path}: unsupported session trace version {version}")
+
+def iter_sessions(path: str) -> Iterator[Dict[str, Any]]:
+    """依序讀出記錄：{"kind", "meta", "reads": [(秒, 位元組數)]}"""
+    with open(path, "rb") as f:
+        read_file_header(f, path)
+        data = f.read()
+    pos = 0
+    while pos + SESSION_HEADER.size <= len(data):
+        kind, meta_length, count = SESSION_HEADER.unpack_from(data, pos)
+        pos += SESSION_HEADER.size
+        meta = json.loads(data[pos:pos + meta_length].decode("utf-8"))
+        pos += meta_length
+        reads = []
+        offset_us = 0
+        for _ in range(count):
+            delta, pos = decode_varint(data, pos)
+            size, pos = decode_varint(data, pos)
+            offset_us += delta
+            reads.append((offset_us / 1e6, size))
+        yield {"kind": KINDS.get(kind, str(kind)), "meta": meta, "reads": reads}
+
+class SessionRecorder:
+    """記錄 SpeedTestEngine 的每個伺服器測試
+
+    同時扮演兩個角色：設為 engine.recorder 後由 download_test 回報每次讀取，
+    訂閱引擎事件後在 RESULT 時把延遲、連線階段與結果連同讀取紀錄寫入檔案。
+    並行測試時各執行緒分開記錄。
+    """
+
+    def __init__(self, writer: TraceWriter, settings: Optional[Dict[str, Any]] = None):
+        self.writer = writer
+        self.settings = settings or {}
+        self.local = threading.local()
+
+    def state(self) -> Dict[str, Any]:
+        if not hasattr(self.local, "state"):
+            self.reset()
+        return self.local.state
+
+    def reset(self):
+        self.local.state = {"ping_ms": None, "response": None, "reads": []}
+
+    def on_response(self, measurement, content_length: Optional[str]):
+        """收到回應標頭時記錄連線各階段 (相對於開始下載的秒數)"""
+        start = measurement.start_time
+        connection = measurement.connection
+        self.state()["response"] = {
+            "start": start,
+            "test_url": measurement.test_url,
+            "content_length": int(content_length) if content_length else None,
+            "headers_s": measurement.headers_at - start,
+            "connected_s": connection["connected_ns"] / 1e9 - start if "connected_ns" in connection else None,
+            "dns_ms": connection.get("dns_ms"),
+            "tcp_connect_ms": connection.get("tcp_connect_ms"),
+            "tls_ms": connection.get("tls_ms"),
+        }
+
+    def on_read(self, now: float, size: int):
+        state = self.state()
+        if state["response"] is not None:
+            state["reads"].append((now - state["response"]["start"], size))
+
+    def __call__(self, event: SpeedTestEvent):
+        if event.kind == SpeedTestEvent.PHASE_START and event.data.get("phase") == "server":
+            self.reset()
+        elif event.kind == SpeedTestEvent.PHASE_END and event.data.get("phase") == "latency":
+            self.state()["ping_ms"] = event.data["ping_ms"]
+        elif event.kind == SpeedTestEvent.RESULT:
+            state = self.state()
+            result = event.data["result"]
+            if result.get("cached"):
+                return  # 沿用快取的結果沒有實際下載，不寫入
+            response = dict(state["response"] or {})
+            response.pop("start", None)
+            meta = {
+                "server_key": result.get("server_key"),
+                "server_name": result.get("server_name"),
+                "host": result.get("server_host"),
+                "region": result.get("region"),
+                "provider": result.get("provider"),
+                "ping_ms": state["ping_ms"],
+                "timestamp": result.get("timestamp"),
+                "settings": self.settings,
+                "response": response or None,
+                "error": result.get("error"),
+                "recorded": {field: result.get(field) for field in COMPARE_FIELDS + ("success",)},
+            }
+            self.writer.write(KIND_DOWNLOAD, meta, state["reads"])
+            self.reset()
+
+def record_netcheck(writer: TraceWriter, site: Dict[str, Any], result: Dict[str, Any]):
+    """simple_netcheck 的單一站點：各階段時間與當時的評分"""
+    meta = {field: result.get(field) for field in ("label", "host", "region", "ip", "success", "error",
+                                                   "dns_ms", "tcp_ms", "http_ms", "total_ms", "score",
+                                                   "timestamp")}
+    meta["labels"] = site.get("labels")
+    writer.write(KIND_NETCHECK, meta)
+
+class VirtualClock:
+    """重播用的時鐘：只在讀取記錄時前進，不實際等待"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, when: float):
+        self.now = max(self.now, when)
+
+class ReplayResponse:
+    """依記錄回傳讀取結果的 HTTP 回應替身"""
+
+    def __init__(self, speed_test: "ReplaySpeedTest", start: float):
+        self.speed_test = speed_test
+        self.start = start
+        response = speed_test.session["meta"]["response"]
+        self.status = 200
+        self.headers = {}
+        if response.get("content_length"):
+            self.headers["Content-Length"] = str(response["content_length"])
+        self.reads = collections.deque(speed_test.session["reads"])
+
+    def read(self, amount: int = -1) -> bytes:
+        if not self.reads:
+            return b""
+        offset, size = self.reads.popleft()
+        self.speed_test.wait_until(self.start + offset)
+        return bytes(size)
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "ReplayResponse":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ReplayOpener:
+    """取代 SpeedTest.opener：填入記錄的連線時間並回傳 ReplayResponse"""
+
+    def __init__(self, speed_test: "ReplaySpeedTest"):
+        self.speed_test = speed_test
+
+    def open(self, request, timeout=None) -> ReplayResponse:
+        speed_test = self.speed_test
+        meta = speed_test.session["meta"]
+        response = meta.get("response")
+        if not response:
+            raise urllib.error.URLError(meta.get("error") or "no response recorded")
+        # download_test 剛以目前時間作為開始時間
+        start = speed_test.clock()
+        timings = speed_test.connection_timings
+        for field in ("dns_ms", "tcp_connect_ms", "tls_ms"):
+            if response.get(field) is not None:
+                timings[field] = response[field]
+        if response.get("connected_s") is not None:
+            timings["connected_ns"] = int((start + response["connected_s"]) * 1e9)
+        speed_test.wait_until(start + response["headers_s"])
+        return ReplayResponse(speed_test, start)
+
+class ReplaySpeedTest(SpeedTest):
+    """以記錄取代網路的 SpeedTest；download_test 的終止條件與統計照常執行
+
+    realtime=False 時使用虛擬時鐘 (瞬間完成)，True 時依記錄的時間實際等待。
+    """
+
+    def __init__(self, session: Dict[str, Any], realtime: bool = False, **kwargs):
+        kwargs["tcp_info"] = False
+        super().__init__(**kwargs)
+        self.session = session
+        self.realtime = realtime
+        if not realtime:
+            self.clock = VirtualClock()
+        self.opener = ReplayOpener(self)
+
+    def wait_until(self, when: float):
+        if self.realtime:
+            delay = when - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            self.clock.advance_to(when)
+
+    def ping_test(self, host: str, cancel_token: Optional[CancelToken] = None) -> float:
+        ping_ms = self.session["meta"].get("ping_ms")
+        return ping_ms if ping_ms is not None else -1
+
+    def finish_download(self, measurement, *args, **kwargs) -> Dict[str, Any]:
+        # 重播時的 CPU 用量與原本的下載無關
+        measurement.cpu = None
+        return super().finish_download(measurement, *args, **kwargs)
+
+class PacingHandler(http.server.BaseHTTPRequestHandler):
+    """/session/<n>：依第 n 筆記錄的首位元組時間與讀取節奏送出資料"""
+
+    protocol_version = "HTTP/1.1"
+    # 間隔 1 ms 內的讀取合併成一次寫入
+    COALESCE_SECONDS = 0.001
+
+    def do_GET(self):
+        match = re.match(r"/session/(\d+)", self.path)
+        sessions = self.server.sessions
+        if match is None or int(match.group(1)) >= len(sessions):
+            self.send_error(404)
+            return
+        session = sessions[int(match.group(1))]
+        response = session["meta"]["response"]
+        reads = session["reads"]
+        total = response.get("content_length") or sum(size for _, size in reads)
+
+        # 記錄中的等待回應時間 (連線完成到收到標頭)
+        connected = response.get("connected_s") or 0.0
+        time.sleep(max(0.0, response["headers_s"] - connected))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(total))
+        self.end_headers()
+
+        start = time.perf_counter() - response["headers_s"]
+        index = 0
+        try:
+            while index < len(reads):
+                offset = reads[index][0]
+                pending = 0
+                while index < len(reads) and reads[index][0] - offset <= self.COALESCE_SECONDS:
+                    pending += reads[index][1]
+                    index += 1
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.wfile.write(bytes(pending))
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        # 原本的下載提前結束時補齊 Content-Length，讓用戶端自行決定何時停止
+        remaining = total - sum(size for _, size in reads)
+        try:
+            while remaining > 0:
+                length = min(remaining, 1 << 20)
+                self.wfile.write(bytes(length))
+                remaining -= length
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class PacingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, sessions: List[Dict[str, Any]], address: Tuple[str, int] = ("127.0.0.1", 0)):
+        super().__init__(address, PacingHandler)
+        self.sessions = sessions
+        self.base_url = f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "PacingServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class ReplayEngine(SpeedTestEngine):
+    """依記錄重播每個伺服器測試；鍵值為記錄的索引
+
+    pacing_server 不為 None 時改以一般的 SpeedTest 從本機伺服器下載 (經過真正的 TCP 堆疊)。
+    """
+
+    def __init__(self, sessions: List[Dict[str, Any]], pacing_server: Optional[PacingServer] = None,
+                 realtime: bool = False, **kwargs):
+        kwargs.setdefault("cooldown", 0)
+        super().__init__(**kwargs)
+        self.sessions = sessions
+        self.pacing_server = pacing_server
+        self.realtime = realtime
+
+    def resolve_server(self, key: str) -> Optional[Dict[str, Any]]:
+        meta = self.sessions[int(key)]["meta"]
+        server = {"key": meta["server_key"], "name": meta.get("server_name") or meta["server_key"],
+                  "host": meta.get("host") or "replay", "region": meta.get("region") or "replay",
+                  "provider": meta.get("provider") or "replay"}
+        if self.pacing_server is not None:
+            server["test_url"] = f"{self.pacing_server.base_url}/session/{key}"
+        else:
+            server["test_url"] = (meta.get("response") or {}).get("test_url") or get_test_url(server, self.test_size)
+        return server
+
+    def create_speed_test(self) -> SpeedTest:
+        if self.pacing_server is not None:
+            return super().create_speed_test()
+        return self.replay_speed_test
+
+    def measure_ping(self, server: Dict[str, Any], speed_test: SpeedTest,
+                     cancel_token: Optional[CancelToken] = None) -> float:
+        ping_ms = self.current["meta"].get("ping_ms")
+        return ping_ms if ping_ms is not None else -1
+
+    def run_server(self, key: str, cancel_token: Optional[CancelToken] = None, max_bytes: Optional[int] = None):
+        self.current = self.sessions[int(key)]
+        self.replay_speed_test = ReplaySpeedTest(self.current, self.realtime, timeout=self.timeout,
+                                                 max_rate_mbit_s=self.max_rate,
+                                                 target_rate_mbit_s=self.target_rate)
+        result = super().run_server(key, cancel_token, max_bytes)
+        # 結果以原本的伺服器鍵值呈現
+        result["server_key"] = self.current["meta"]["server_key"]
+        result["replayed"] = True
+        return result
+
+def compare_download(session: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    recorded = session["meta"]["recorded"]
+    return {"server_key": result["server_key"], "recorded": recorded,
+            "replayed": {field: result.get(field) for field in COMPARE_FIELDS + ("success",)}}
+
+def print_download_comparison(rows: List[Dict[str, Any]]):
+    print(f"\n{'server':<18} {'recorded Mbps':>14} {'replayed Mbps':>14} {'steady rec':>11} {'steady rep':>11} "
+          f"{'bytes rec':>12} {'bytes rep':>12}  stop")
+    print("-" * 110)
+
+    def number(value, width, digits=1):
+        return f"{value:{width}.{digits}f}" if isinstance(value, (int, float)) else f"{'-':>{width}}"
+
+    for row in rows:
+        recorded, replayed = row["recorded"], row["replayed"]
+        stop = f"{recorded.get('partial_reason') or 'complete'} → {replayed.get('partial_reason') or 'complete'}"
+        print(f"{row['server_key']:<18} {number(recorded.get('download_mbps'), 14)} "
+              f"{number(replayed.get('download_mbps'), 14)} {number(recorded.get('steady_mbit_s'), 11)} "
+              f"{number(replayed.get('steady_mbit_s'), 11)} {number(recorded.get('downloaded_bytes'), 12, 0)} "
+              f"{number(replayed.get('downloaded_bytes'), 12, 0)}  {stop}")
+
+def replay_netcheck(sessions: List[Dict[str, Any]], lang: str = "en") -> List[Dict[str, Any]]:
+    """以目前的 calculate_score 重新評分並排名"""
+    results = []
+    changed = 0
+    for session in sessions:
+        result = dict(session["meta"])
+        recorded_score = result.get("score")
+        result["score"] = calculate_score(result) if result.get("success") else 0
+        result["recorded_score"] = recorded_score
+        if recorded_score is not None and abs(result["score"] - recorded_score) > 1e-9:
+            changed += 1
+        results.append(result)
+    print_ranking(results, lang)
+    print(f"\nScores changed by the current calculate_score: {changed}/{len(results)}")
+    return results
+
+def run_replay_command(args):
+    sessions = list(iter_sessions(args.trace))
+    downloads = [s for s in sessions if s["kind"] == "download"]
+    netchecks = [s for s in sessions if s["kind"] == "netcheck"]
+    replayed = []
+
+    if downloads:
+        settings = downloads[0]["meta"].get("settings") or {}
+        quick_test = settings.get("quick_test", False) if args.quick is None else args.quick
+        timeout = args.timeout if args.timeout is not None else settings.get("timeout", 30)
+        test_size = args.size or settings.get("test_size", "100MB")
+        pacing_server = PacingServer(downloads).start() if args.serve else None
+        engine = ReplayEngine(downloads, pacing_server, args.realtime, test_size=test_size, quick_test=quick_test,
+                              lang=args.lang, timeout=timeout, show_progress=False)
+        if args.show_results:
+            from vultr_speedtest import ConsoleReporter
+            engine.subscribe(ConsoleReporter(args.lang, show_progress=False))
+        started = time.perf_counter()
+        results = engine.run([str(i) for i in range(len(downloads))])
+        elapsed = time.perf_counter() - started
+        if pacing_server is not None:
+            pacing_server.shutdown()
+        mode = "pacing server" if args.serve else ("real time" if args.realtime else "virtual clock")
+        print(f"Replayed {len(results)} download session(s) in {elapsed:.2f}s ({mode}; quick={quick_test}, "
+              f"timeout={timeout}s, size={test_size})")
+        print_download_comparison([compare_download(s, r) for s, r in zip(downloads, results)])
+        print_summary(results, args.lang)
+        replayed.extend(results)
+
+    if netchecks:
+        replayed.extend(replay_netcheck(netchecks, args.lang))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(replayed, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+def run_info_command(args):
+    total_reads = 0
+    for index, session in enumerate(iter_sessions(args.trace)):
+        meta = session["meta"]
+        reads = session["reads"]
+        total_reads += len(reads)
+        if session["kind"] == "download":
+            downloaded = sum(size for _, size in reads)
+            duration = reads[-1][0] if reads else 0.0
+            print(f"{index:4} download {meta.get('server_key') or '-':<18} {meta.get('timestamp') or '':<33} "
+                  f"{len(reads):8} reads {downloaded / 1024 / 1024:9.1f} MiB {duration:7.2f}s")
+        else:
+            print(f"{index:4} netcheck {meta.get('host') or '-':<18} {meta.get('timestamp') or '':<33} "
+                  f"total {meta.get('total_ms') or 0:.1f} ms")
+    size = os.path.getsize(args.trace)
+    per_read = f" ({size / total_reads:.2f} bytes/read)" if total_reads else ""
+    print(f"\n{size / 1024:.1f} KiB, {total_reads} reads{per_read}")
+
+def run_serve_command(args):
+    sessions = [s for s in iter_sessions(args.trace) if s["kind"] == "download"]
+    server = PacingServer(sessions, ("127.0.0.1", args.port))
+    print(f"Serving {len(sessions)} recorded session(s) at {server.base_url}/session/<n> (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded speed test sessions")
+    subparsers = parser.add_subparsers(dest="command")
+
+    info_parser = subparsers.add_parser("info", help="List the sessions in a trace")
+    info_parser.add_argument("trace", help="Trace recorded with --record")
+
+    replay_parser = subparsers.add_parser("replay", help="Feed recorded sessions back through the analysis")
+    replay_parser.add_argument("trace", help="Trace recorded with --record")
+    quick_group = replay_parser.add_mutually_exclusive_group()
+    quick_group.add_argument("--quick", dest="quick", action="store_true", default=None,
+                             help="Replay with quick-test termination (default: as recorded)")
+    quick_group.add_argument("--full", dest="quick", action="store_false", help="Replay without quick-test termination")
+    replay_parser.add_argument("--timeout", type=int, help="Download time limit in seconds (default: as recorded)")
+    replay_parser.add_argument("--size", choices=["100MB", "1GB"], help="Test size setting (default: as recorded)")
+    replay_parser.add_argument("--realtime", action="store_true", help="Wait for the recorded timings instead of a virtual clock")
+    replay_parser.add_argument("--serve", action="store_true",
+                               help="Download from a local server that reproduces the recorded pacing")
+    replay_parser.add_argument("--show-results", action="store_true", help="Print each replayed result as it completes")
+    replay_parser.add_argument("--lang", choices=["en", "zh", "ja"], default="en", help="Summary language")
+    replay_parser.add_argument("--output", help="Save the replayed results as JSON")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve recorded sessions with their original pacing")
+    serve_parser.add_argument("trace", help="Trace recorded with --record")
+    serve_parser.add_argument("--port", type=int, default=8766, help="Port on 127.0.0.1 (default: 8766)")
+
+    args = parser.parse_args()
+    if args.command == "info":
+        run_info_command(args)
+    elif args.command == "replay":
+        run_replay_command(args)
+    elif args.command == "serve":
+        run_serve_command(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,22 @@
 使用 Python 標準庫測試到各大網站的連接性能
 """
 
+import errno
 import socket
 import time
 import urllib.request
 import argparse
 import json
 import signal
-from typing import Dict, List
+import ssl
+import threading
+import http.client
+import datetime as dt
+from typing import Dict, List, Optional
+
+from geo import locate, parse_origin, rtt_anomaly, within_distance
+from result_cache import DEFAULT_CACHE_PATH, ResultCache, cache_key, format_age, parse_duration
+from tracing import TRACE_FORMATS, export_tracing, get_tracer, perf_counter_ns, start_tracing
 
 # 全球知名網站（用於測試連接性能）
 GLOBAL_SITES = [
@@ -30,48 +39,48 @@ GLOBAL_SITES = [
 # Vultr 全球機房測試站點
 VULTR_SITES = [
     # 亞洲
-    {"labels": {"en": "Tokyo, Japan (Vultr)", "zh": "東京, 日本 (Vultr)", "ja": "東京, 日本 (Vultr)"}, "host": "hnd-jp-ping.vultr.com", "region": "Asia"},
-    {"labels": {"en": "Osaka, Japan (Vultr)", "zh": "大阪, 日本 (Vultr)", "ja": "大阪, 日本 (Vultr)"}, "host": "osk-jp-ping.vultr.com", "region": "Asia"},
-    {"labels": {"en": "Seoul, South Korea (Vultr)", "zh": "首爾, 韓國 (Vultr)", "ja": "ソウル, 韓国 (Vultr)"}, "host": "sel-kor-ping.vultr.com", "region": "Asia"},
-    {"labels": {"en": "Singapore (Vultr)", "zh": "新加坡 (Vultr)", "ja": "シンガポール (Vultr)"}, "host": "sgp-ping.vultr.com", "region": "Asia"},
-    {"labels": {"en": "Bangalore, India (Vultr)", "zh": "班加羅爾, 印度 (Vultr)", "ja": "バンガロール, インド (Vultr)"}, "host": "blr-in-ping.vultr.com", "region": "Asia"},
-    {"labels": {"en": "Delhi NCR, India (Vultr)", "zh": "德里NCR, 印度 (Vultr)", "ja": "デリー, インド (Vultr)"}, "host": "del-in-ping.vultr.com", "region": "Asia"},
-    {"labels": {"en": "Mumbai, India (Vultr)", "zh": "孟買, 印度 (Vultr)", "ja": "ムンバイ, インド (Vultr)"}, "host": "bom-in-ping.vultr.com", "region": "Asia"},
-    {"labels": {"en": "Tel Aviv, Israel (Vultr)", "zh": "特拉維夫, 以色列 (Vultr)", "ja": "テルアビブ, イスラエル (Vultr)"}, "host": "tlv-il-ping.vultr.com", "region": "Asia"},
+    {"labels": {"en": "Tokyo, Japan (Vultr)", "zh": "東京, 日本 (Vultr)", "ja": "東京, 日本 (Vultr)"}, "host": "hnd-jp-ping.vultr.com", "region": "Asia", "lat": 35.55, "lon": 139.78},
+    {"labels": {"en": "Osaka, Japan (Vultr)", "zh": "大阪, 日本 (Vultr)", "ja": "大阪, 日本 (Vultr)"}, "host": "osk-jp-ping.vultr.com", "region": "Asia", "lat": 34.69, "lon": 135.5},
+    {"labels": {"en": "Seoul, South Korea (Vultr)", "zh": "首爾, 韓國 (Vultr)", "ja": "ソウル, 韓国 (Vultr)"}, "host": "sel-kor-ping.vultr.com", "region": "Asia", "lat": 37.57, "lon": 126.98},
+    {"labels": {"en": "Singapore (Vultr)", "zh": "新加坡 (Vultr)", "ja": "シンガポール (Vultr)"}, "host": "sgp-ping.vultr.com", "region": "Asia", "lat": 1.35, "lon": 103.82},
+    {"labels": {"en": "Bangalore, India (Vultr)", "zh": "班加羅爾, 印度 (Vultr)", "ja": "バンガロール, インド (Vultr)"}, "host": "blr-in-ping.vultr.com", "region": "Asia", "lat": 12.97, "lon": 77.59},
+    {"labels": {"en": "Delhi NCR, India (Vultr)", "zh": "德里NCR, 印度 (Vultr)", "ja": "デリー, インド (Vultr)"}, "host": "del-in-ping.vultr.com", "region": "Asia", "lat": 28.61, "lon": 77.21},
+    {"labels": {"en": "Mumbai, India (Vultr)", "zh": "孟買, 印度 (Vultr)", "ja": "ムンバイ, インド (Vultr)"}, "host": "bom-in-ping.vultr.com", "region": "Asia", "lat": 19.08, "lon": 72.88},
+    {"labels": {"en": "Tel Aviv, Israel (Vultr)", "zh": "特拉維夫, 以色列 (Vultr)", "ja": "テルアビブ, イスラエル (Vultr)"}, "host": "tlv-il-ping.vultr.com", "region": "Asia", "lat": 32.09, "lon": 34.78},
 
     # 歐洲
-    {"labels": {"en": "London, UK (Vultr)", "zh": "倫敦, 英國 (Vultr)", "ja": "ロンドン, イギリス (Vultr)"}, "host": "lon-gb-ping.vultr.com", "region": "Europe"},
-    {"labels": {"en": "Manchester, UK (Vultr)", "zh": "曼徹斯特, 英國 (Vultr)", "ja": "マンチェスター, イギリス (Vultr)"}, "host": "man-uk-ping.vultr.com", "region": "Europe"},
-    {"labels": {"en": "Frankfurt, Germany (Vultr)", "zh": "法蘭克福, 德國 (Vultr)", "ja": "フランクフルト, ドイツ (Vultr)"}, "host": "fra-de-ping.vultr.com", "region": "Europe"},
-    {"labels": {"en": "Paris, France (Vultr)", "zh": "巴黎, 法國 (Vultr)", "ja": "パリ, フランス (Vultr)"}, "host": "par-fr-ping.vultr.com", "region": "Europe"},
-    {"labels": {"en": "Amsterdam, Netherlands (Vultr)", "zh": "阿姆斯特丹, 荷蘭 (Vultr)", "ja": "アムステルダム, オランダ (Vultr)"}, "host": "ams-nl-ping.vultr.com", "region": "Europe"},
-    {"labels": {"en": "Warsaw, Poland (Vultr)", "zh": "華沙, 波蘭 (Vultr)", "ja": "ワルシャワ, ポーランド (Vultr)"}, "host": "waw-pl-ping.vultr.com", "region": "Europe"},
-    {"labels": {"en": "Stockholm, Sweden (Vultr)", "zh": "斯德哥爾摩, 瑞典 (Vultr)", "ja": "ストックホルム, スウェーデン (Vultr)"}, "host": "sto-se-ping.vultr.com", "region": "Europe"},
-    {"labels": {"en": "Madrid, Spain (Vultr)", "zh": "馬德里, 西班牙 (Vultr)", "ja": "マドリード, スペイン (Vultr)"}, "host": "mad-es-ping.vultr.com", "region": "Europe"},
+    {"labels": {"en": "London, UK (Vultr)", "zh": "倫敦, 英國 (Vultr)", "ja": "ロンドン, イギリス (Vultr)"}, "host": "lon-gb-ping.vultr.com", "region": "Europe", "lat": 51.51, "lon": -0.13},
+    {"labels": {"en": "Manchester, UK (Vultr)", "zh": "曼徹斯特, 英國 (Vultr)", "ja": "マンチェスター, イギリス (Vultr)"}, "host": "man-uk-ping.vultr.com", "region": "Europe", "lat": 53.48, "lon": -2.24},
+    {"labels": {"en": "Frankfurt, Germany (Vultr)", "zh": "法蘭克福, 德國 (Vultr)", "ja": "フランクフルト, ドイツ (Vultr)"}, "host": "fra-de-ping.vultr.com", "region": "Europe", "lat": 50.11, "lon": 8.68},
+    {"labels": {"en": "Paris, France (Vultr)", "zh": "巴黎, 法國 (Vultr)", "ja": "パリ, フランス (Vultr)"}, "host": "par-fr-ping.vultr.com", "region": "Europe", "lat": 48.86, "lon": 2.35},
+    {"labels": {"en": "Amsterdam, Netherlands (Vultr)", "zh": "阿姆斯特丹, 荷蘭 (Vultr)", "ja": "アムステルダム, オランダ (Vultr)"}, "host": "ams-nl-ping.vultr.com", "region": "Europe", "lat": 52.37, "lon": 4.9},
+    {"labels": {"en": "Warsaw, Poland (Vultr)", "zh": "華沙, 波蘭 (Vultr)", "ja": "ワルシャワ, ポーランド (Vultr)"}, "host": "waw-pl-ping.vultr.com", "region": "Europe", "lat": 52.23, "lon": 21.01},
+    {"labels": {"en": "Stockholm, Sweden (Vultr)", "zh": "斯德哥爾摩, 瑞典 (Vultr)", "ja": "ストックホルム, スウェーデン (Vultr)"}, "host": "sto-se-ping.vultr.com", "region": "Europe", "lat": 59.33, "lon": 18.07},
+    {"labels": {"en": "Madrid, Spain (Vultr)", "zh": "馬德里, 西班牙 (Vultr)", "ja": "マドリード, スペイン (Vultr)"}, "host": "mad-es-ping.vultr.com", "region": "Europe", "lat": 40.42, "lon": -3.7},
 
     # 北美
-    {"labels": {"en": "Atlanta, USA (Vultr)", "zh": "亞特蘭大, 美國 (Vultr)", "ja": "アトランタ, アメリカ (Vultr)"}, "host": "ga-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Chicago, USA (Vultr)", "zh": "芝加哥, 美國 (Vultr)", "ja": "シカゴ, アメリカ (Vultr)"}, "host": "il-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Dallas, USA (Vultr)", "zh": "達拉斯, 美國 (Vultr)", "ja": "ダラス, アメリカ (Vultr)"}, "host": "tx-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Honolulu, USA (Vultr)", "zh": "火奴魯魯, 美國 (Vultr)", "ja": "ホノルル, アメリカ (Vultr)"}, "host": "hon-hi-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Los Angeles, USA (Vultr)", "zh": "洛杉磯, 美國 (Vultr)", "ja": "ロサンゼルス, アメリカ (Vultr)"}, "host": "lax-ca-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Miami, USA (Vultr)", "zh": "邁阿密, 美國 (Vultr)", "ja": "マイアミ, アメリカ (Vultr)"}, "host": "fl-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "New York (NJ), USA (Vultr)", "zh": "紐約(新澤西), 美國 (Vultr)", "ja": "ニューヨーク(NJ), アメリカ (Vultr)"}, "host": "nj-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Seattle, USA (Vultr)", "zh": "西雅圖, 美國 (Vultr)", "ja": "シアトル, アメリカ (Vultr)"}, "host": "wa-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Silicon Valley, USA (Vultr)", "zh": "矽谷, 美國 (Vultr)", "ja": "シリコンバレー, アメリカ (Vultr)"}, "host": "sjo-ca-us-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Toronto, Canada (Vultr)", "zh": "多倫多, 加拿大 (Vultr)", "ja": "トロント, カナダ (Vultr)"}, "host": "tor-ca-ping.vultr.com", "region": "North America"},
-    {"labels": {"en": "Mexico City, Mexico (Vultr)", "zh": "墨西哥城, 墨西哥 (Vultr)", "ja": "メキシコシティ, メキシコ (Vultr)"}, "host": "mex-mx-ping.vultr.com", "region": "North America"},
+    {"labels": {"en": "Atlanta, USA (Vultr)", "zh": "亞特蘭大, 美國 (Vultr)", "ja": "アトランタ, アメリカ (Vultr)"}, "host": "ga-us-ping.vultr.com", "region": "North America", "lat": 33.75, "lon": -84.39},
+    {"labels": {"en": "Chicago, USA (Vultr)", "zh": "芝加哥, 美國 (Vultr)", "ja": "シカゴ, アメリカ (Vultr)"}, "host": "il-us-ping.vultr.com", "region": "North America", "lat": 41.88, "lon": -87.63},
+    {"labels": {"en": "Dallas, USA (Vultr)", "zh": "達拉斯, 美國 (Vultr)", "ja": "ダラス, アメリカ (Vultr)"}, "host": "tx-us-ping.vultr.com", "region": "North America", "lat": 32.78, "lon": -96.8},
+    {"labels": {"en": "Honolulu, USA (Vultr)", "zh": "火奴魯魯, 美國 (Vultr)", "ja": "ホノルル, アメリカ (Vultr)"}, "host": "hon-hi-us-ping.vultr.com", "region": "North America", "lat": 21.31, "lon": -157.86},
+    {"labels": {"en": "Los Angeles, USA (Vultr)", "zh": "洛杉磯, 美國 (Vultr)", "ja": "ロサンゼルス, アメリカ (Vultr)"}, "host": "lax-ca-us-ping.vultr.com", "region": "North America", "lat": 34.05, "lon": -118.24},
+    {"labels": {"en": "Miami, USA (Vultr)", "zh": "邁阿密, 美國 (Vultr)", "ja": "マイアミ, アメリカ (Vultr)"}, "host": "fl-us-ping.vultr.com", "region": "North America", "lat": 25.76, "lon": -80.19},
+    {"labels": {"en": "New York (NJ), USA (Vultr)", "zh": "紐約(新澤西), 美國 (Vultr)", "ja": "ニューヨーク(NJ), アメリカ (Vultr)"}, "host": "nj-us-ping.vultr.com", "region": "North America", "lat": 40.55, "lon": -74.46},
+    {"labels": {"en": "Seattle, USA (Vultr)", "zh": "西雅圖, 美國 (Vultr)", "ja": "シアトル, アメリカ (Vultr)"}, "host": "wa-us-ping.vultr.com", "region": "North America", "lat": 47.61, "lon": -122.33},
+    {"labels": {"en": "Silicon Valley, USA (Vultr)", "zh": "矽谷, 美國 (Vultr)", "ja": "シリコンバレー, アメリカ (Vultr)"}, "host": "sjo-ca-us-ping.vultr.com", "region": "North America", "lat": 37.34, "lon": -121.89},
+    {"labels": {"en": "Toronto, Canada (Vultr)", "zh": "多倫多, 加拿大 (Vultr)", "ja": "トロント, カナダ (Vultr)"}, "host": "tor-ca-ping.vultr.com", "region": "North America", "lat": 43.65, "lon": -79.38},
+    {"labels": {"en": "Mexico City, Mexico (Vultr)", "zh": "墨西哥城, 墨西哥 (Vultr)", "ja": "メキシコシティ, メキシコ (Vultr)"}, "host": "mex-mx-ping.vultr.com", "region": "North America", "lat": 19.43, "lon": -99.13},
 
     # 南美
-    {"labels": {"en": "São Paulo, Brazil (Vultr)", "zh": "聖保羅, 巴西 (Vultr)", "ja": "サンパウロ, ブラジル (Vultr)"}, "host": "sao-br-ping.vultr.com", "region": "South America"},
-    {"labels": {"en": "Santiago, Chile (Vultr)", "zh": "聖地牙哥, 智利 (Vultr)", "ja": "サンティアゴ, チリ (Vultr)"}, "host": "scl-cl-ping.vultr.com", "region": "South America"},
+    {"labels": {"en": "São Paulo, Brazil (Vultr)", "zh": "聖保羅, 巴西 (Vultr)", "ja": "サンパウロ, ブラジル (Vultr)"}, "host": "sao-br-ping.vultr.com", "region": "South America", "lat": -23.55, "lon": -46.63},
+    {"labels": {"en": "Santiago, Chile (Vultr)", "zh": "聖地牙哥, 智利 (Vultr)", "ja": "サンティアゴ, チリ (Vultr)"}, "host": "scl-cl-ping.vultr.com", "region": "South America", "lat": -33.45, "lon": -70.67},
 
     # 非洲
-    {"labels": {"en": "Johannesburg, South Africa (Vultr)", "zh": "約翰內斯堡, 南非 (Vultr)", "ja": "ヨハネスブルグ, 南アフリカ (Vultr)"}, "host": "jnb-za-ping.vultr.com", "region": "Africa"},
+    {"labels": {"en": "Johannesburg, South Africa (Vultr)", "zh": "約翰內斯堡, 南非 (Vultr)", "ja": "ヨハネスブルグ, 南アフリカ (Vultr)"}, "host": "jnb-za-ping.vultr.com", "region": "Africa", "lat": -26.2, "lon": 28.05},
 
     # 澳洲
-    {"labels": {"en": "Melbourne, Australia (Vultr)", "zh": "墨爾本, 澳大利亞 (Vultr)", "ja": "メルボルン, オーストラリア (Vultr)"}, "host": "mel-au-ping.vultr.com", "region": "Oceania"},
-    {"labels": {"en": "Sydney, Australia (Vultr)", "zh": "雪梨, 澳大利亞 (Vultr)", "ja": "シドニー, オーストラリア (Vultr)"}, "host": "syd-au-ping.vultr.com", "region": "Oceania"},
+    {"labels": {"en": "Melbourne, Australia (Vultr)", "zh": "墨爾本, 澳大利亞 (Vultr)", "ja": "メルボルン, オーストラリア (Vultr)"}, "host": "mel-au-ping.vultr.com", "region": "Oceania", "lat": -37.81, "lon": 144.96},
+    {"labels": {"en": "Sydney, Australia (Vultr)", "zh": "雪梨, 澳大利亞 (Vultr)", "ja": "シドニー, オーストラリア (Vultr)"}, "host": "syd-au-ping.vultr.com", "region": "Oceania", "lat": -33.87, "lon": 151.21},
 ]
 
 # 合併所有測試站點
@@ -100,12 +109,49 @@ LANGUAGES = {
         "sites": "sites",
         "no_success": "❌ No successful test results",
         "saved_to": "💾 Results saved to",
+        "cached": "cached",
         "available_sites": "Available test sites:",
         "no_region_found": "❌ No sites found for region",
         "dns_failed": "DNS resolution failed",
         "tcp_failed": "TCP connection failed",
         "timeout": "Connection timeout",
         "connection_error": "Connection error",
+        # Request rate benchmark
+        "request_rate_title": "⚡ Small-object request rate (keep-alive vs one connection per request)",
+        "keepalive": "keep-alive",
+        "per_request": "per-request",
+        "mode": "Mode",
+        "requests_per_sec": "req/s",
+        "errors": "errors",
+        "connections": "conns",
+        "handshake_cost": "Handshake cost per request",
+        "slow_path": "RTT far above physical minimum",
+        "below_minimum": "RTT below light-speed minimum",
+        "rtt_anomalies": "RTT anomalies",
+        "pruned_by_distance": "Skipped beyond distance limit",
+        "max_distance_needs_origin": "--max-distance requires --origin",
+        "trace_saved_to": "🧭 Trace saved to",
+        "invalid_plan": "❌ Invalid test plan",
+        # Connection rate
+        "connection_rate_title": "🔁 TCP connection-establishment rate (short connections, rising rate)",
+        "target_rate": "target/s",
+        "achieved_rate": "conn/s",
+        "failed": "failed",
+        "failure_onset": "Failure onset at",
+        "no_failure_onset": "No failure up to",
+        "max_achieved": "max achieved",
+        "onset_failures": "connection failures",
+        "onset_saturated": "achieved rate fell below 90% of target",
+        "onset_latency": "connect latency jumped (SYN drops / retransmits)",
+        "local_server": "Local stand-in server",
+        "connection_rate_needs_target": "--connection-rate requires --target HOST or --local-server",
+        # UDP probe
+        "udp_title": "📡 UDP jitter / loss probe",
+        "loss": "loss",
+        "jitter": "jitter",
+        "reordered": "reord",
+        "duplicates": "dup",
+        "udp_needs_target": "--udp requires --target HOST[:PORT] (hosts running `udp_probe.py serve`)",
         # Region names
         "Asia": "Asia",
         "Europe": "Europe",
@@ -135,12 +181,49 @@ LANGUAGES = {
         "sites": "個站點",
         "no_success": "❌ 沒有成功的測試結果",
         "saved_to": "💾 結果已保存到",
+        "cached": "快取",
         "available_sites": "可用的測試站點：",
         "no_region_found": "❌ 沒有找到地區",
         "dns_failed": "DNS 解析失敗",
         "tcp_failed": "TCP 連接失敗",
         "timeout": "連接超時",
         "connection_error": "連接錯誤",
+        # Request rate benchmark
+        "request_rate_title": "⚡ 小物件請求速率 (keep-alive 與每次請求新連線比較)",
+        "keepalive": "keep-alive",
+        "per_request": "每次新連線",
+        "mode": "模式",
+        "requests_per_sec": "請求/秒",
+        "errors": "錯誤",
+        "connections": "連線數",
+        "handshake_cost": "每次請求的握手成本",
+        "slow_path": "RTT 遠高於物理下限",
+        "below_minimum": "RTT 低於光速下限",
+        "rtt_anomalies": "RTT 異常",
+        "pruned_by_distance": "超過距離上限而略過",
+        "max_distance_needs_origin": "--max-distance 需要搭配 --origin",
+        "trace_saved_to": "🧭 追蹤記錄已保存到",
+        "invalid_plan": "❌ 測試計畫不合法",
+        # Connection rate
+        "connection_rate_title": "🔁 TCP 連線建立速率 (短連線，逐步提高速率)",
+        "target_rate": "目標/秒",
+        "achieved_rate": "連線/秒",
+        "failed": "失敗",
+        "failure_onset": "開始失敗的速率",
+        "no_failure_onset": "最高測到仍未失敗",
+        "max_achieved": "最高達成",
+        "onset_failures": "連線失敗",
+        "onset_saturated": "達成速率低於目標的 90%",
+        "onset_latency": "連線延遲跳升 (SYN 被丟棄 / 重送)",
+        "local_server": "本機替身伺服器",
+        "connection_rate_needs_target": "--connection-rate 需要 --target HOST 或 --local-server",
+        # UDP probe
+        "udp_title": "📡 UDP 抖動 / 遺失測試",
+        "loss": "遺失",
+        "jitter": "抖動",
+        "reordered": "亂序",
+        "duplicates": "重複",
+        "udp_needs_target": "--udp 需要 --target HOST[:PORT] (執行 `udp_probe.py serve` 的主機)",
         # Region names
         "Asia": "亞洲",
         "Europe": "歐洲",
@@ -170,12 +253,49 @@ LANGUAGES = {
         "sites": "サイト",
         "no_success": "❌ 成功したテスト結果がありません",
         "saved_to": "💾 結果を保存しました",
+        "cached": "キャッシュ",
         "available_sites": "利用可能なテストサイト：",
         "no_region_found": "❌ 地域が見つかりません",
         "dns_failed": "DNS解決に失敗",
         "tcp_failed": "TCP接続に失敗",
         "timeout": "接続タイムアウト",
         "connection_error": "接続エラー",
+        # Request rate benchmark
+        "request_rate_title": "⚡ 小オブジェクトのリクエストレート (keep-alive と毎回新規接続の比較)",
+        "keepalive": "keep-alive",
+        "per_request": "毎回新規接続",
+        "mode": "モード",
+        "requests_per_sec": "リクエスト/秒",
+        "errors": "エラー",
+        "connections": "接続数",
+        "handshake_cost": "リクエストあたりのハンドシェイクコスト",
+        "slow_path": "RTT が物理的下限を大きく上回る",
+        "below_minimum": "RTT が光速の下限を下回る",
+        "rtt_anomalies": "RTT 異常",
+        "pruned_by_distance": "距離上限を超えたためスキップ",
+        "max_distance_needs_origin": "--max-distance には --origin が必要です",
+        "trace_saved_to": "🧭 トレースを保存しました",
+        "invalid_plan": "❌ テスト計画が不正です",
+        # Connection rate
+        "connection_rate_title": "🔁 TCP 接続確立レート (短時間接続、レートを段階的に上昇)",
+        "target_rate": "目標/秒",
+        "achieved_rate": "接続/秒",
+        "failed": "失敗",
+        "failure_onset": "失敗し始めたレート",
+        "no_failure_onset": "最大レートまで失敗なし",
+        "max_achieved": "最大達成",
+        "onset_failures": "接続失敗",
+        "onset_saturated": "達成レートが目標の 90% 未満",
+        "onset_latency": "接続遅延が急増 (SYN 破棄 / 再送)",
+        "local_server": "ローカル代替サーバー",
+        "connection_rate_needs_target": "--connection-rate には --target HOST または --local-server が必要です",
+        # UDP probe
+        "udp_title": "📡 UDP ジッター / ロス測定",
+        "loss": "ロス",
+        "jitter": "ジッター",
+        "reordered": "順序逆転",
+        "duplicates": "重複",
+        "udp_needs_target": "--udp には --target HOST[:PORT] (`udp_probe.py serve` を実行中のホスト) が必要です",
         # Region names
         "Asia": "アジア",
         "Europe": "ヨーロッパ",
@@ -200,20 +320,25 @@ def get_site_label(site: Dict, lang: str = "en") -> str:
     """Get localized site label"""
     return site['labels'].get(lang, site['labels'].get('en', 'Unknown'))
 
-def test_connection_speed(host: str, timeout: float = 10.0, lang: str = "en") -> Dict:
-    """測試連接速度和延遲"""
+def test_connection_speed(host: str, timeout: float = 10.0, lang: str = "en", port: int = 80) -> Dict:
+    """測試連接速度和延遲 (port 可指向本機替身伺服器)"""
+    tracer = get_tracer()
     try:
         # 1. DNS 解析時間
-        dns_start = time.time()
+        dns_start = perf_counter_ns()
         ip = socket.gethostbyname(host)
-        dns_time = (time.time() - dns_start) * 1000
+        dns_end = perf_counter_ns()
+        dns_time = (dns_end - dns_start) / 1e6
+        tracer.add_span("resolve", dns_start, dns_end, host=host, ip=ip)
 
         # 2. TCP 連接時間
-        tcp_start = time.time()
+        tcp_start = perf_counter_ns()
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(timeout)
-        result = sock.connect_ex((host, 80))
-        tcp_time = (time.time() - tcp_start) * 1000
+        result = sock.connect_ex((host, port))
+        tcp_end = perf_counter_ns()
+        tcp_time = (tcp_end - tcp_start) / 1e6
+        tracer.add_span("connect", tcp_start, tcp_end, host=host, port=port, errno=result)
         sock.close()
 
         if result != 0:
@@ -227,9 +352,9 @@ def test_connection_speed(host: str, timeout: float = 10.0, lang: str = "en") ->
             }
 
         # 3. HTTP 請求時間
-        http_start = time.time()
+        http_start = perf_counter_ns()
         try:
-            url = f"http://{host}/"
+            url = f"http://{host}/" if port == 80 else f"http://{host}:{port}/"
             request = urllib.request.Request(url)
             request.add_header('User-Agent', 'SimpleNetCheck/1.0')
 
@@ -237,7 +362,9 @@ def test_connection_speed(host: str, timeout: float = 10.0, lang: str = "en") ->
                 # 只讀取前 1KB 來測試響應時間
                 response.read(1024)
 
-            http_time = (time.time() - http_start) * 1000
+            http_end = perf_counter_ns()
+            http_time = (http_end - http_start) / 1e6
+            tracer.add_span("request", http_start, http_end, url=url, status=response.status)
 
         except Exception:
             # HTTP 失敗時仍然返回 TCP 結果
@@ -276,6 +403,363 @@ def test_connection_speed(host: str, timeout: float = 10.0, lang: str = "en") ->
             "total_ms": 0
         }
 
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序數列的百分位數 (線性內插)"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize_latencies(latencies_ms: List[float]) -> Dict:
+    """延遲統計：平均與 p50 / p90 / p99"""
+    values = sorted(latencies_ms)
+    return {
+        "mean_ms": sum(values) / len(values) if values else 0.0,
+        "p50_ms": percentile(values, 50),
+        "p90_ms": percentile(values, 90),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else 0.0
+    }
+
+def test_request_rate(host: str, requests: int = 100, pool_size: int = 4, keepalive: bool = True,
+                      path: str = "/", port: Optional[int] = None, use_https: bool = False,
+                      timeout: float = 10.0) -> Dict:
+    """以多條連線送出大量小型 HTTP 請求，量測請求速率與延遲分布
+
+    keepalive=True 時每條連線重複使用 (連線池大小為 pool_size)；
+    False 時每次請求都重新解析 DNS 並建立連線，與 test_connection_speed 的做法相同。
+    """
+    connection_class = http.client.HTTPSConnection if use_https else http.client.HTTPConnection
+    connection_kwargs = {"timeout": timeout}
+    if use_https:
+        connection_kwargs["context"] = ssl.create_default_context()
+    headers = {"User-Agent": "SimpleNetCheck/1.0", "Connection": "keep-alive" if keepalive else "close"}
+
+    lock = threading.Lock()
+    state = {"remaining": requests, "errors": 0, "connections": 0, "status": {}}
+    latencies: List[float] = []
+
+    def take_request() -> bool:
+        with lock:
+            if state["remaining"] <= 0:
+                return False
+            state["remaining"] -= 1
+            return True
+
+    tracer = get_tracer()
+
+    def worker():
+        conn = None
+        while take_request():
+            start = perf_counter_ns()
+            try:
+                new_connection = conn is None
+                if new_connection:
+                    conn = connection_class(host, port, **connection_kwargs)
+                    with lock:
+                        state["connections"] += 1
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                end = perf_counter_ns()
+                latency = (end - start) / 1e6
+                tracer.add_span("request", start, end, host=host, status=response.status,
+                                new_connection=new_connection)
+                with lock:
+                    latencies.append(latency)
+                    state["status"][response.status] = state["status"].get(response.status, 0) + 1
+                if not keepalive or response.will_close:
+                    conn.close()
+                    conn = None
+            except Exception:
+                with lock:
+                    state["errors"] += 1
+                if conn is not None:
+                    conn.close()
+                    conn = None
+        if conn is not None:
+            conn.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, pool_size))]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    result = {
+        "host": host,
+        "mode": "keepalive" if keepalive else "per_request",
+        "pool_size": pool_size,
+        "requests": requests,
+        "completed": len(latencies),
+        "errors": state["errors"],
+        "connections": state["connections"],
+        "status_codes": {str(code): count for code, count in sorted(state["status"].items())},
+        "elapsed_s": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed > 0 else 0.0
+    }
+    result.update(summarize_latencies(latencies))
+    return result
+
+def compare_request_rate(host: str, requests: int = 100, pool_size: int = 4, path: str = "/",
+                         port: Optional[int] = None, use_https: bool = False, timeout: float = 10.0) -> Dict:
+    """同一目標分別以 keep-alive 與每次新連線執行，估算每次請求的握手成本"""
+    keepalive = test_request_rate(host, requests, pool_size, True, path, port, use_https, timeout)
+    per_request = test_request_rate(host, requests, pool_size, False, path, port, use_https, timeout)
+    comparison = {"host": host, "keepalive": keepalive, "per_request": per_request}
+    if keepalive["completed"] and per_request["completed"]:
+        comparison["handshake_cost_ms"] = per_request["p50_ms"] - keepalive["p50_ms"]
+        comparison["speedup"] = (keepalive["requests_per_sec"] / per_request["requests_per_sec"]
+                                 if per_request["requests_per_sec"] else None)
+    return comparison
+
+def print_request_rate(comparison: Dict, lang: str = "en"):
+    """輸出 keep-alive 與每次新連線的比較表"""
+    print(f"\n{comparison['host']}")
+    print(f"  {get_text('mode', lang):<14} {get_text('requests_per_sec', lang):>9} {'p50':>9} {'p90':>9} {'p99':>9} "
+          f"{get_text('connections', lang):>7} {get_text('errors', lang):>7}")
+    for mode in ("keepalive", "per_request"):
+        stats = comparison[mode]
+        label = get_text("keepalive" if mode == "keepalive" else "per_request", lang)
+        print(f"  {label:<14} {stats['requests_per_sec']:9.1f} {stats['p50_ms']:7.1f}ms {stats['p90_ms']:7.1f}ms "
+              f"{stats['p99_ms']:7.1f}ms {stats['connections']:7} {stats['errors']:7}")
+    if "handshake_cost_ms" in comparison:
+        print(f"  {get_text('handshake_cost', lang)}: {comparison['handshake_cost_ms']:.1f}ms "
+              f"(x{comparison['speedup']:.1f} req/s)")
+
+# 連線速率測試的預設速率階梯 (每秒新連線數)
+CONNECTION_RATES = [50, 100, 200, 400, 800, 1600]
+# 失敗率超過此比例 (%)，或達成速率低於目標的 90%，視為到達極限
+CONNECTION_FAILURE_PCT = 1.0
+CONNECTION_SATURATION = 0.9
+
+class LocalAcceptServer:
+    """本機替身伺服器：接受連線後立即關閉
+
+    max_accept_rate 以 token bucket 限制每秒 accept 的次數，搭配較小的 backlog
+    可以在本機重現 SYN 佇列 / conntrack / NAT 表滿載的行為 (連線逾時、SYN 重送造成的延遲跳升)。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, backlog: int = 128,
+                 max_accept_rate: Optional[float] = None):
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(backlog)
+        self.sock.settimeout(0.5)
+        self.address = self.sock.getsockname()
+        self.max_accept_rate = max_accept_rate
+        self.accepted = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def serve(self):
+        next_accept = time.perf_counter()
+        while not self.stopped.is_set():
+            if self.max_accept_rate:
+                delay = next_accept - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_accept = max(next_accept, time.perf_counter() - 0.05) + 1 / self.max_accept_rate
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.close()
+            self.accepted += 1
+        self.sock.close()
+
+    def start(self) -> "LocalAcceptServer":
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.stopped.set()
+        self.thread.join()
+
+def classify_connect_error(error: OSError) -> str:
+    """連線失敗的類型；local_ports / fd_limit 代表瓶頸在本機而非路徑上"""
+    if isinstance(error, socket.timeout):
+        return "timeout"
+    if isinstance(error, ConnectionRefusedError):
+        return "refused"
+    if isinstance(error, ConnectionResetError):
+        return "reset"
+    if error.errno == errno.EADDRNOTAVAIL:
+        return "local_ports"
+    if error.errno in (errno.EMFILE, errno.ENFILE):
+        return "fd_limit"
+    if error.errno in (errno.ENETUNREACH, errno.EHOSTUNREACH):
+        return "unreachable"
+    return "other"
+
+def test_connection_rate(address: tuple, rate: float, duration: float = 3.0, concurrency: int = 64,
+                         timeout: float = 3.0) -> Dict:
+    """以每秒 rate 條的排程開啟短 TCP 連線 (建立後立即關閉)，持續 duration 秒
+
+    concurrency 條工作執行緒輪流取下一個排程時間；連線變慢、所有執行緒都在等待時
+    排程會落後，達成速率就會低於目標。address 為 getaddrinfo 傳回的完整 sockaddr
+    (IPv4 為 (IP, port)，IPv6 為 (IP, port, flowinfo, scope_id))，不重複 DNS 查詢。
+    """
+    family = socket.AF_INET6 if len(address) == 4 else socket.AF_INET
+    lock = threading.Lock()
+    state = {"next": 0, "lag_ms": 0.0}
+    latencies: List[float] = []
+    failures: Dict[str, int] = {}
+    total = max(1, int(rate * duration))
+    start = time.perf_counter()
+
+    def take_slot() -> Optional[float]:
+        with lock:
+            if state["next"] >= total:
+                return None
+            slot = state["next"]
+            state["next"] += 1
+        return start + slot / rate
+
+    def record_failure(kind: str):
+        with lock:
+            failures[kind] = failures.get(kind, 0) + 1
+
+    def worker():
+        while True:
+            scheduled = take_slot()
+            if scheduled is None:
+                return
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                with lock:
+                    state["lag_ms"] = max(state["lag_ms"], -delay * 1000)
+            connect_start = perf_counter_ns()
+            try:
+                sock = socket.socket(family, socket.SOCK_STREAM)
+            except OSError as e:
+                record_failure(classify_connect_error(e))
+                continue
+            try:
+                sock.settimeout(timeout)
+                sock.connect(address)
+            except OSError as e:
+                sock.close()
+                record_failure(classify_connect_error(e))
+                continue
+            except Exception:
+                # 非預期的錯誤也只算一次失敗，不讓工作執行緒就此結束
+                sock.close()
+                record_failure("other")
+                continue
+            latency = (perf_counter_ns() - connect_start) / 1e6
+            sock.close()
+            with lock:
+                latencies.append(latency)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    failed = sum(failures.values())
+    result = {
+        "target_rate": rate,
+        "attempts": total,
+        "connected": len(latencies),
+        "failed": failed,
+        "failure_pct": failed / total * 100,
+        "failures": dict(sorted(failures.items())),
+        "elapsed_s": elapsed,
+        "connections_per_sec": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        # 最晚的一次比排程晚了多久開始 (所有工作執行緒都忙碌時會增加)
+        "max_schedule_lag_ms": state["lag_ms"],
+    }
+    result.update(summarize_latencies(latencies))
+    return result
+
+def sweep_connection_rate(host: str, port: int = 80, rates: Optional[List[float]] = None, duration: float = 3.0,
+                          concurrency: int = 64, timeout: float = 3.0,
+                          failure_pct: float = CONNECTION_FAILURE_PCT, lang: str = "en",
+                          on_step=None) -> Dict:
+    """依序提高每秒新連線數，找出開始失敗 (失敗率、達不到目標或連線延遲跳升) 的速率
+
+    到達極限後就停止，不再對閘道器施加更高的負載。
+    """
+    rates = rates or CONNECTION_RATES
+    result = {"host": host, "port": port, "concurrency": concurrency, "step_seconds": duration,
+              "steps": [], "onset": None}
+    try:
+        address = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4]
+    except socket.gaierror:
+        result["error"] = get_text("dns_failed", lang)
+        return result
+    result["ip"] = address[0]
+
+    tracer = get_tracer()
+    baseline_p90 = None
+    for rate in rates:
+        with tracer.span("connection_rate", host=host, port=port, rate=rate):
+            step = test_connection_rate(address, rate, duration, concurrency, timeout)
+        result["steps"].append(step)
+        if on_step is not None:
+            on_step(step)
+
+        reason = None
+        if step["failure_pct"] > failure_pct:
+            reason = "failures"
+        elif step["connections_per_sec"] < rate * CONNECTION_SATURATION:
+            reason = "saturated"
+        elif baseline_p90 is not None and step["p90_ms"] > baseline_p90 * 4 + 10:
+            # SYN 被丟棄後核心約 1 秒後重送，p90 會明顯跳升
+            reason = "latency"
+        if baseline_p90 is None and step["connected"]:
+            baseline_p90 = step["p90_ms"]
+        if reason is not None:
+            result["onset"] = {"rate": rate, "reason": reason}
+            break
+
+    completed = [s for s in result["steps"] if s["connected"]]
+    result["max_connections_per_sec"] = max((s["connections_per_sec"] for s in completed), default=0.0)
+    return result
+
+def print_connection_rate_step(step: Dict):
+    failures = ", ".join(f"{kind} {count}" for kind, count in step["failures"].items())
+    print(f"  {step['target_rate']:8.0f} {step['connections_per_sec']:9.1f} {step['p50_ms']:7.1f}ms "
+          f"{step['p90_ms']:7.1f}ms {step['p99_ms']:7.1f}ms {step['failure_pct']:7.1f}%  {failures}", flush=True)
+
+def print_connection_rate(result: Dict, lang: str = "en"):
+    """輸出速率階梯的結論 (各階段的數值由 print_connection_rate_step 逐步輸出)"""
+    if "error" in result:
+        print(f"  ❌ {result['error']}")
+        return
+    onset = result["onset"]
+    if onset is None:
+        print(f"  ✅ {get_text('no_failure_onset', lang)} {result['steps'][-1]['target_rate']:.0f} conn/s "
+              f"({get_text('max_achieved', lang)} {result['max_connections_per_sec']:.0f} conn/s)")
+    else:
+        print(f"  ⚠️  {get_text('failure_onset', lang)} {onset['rate']:.0f} conn/s "
+              f"({get_text('onset_' + onset['reason'], lang)}; "
+              f"{get_text('max_achieved', lang)} {result['max_connections_per_sec']:.0f} conn/s)")
+
+def print_udp_probe(result: Dict, lang: str = "en"):
+    """輸出一個 UDP 探測目標的遺失、抖動與來回時間"""
+    target = f"{result['host']}:{result['port']}"
+    if not result["success"]:
+        print(f"  {target:<28} ❌ {result['error']}")
+        return
+    print(f"  {target:<28} {get_text('loss', lang)} {result['loss_pct']:5.1f}% | "
+          f"{get_text('jitter', lang)} {result['jitter_ms']:6.2f}ms / {result['return_jitter_ms']:6.2f}ms | "
+          f"RTT p50 {result['rtt']['p50_ms']:6.1f}ms p99 {result['rtt']['p99_ms']:6.1f}ms | "
+          f"{get_text('reordered', lang)} {result['reordered']} | {get_text('duplicates', lang)} {result['duplicates']}")
+
 def calculate_score(result: Dict) -> float:
     """根據延遲計算連接評分 (0-100)"""
     if not result["success"]:
@@ -299,6 +783,150 @@ def calculate_score(result: Dict) -> float:
     else:
         return 10
 
+def print_ranking(results: List[Dict], lang: str = "en"):
+    """顯示延遲排名、最佳連接與地區統計"""
+    print("\n" + "=" * 60)
+    print(get_text("results_ranking", lang))
+
+    successful_tests = [r for r in results if r['success']]
+    if successful_tests:
+        successful_tests.sort(key=lambda x: x['total_ms'])
+
+        print(f"{get_text('rank', lang):<4} {get_text('location', lang):<20} {get_text('total_latency', lang):<10} {get_text('dns', lang):<8} {get_text('tcp', lang):<8} {get_text('http', lang):<8} {get_text('score', lang)}")
+        print("-" * 70)
+
+        for rank, result in enumerate(successful_tests, 1):
+            print(f"{rank:<4} {result['label']:<20} "
+                  f"{result['total_ms']:6.1f}ms  "
+                  f"{result['dns_ms']:5.1f}ms  "
+                  f"{result['tcp_ms']:5.1f}ms  "
+                  f"{result['http_ms']:5.1f}ms  "
+                  f"{result['score']:3.0f}")
+
+        # 顯示最佳連接
+        best = successful_tests[0]
+        print(f"\n{get_text('best_connection', lang)}: {best['label']} ({best['total_ms']:.1f}ms)")
+
+        # 按地區統計
+        print(f"\n{get_text('region_stats', lang)}")
+        regions = {}
+        for result in successful_tests:
+            region = result['region']
+            if region not in regions:
+                regions[region] = []
+            regions[region].append(result)
+
+        for region, region_results in regions.items():
+            avg_latency = sum(r['total_ms'] for r in region_results) / len(region_results)
+            region_localized = get_text(region, lang)
+            print(f"  {region_localized:<15}: {get_text('avg_latency', lang)} {avg_latency:6.1f}ms ({len(region_results)} {get_text('sites', lang)})")
+
+        anomalies = [r for r in successful_tests if r.get("rtt_anomaly") in ("slow_path", "below_minimum")]
+        if anomalies:
+            print(f"\n{get_text('rtt_anomalies', lang)}")
+            for result in anomalies:
+                print(f"  {result['label']:<20} {get_text(result['rtt_anomaly'], lang)}: "
+                      f"tcp {result['tcp_ms']:.1f}ms / ≥{result['min_rtt_ms']:.1f}ms ({result['distance_km']:.0f} km)")
+
+    else:
+        print(get_text('no_success', lang))
+
+def run_plan_file(args):
+    """--plan：依測試計畫執行 (計畫中的下載與延遲步驟也會一併執行)"""
+    # 延遲匯入：test_plan 本身會匯入本模組
+    from test_plan import PlanError, PlanRunner, describe_plan, format_result, load_plan
+    try:
+        plan = load_plan(args.plan)
+    except (OSError, PlanError) as e:
+        print(f"{get_text('invalid_plan', args.lang)} {args.plan}:")
+        for error in getattr(e, "errors", [str(e)]):
+            print(f"  - {error}")
+        return
+    print("\n".join(describe_plan(plan)))
+    print("=" * 60)
+
+    if args.trace:
+        start_tracing("simple_netcheck")
+    runner = PlanRunner(plan, args.lang, show_progress=False,
+                        on_result=lambda record: print(format_result(record), flush=True))
+    results = runner.run()
+    if runner.interrupted:
+        print(f"\n\n{get_text('interrupted', args.lang)} ({len(results)} {get_text('completed_tests', args.lang)})")
+
+    netcheck_results = [r for r in results if r.get("kind") == "netcheck" and not r.get("skipped")]
+    if netcheck_results:
+        print_ranking(netcheck_results, args.lang)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n{get_text('saved_to', args.lang)} {args.output}")
+    if export_tracing(args.trace, args.trace_format):
+        print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
+
+def run_connection_rate(args):
+    """--connection-rate：對 --target (或本機替身伺服器) 逐步提高每秒新連線數"""
+    port = args.port or (443 if args.https else 80)
+    targets = [(host, port) for host in args.target or []]
+    server = None
+    if args.local_server:
+        server = LocalAcceptServer(backlog=args.local_backlog, max_accept_rate=args.local_accept_rate).start()
+        targets.append(server.address)
+        print(f"{get_text('local_server', args.lang)}: {server.address[0]}:{server.address[1]}")
+    if not targets:
+        print(get_text("connection_rate_needs_target", args.lang))
+        return
+
+    print(get_text("connection_rate_title", args.lang))
+    print("=" * 60)
+    results = []
+    try:
+        for host, target_port in targets:
+            print(f"\n{host}:{target_port}")
+            print(f"  {get_text('target_rate', args.lang):>8} {get_text('achieved_rate', args.lang):>9} {'p50':>9} "
+                  f"{'p90':>9} {'p99':>9} {get_text('failed', args.lang):>8}")
+            result = sweep_connection_rate(host, target_port, args.rates, args.step_seconds, args.concurrency,
+                                           min(args.timeout, 3.0), lang=args.lang, on_step=print_connection_rate_step)
+            result["timestamp"] = dt.datetime.now(dt.timezone.utc).isoformat()
+            print_connection_rate(result, args.lang)
+            results.append(result)
+    except KeyboardInterrupt:
+        print(f"\n\n{get_text('interrupted', args.lang)} ({len(results)}/{len(targets)} {get_text('completed_tests', args.lang)})")
+    finally:
+        if server is not None:
+            server.shutdown()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n{get_text('saved_to', args.lang)} {args.output}")
+    if export_tracing(args.trace, args.trace_format):
+        print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
+
+def run_udp_probe(args):
+    """--udp：對 --target 上的回應程式送出固定速率的 UDP 封包"""
+    # 延遲匯入：udp_probe 本身會匯入本模組
+    from udp_probe import parse_address, udp_probe
+    if not args.target:
+        print(get_text("udp_needs_target", args.lang))
+        return
+    print(get_text("udp_title", args.lang))
+    print("=" * 60)
+    results = []
+    try:
+        for target in args.target:
+            host, port = parse_address(target)
+            result = udp_probe(host, port, args.udp_count, args.udp_rate, args.udp_size)
+            result["timestamp"] = dt.datetime.now(dt.timezone.utc).isoformat()
+            print_udp_probe(result, args.lang)
+            results.append(result)
+    except KeyboardInterrupt:
+        print(f"\n\n{get_text('interrupted', args.lang)} ({len(results)}/{len(args.target)} {get_text('completed_tests', args.lang)})")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n{get_text('saved_to', args.lang)} {args.output}")
+    if export_tracing(args.trace, args.trace_format):
+        print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
+
 def main():
     parser = argparse.ArgumentParser(description="Simple Network Connection Test")
     parser.add_argument("--region", help="Test specific region only")
@@ -309,8 +937,68 @@ def main():
                        help="Choose test site type: global(famous websites), vultr(Vultr datacenters), all(all sites)")
     parser.add_argument("--lang", choices=["en", "zh", "ja"], default="en",
                        help="Display language: en(English), zh(Traditional Chinese), ja(Japanese)")
+    parser.add_argument("--request-rate", action="store_true",
+                       help="Benchmark small HTTP requests over keep-alive connections vs one connection per request")
+    parser.add_argument("--target", nargs="+", help="Hosts for --request-rate (default: selected test sites), --udp or --connection-rate")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per mode and host (default: 100)")
+    parser.add_argument("--pool-size", type=int, default=4, help="Concurrent connections (default: 4)")
+    parser.add_argument("--path", default="/", help="Request path for --request-rate (default: /)")
+    parser.add_argument("--port", type=int,
+                       help="Port for --request-rate / --connection-rate (default: 80, or 443 with --https)")
+    parser.add_argument("--https", action="store_true", help="Use HTTPS for --request-rate")
+    parser.add_argument("--connection-rate", action="store_true",
+                       help="Open short TCP connections at rising rates against --target (or --local-server) "
+                            "to find where SYN / conntrack / NAT limits start failing")
+    parser.add_argument("--rates", type=float, nargs="+", metavar="PER_SEC",
+                       help=f"Connection rates to step through (default: {' '.join(map(str, CONNECTION_RATES))})")
+    parser.add_argument("--step-seconds", type=float, default=3.0, help="Seconds per rate step (default: 3)")
+    parser.add_argument("--concurrency", type=int, default=64,
+                       help="Connections in flight at once for --connection-rate (default: 64)")
+    parser.add_argument("--local-server", action="store_true",
+                       help="Run --connection-rate against an accept-and-close server on 127.0.0.1")
+    parser.add_argument("--local-accept-rate", type=float, metavar="PER_SEC",
+                       help="Throttle the local server's accepts to emulate a gateway limit")
+    parser.add_argument("--local-backlog", type=int, default=128, help="Listen backlog of the local server (default: 128)")
+    parser.add_argument("--udp", action="store_true",
+                       help="Probe UDP jitter, loss, reordering and duplicates against --target responders "
+                            "(run `udp_probe.py serve` on them)")
+    parser.add_argument("--udp-count", type=int, default=100, help="Packets per target for --udp (default: 100)")
+    parser.add_argument("--udp-rate", type=float, default=50.0, help="Packets per second for --udp (default: 50)")
+    parser.add_argument("--udp-size", type=int, default=64, help="Packet size in bytes for --udp (default: 64)")
+    parser.add_argument("--origin", type=parse_origin, metavar="LAT,LON",
+                       help="Your location, used for distance, minimum RTT and RTT anomaly flags")
+    parser.add_argument("--max-distance", type=float, metavar="KM",
+                       help="Skip datacenters farther than this great-circle distance from --origin")
+    parser.add_argument("--plan", metavar="FILE",
+                       help="Run a JSON test plan shared with vultr_speedtest (netcheck, latency and download steps)")
+    parser.add_argument("--max-age", type=parse_duration, metavar="AGE",
+                       help="Reuse results from the local result cache that are newer than AGE (e.g. 90s, 15m, 2h) "
+                            "and only re-test stale sites")
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_PATH, metavar="FILE",
+                       help=f"Result cache used by --max-age (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--record", metavar="FILE",
+                       help="Record each site's DNS/TCP/HTTP timings to a binary session trace "
+                            "(re-score and re-rank later with session_trace.py replay)")
+    parser.add_argument("--trace", metavar="FILE",
+                       help="Record phase timings (resolve/connect/request) to a trace file")
+    parser.add_argument("--trace-format", choices=TRACE_FORMATS, default="chrome",
+                       help="Trace file format: chrome (Perfetto / chrome://tracing) or otlp (OTLP-JSON) (default: chrome)")
 
     args = parser.parse_args()
+    if args.max_distance is not None and args.origin is None:
+        parser.error(get_text("max_distance_needs_origin", args.lang))
+    if args.plan:
+        run_plan_file(args)
+        return
+    if args.trace:
+        start_tracing("simple_netcheck")
+
+    if args.udp:
+        run_udp_probe(args)
+        return
+    if args.connection_rate:
+        run_connection_rate(args)
+        return
 
     # 選擇測試站點
     if args.sites == "global":
@@ -323,7 +1011,9 @@ def main():
     if args.list:
         print(get_text("available_sites", args.lang))
         for site in test_sites:
-            print(f"  {get_localized_site_info(site, args.lang)}")
+            location = locate(site, args.origin)
+            distance = f" ({location['distance_km']:.0f} km, ≥{location['min_rtt_ms']:.1f} ms)" if location else ""
+            print(f"  {get_localized_site_info(site, args.lang)}{distance}")
         return
 
     # 過濾站點
@@ -333,12 +1023,47 @@ def main():
         if not sites_to_test:
             print(f"{get_text('no_region_found', args.lang)} '{args.region}'")
             return
+    if args.max_distance is not None:
+        pruned = [s for s in sites_to_test if not within_distance(s, args.origin, args.max_distance)]
+        sites_to_test = [s for s in sites_to_test if within_distance(s, args.origin, args.max_distance)]
+        if pruned:
+            print(f"{get_text('pruned_by_distance', args.lang)} ({args.max_distance:.0f} km): "
+                  f"{', '.join(s['host'] for s in pruned)}")
+
+    if args.request_rate:
+        hosts = args.target or [site['host'] for site in sites_to_test]
+        print(get_text("request_rate_title", args.lang))
+        print("=" * 60)
+        comparisons = []
+        try:
+            for host in hosts:
+                with get_tracer().span("request_rate", host=host):
+                    comparison = compare_request_rate(host, args.requests, args.pool_size, args.path,
+                                                      args.port, args.https, args.timeout)
+                print_request_rate(comparison, args.lang)
+                comparisons.append(comparison)
+        except KeyboardInterrupt:
+            print(f"\n\n{get_text('interrupted', args.lang)} ({len(comparisons)}/{len(hosts)} {get_text('completed_tests', args.lang)})")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(comparisons, f, ensure_ascii=False, indent=2)
+            print(f"\n{get_text('saved_to', args.lang)} {args.output}")
+        if export_tracing(args.trace, args.trace_format):
+            print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
+        return
 
     print(get_text("title", args.lang))
     print(get_text("subtitle", args.lang))
     print("=" * 60)
 
     results = []
+    # --max-age：沿用快取中夠新的結果，只重測過期的網站
+    cache = ResultCache(args.cache_file) if args.max_age is not None else None
+    writer = None
+    if args.record:
+        # 延遲匯入：session_trace 本身會匯入本模組
+        from session_trace import TraceWriter, record_netcheck
+        writer = TraceWriter(args.record)
 
     try:
         for i, site in enumerate(sites_to_test, 1):
@@ -347,18 +1072,39 @@ def main():
 
             print(f"[{i:2}/{len(sites_to_test)}] {get_text('testing', args.lang)} {label:<20}", end="", flush=True)
 
-            result = test_connection_speed(host, args.timeout, args.lang)
-            result.update({
-                "label": label,
-                "host": host,
-                "region": site['region'],
-                "score": calculate_score(result)
-            })
+            key = cache_key(host, site.get('provider'), "netcheck")
+            result = cache.fresh(key, args.max_age) if cache is not None else None
+            if result is not None:
+                result["label"] = label
+            else:
+                with get_tracer().span("site", host=host):
+                    result = test_connection_speed(host, args.timeout, args.lang)
+                result.update({
+                    "label": label,
+                    "host": host,
+                    "region": site['region'],
+                    "score": calculate_score(result),
+                    "timestamp": dt.datetime.now(dt.timezone.utc).isoformat()
+                })
+                # TCP 連線建立約等於一個 RTT，可與光速下限比較
+                location = locate(site, args.origin)
+                if location is not None:
+                    result.update(location)
+                    if result["success"]:
+                        result.update(rtt_anomaly(result["tcp_ms"], location["min_rtt_ms"]))
+                if cache is not None:
+                    cache.store(key, result)
+                if writer is not None:
+                    record_netcheck(writer, site, result)
 
             results.append(result)
 
             if result["success"]:
-                print(f" ✅ {result['total_ms']:6.1f}ms ({get_text('score', args.lang)}: {result['score']:3.0f})")
+                anomaly = result.get("rtt_anomaly")
+                warning = f" ⚠️ {get_text(anomaly, args.lang)}" if anomaly in ("slow_path", "below_minimum") else ""
+                if result.get("cached"):
+                    warning += f" [{get_text('cached', args.lang)}, {format_age(result['cached_age_s'])}]"
+                print(f" ✅ {result['total_ms']:6.1f}ms ({get_text('score', args.lang)}: {result['score']:3.0f}){warning}")
             else:
                 print(f" ❌ {result['error']}")
 
@@ -368,51 +1114,15 @@ def main():
             print(get_text('no_tests', args.lang))
             return
 
-    # 顯示總結
-    print("\n" + "=" * 60)
-    print(get_text("results_ranking", args.lang))
-
-    successful_tests = [r for r in results if r['success']]
-    if successful_tests:
-        successful_tests.sort(key=lambda x: x['total_ms'])
-
-        print(f"{get_text('rank', args.lang):<4} {get_text('location', args.lang):<20} {get_text('total_latency', args.lang):<10} {get_text('dns', args.lang):<8} {get_text('tcp', args.lang):<8} {get_text('http', args.lang):<8} {get_text('score', args.lang)}")
-        print("-" * 70)
-
-        for rank, result in enumerate(successful_tests, 1):
-            print(f"{rank:<4} {result['label']:<20} "
-                  f"{result['total_ms']:6.1f}ms  "
-                  f"{result['dns_ms']:5.1f}ms  "
-                  f"{result['tcp_ms']:5.1f}ms  "
-                  f"{result['http_ms']:5.1f}ms  "
-                  f"{result['score']:3.0f}")
-
-        # 顯示最佳連接
-        best = successful_tests[0]
-        print(f"\n{get_text('best_connection', args.lang)}: {best['label']} ({best['total_ms']:.1f}ms)")
-
-        # 按地區統計
-        print(f"\n{get_text('region_stats', args.lang)}")
-        regions = {}
-        for result in successful_tests:
-            region = result['region']
-            if region not in regions:
-                regions[region] = []
-            regions[region].append(result)
-
-        for region, region_results in regions.items():
-            avg_latency = sum(r['total_ms'] for r in region_results) / len(region_results)
-            region_localized = get_text(region, args.lang)
-            print(f"  {region_localized:<15}: {get_text('avg_latency', args.lang)} {avg_latency:6.1f}ms ({len(region_results)} {get_text('sites', args.lang)})")
-
-    else:
-        print(get_text('no_success', args.lang))
+    print_ranking(results, args.lang)
 
     # 保存結果
     if args.output:
         with open(args.output, 'w', encoding='utf-8') as f:
             json.dump(results, f, ensure_ascii=False, indent=2)
         print(f"\n{get_text('saved_to', args.lang)} {args.output}")
+    if export_tracing(args.trace, args.trace_format):
+        print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,627 @@
+#!/usr/bin/env python3
+"""
+Test Plans
+以一個 JSON 檔描述機房分組、測試種類、檔案大小、並行數、流量 / 時間預算與輸出位置；
+計畫載入時對照機房目錄驗證一次，再由 PlanRunner 執行。
+vultr_speedtest、simple_netcheck、互動介面與 fleet 代理程式共用同一個執行器
+"""
+
+import argparse
+import datetime as dt
+import http.client
+import json
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from simple_netcheck import ALL_SITES, calculate_score, get_site_label, test_connection_speed
+from tracing import get_tracer
+from vultr_speedtest import (CancelToken, SpeedTestEngine, SpeedTestResult, get_server_by_key_with_zone,
+                             get_server_name, get_test_url, parse_size)
+
+KINDS = ("download", "latency", "netcheck")
+OUTPUT_TYPES = ("json", "ndjson")
+TEST_SIZES = ("100MB", "1GB")
+ZONES = ("vultr", "linode", "hinet")
+# 伺服器沒有宣告 file_size、HEAD 也取不到 Content-Length 時的下載量估計
+TEST_SIZE_BYTES = {"100MB": 100 * 1024 ** 2, "1GB": 1000 * 1024 ** 2}
+
+PLAN_KEYS = ("id", "description", "defaults", "groups", "servers", "steps", "budget", "outputs")
+SETTING_KEYS = ("test_size", "quick", "concurrency", "cooldown", "timeout", "zone", "max_rate", "target_rate")
+STEP_KEYS = SETTING_KEYS + ("kind", "name", "group", "servers", "budget")
+BUDGET_KEYS = ("max_bytes", "max_seconds")
+DEFAULTS = {"test_size": "100MB", "quick": False, "concurrency": 1, "cooldown": 2.0, "timeout": 30,
+            "zone": None, "max_rate": None, "target_rate": None}
+
+class PlanError(ValueError):
+    """測試計畫不合法；errors 列出所有找到的問題"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+def load_plan(path: str) -> Dict[str, Any]:
+    """讀取並驗證測試計畫檔"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            plan = json.load(f)
+    except ValueError as e:
+        raise PlanError([f"{path}: {e}"])
+    return validate_plan(plan)
+
+def unknown_keys(obj: Dict[str, Any], allowed: Iterable[str], where: str) -> List[str]:
+    return [f"{where}: unknown key '{key}'" for key in obj if key not in allowed]
+
+def check_budget(budget: Any, where: str, errors: List[str]) -> Dict[str, Optional[float]]:
+    """整理 {"max_bytes": "5G", "max_seconds": 600}"""
+    if budget is None:
+        return {"max_bytes": None, "max_seconds": None}
+    if not isinstance(budget, dict):
+        errors.append(f"{where}: 'budget' must be an object")
+        return {"max_bytes": None, "max_seconds": None}
+    errors.extend(unknown_keys(budget, BUDGET_KEYS, f"{where} budget"))
+    checked = {"max_bytes": None, "max_seconds": None}
+    if budget.get("max_bytes") is not None:
+        try:
+            checked["max_bytes"] = parse_size(budget["max_bytes"])
+        except ValueError:
+            errors.append(f"{where}: invalid max_bytes {budget['max_bytes']!r}")
+    if budget.get("max_seconds") is not None:
+        if not isinstance(budget["max_seconds"], (int, float)) or budget["max_seconds"] <= 0:
+            errors.append(f"{where}: max_seconds must be a positive number")
+        else:
+            checked["max_seconds"] = float(budget["max_seconds"])
+    return checked
+
+def check_settings(settings: Dict[str, Any], where: str, errors: List[str]):
+    """檢查可在 defaults 與各步驟中設定的參數"""
+    if "test_size" in settings and settings["test_size"] not in TEST_SIZES:
+        errors.append(f"{where}: test_size must be one of {', '.join(TEST_SIZES)}")
+    if "zone" in settings and settings["zone"] is not None and settings["zone"] not in ZONES:
+        errors.append(f"{where}: zone must be one of {', '.join(ZONES)}")
+    if "concurrency" in settings and (not isinstance(settings["concurrency"], int) or settings["concurrency"] < 1):
+        errors.append(f"{where}: concurrency must be an integer >= 1")
+    for key in ("timeout", "max_rate", "target_rate"):
+        value = settings.get(key)
+        if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+            errors.append(f"{where}: {key} must be a positive number")
+    if "cooldown" in settings and (not isinstance(settings["cooldown"], (int, float)) or settings["cooldown"] < 0):
+        errors.append(f"{where}: cooldown must be a number >= 0")
+
+def resolve_catalog(key: str, custom: Dict[str, Dict[str, Any]], zone: Optional[str]) -> Optional[Dict[str, Any]]:
+    if key in custom:
+        return custom[key]
+    return get_server_by_key_with_zone(key, zone)
+
+def netcheck_site(target: Any, custom: Dict[str, Dict[str, Any]], zone: Optional[str]) -> Optional[Dict[str, Any]]:
+    """netcheck 目標：機房鍵值、simple_netcheck 的站點主機名稱、任意主機名稱或 {"host", "label", "region"}"""
+    if isinstance(target, dict):
+        if not target.get("host"):
+            return None
+        return {"host": target["host"], "label": target.get("label"), "region": target.get("region", "")}
+    server = resolve_catalog(target, custom, zone)
+    if server is not None:
+        return {"host": server["host"], "label": target, "region": server.get("region", "custom")}
+    for site in ALL_SITES:
+        if site["host"] == target:
+            return {"host": target, "label": None, "region": site["region"], "site": site}
+    if "." not in target:
+        return None
+    return {"host": target, "label": None, "region": ""}
+
+def validate_plan(plan: Any) -> Dict[str, Any]:
+    """驗證計畫並展開成可直接執行的步驟；所有問題一次列出
+
+    格式：
+        {"id": "nightly",
+         "defaults": {"test_size": "100MB", "quick": true, "cooldown": 2},
+         "groups": {"asia": ["tokyo", "singapore"], "web": ["www.bbc.com"]},
+         "servers": {"lab": {"host": "10.0.0.5", "test_url": "http://10.0.0.5/100MB.bin"}},
+         "steps": [{"kind": "latency", "group": "asia"},
+                   {"kind": "download", "group": ["asia"], "servers": ["lab"], "concurrency": 2},
+                   {"kind": "netcheck", "group": "web", "budget": {"max_seconds": 60}}],
+         "budget": {"max_bytes": "2G", "max_seconds": 900},
+         "outputs": [{"type": "ndjson", "path": "results.ndjson"}]}
+    """
+    if not isinstance(plan, dict):
+        raise PlanError(["plan must be a JSON object"])
+    errors = unknown_keys(plan, PLAN_KEYS, "plan")
+
+    custom = plan.get("servers", {})
+    if not isinstance(custom, dict):
+        errors.append("'servers' must be an object")
+        custom = {}
+    for key, server in custom.items():
+        if not isinstance(server, dict) or not server.get("host"):
+            errors.append(f"custom server '{key}' needs a 'host'")
+    custom = {key: server for key, server in custom.items() if isinstance(server, dict) and server.get("host")}
+
+    defaults = plan.get("defaults", {})
+    if not isinstance(defaults, dict):
+        errors.append("'defaults' must be an object")
+        defaults = {}
+    errors.extend(unknown_keys(defaults, SETTING_KEYS, "defaults"))
+    check_settings(defaults, "defaults", errors)
+    defaults = dict(DEFAULTS, **{key: value for key, value in defaults.items() if key in SETTING_KEYS})
+
+    groups = plan.get("groups", {})
+    if not isinstance(groups, dict) or not all(isinstance(members, list) for members in groups.values()):
+        errors.append("'groups' must map group names to lists of servers")
+        groups = {}
+
+    outputs = plan.get("outputs", [])
+    if not isinstance(outputs, list):
+        errors.append("'outputs' must be a list")
+        outputs = []
+    for i, output in enumerate(outputs):
+        if not isinstance(output, dict) or output.get("type") not in OUTPUT_TYPES or not output.get("path"):
+            errors.append(f"output #{i}: needs 'type' ({', '.join(OUTPUT_TYPES)}) and 'path'")
+
+    steps = plan.get("steps")
+    if not isinstance(steps, list) or not steps:
+        errors.append("plan needs a non-empty 'steps' list")
+        steps = []
+
+    validated_steps = []
+    for i, step in enumerate(steps):
+        where = f"step #{i}"
+        if not isinstance(step, dict):
+            errors.append(f"{where}: must be an object")
+            continue
+        errors.extend(unknown_keys(step, STEP_KEYS, where))
+        kind = step.get("kind")
+        if kind not in KINDS:
+            errors.append(f"{where}: 'kind' must be one of {', '.join(KINDS)}")
+            continue
+        check_settings(step, where, errors)
+        settings = {key: step.get(key, defaults[key]) for key in SETTING_KEYS}
+
+        # 依序合併 group 與 servers，重複的目標只測一次
+        names = step.get("group", [])
+        names = [names] if isinstance(names, str) else names
+        members: List[Any] = []
+        for name in names:
+            if name not in groups:
+                errors.append(f"{where}: unknown group '{name}'")
+            else:
+                members.extend(groups[name])
+        members.extend(step.get("servers", []))
+        if not members:
+            errors.append(f"{where}: needs 'group' or 'servers'")
+
+        targets = []
+        seen = set()
+        for member in members:
+            if kind == "netcheck":
+                site = netcheck_site(member, custom, settings["zone"]) if isinstance(member, (str, dict)) else None
+                if site is None:
+                    errors.append(f"{where}: invalid netcheck target {member!r}")
+                    continue
+                if site["host"] not in seen:
+                    seen.add(site["host"])
+                    targets.append(site)
+            elif not isinstance(member, str) or resolve_catalog(member, custom, settings["zone"]) is None:
+                zone_info = f" in zone '{settings['zone']}'" if settings["zone"] else ""
+                errors.append(f"{where}: server {member!r} not found{zone_info}")
+            elif member not in seen:
+                seen.add(member)
+                targets.append(member)
+
+        validated_steps.append(dict(settings, kind=kind, name=step.get("name") or f"{i}:{kind}",
+                                    targets=targets, budget=check_budget(step.get("budget"), where, errors)))
+
+    budget = check_budget(plan.get("budget"), "plan", errors)
+    if errors:
+        raise PlanError(errors)
+    return {
+        "id": str(plan.get("id") or dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")),
+        "description": plan.get("description", ""),
+        "servers": custom,
+        "steps": validated_steps,
+        "budget": budget,
+        "outputs": outputs,
+    }
+
+def head_content_length(url: str, timeout: float = 10.0) -> Optional[int]:
+    """以 HEAD 取得測試檔案的 Content-Length；失敗時回傳 None"""
+    request = urllib.request.Request(url, method="HEAD", headers={"User-Agent": "Vultr-SpeedTest/1.0"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            length = response.headers.get("Content-Length")
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+    return int(length) if length and length.isdigit() else None
+
+def count_tests(plan: Dict[str, Any]) -> int:
+    return sum(len(step["targets"]) for step in plan["steps"])
+
+class Budget:
+    """流量與時間預算；時間用完時取消所有進行中的測試"""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_seconds: Optional[float] = None, label: str = "plan"):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.label = label
+        self.used_bytes = 0
+        self.reserved_bytes = 0
+        self.started = time.monotonic()
+        self.reason: Optional[str] = None
+        self.tokens: set = set()
+        self.lock = threading.Lock()
+        self.timer: Optional[threading.Timer] = None
+
+    def start(self):
+        self.started = time.monotonic()
+        if self.max_seconds is not None:
+            self.timer = threading.Timer(self.max_seconds, self.expire)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+    def expire(self):
+        self.cancel(f"{self.label} time budget exhausted ({self.max_seconds:g}s)")
+
+    def cancel(self, reason: str):
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason
+            tokens = list(self.tokens)
+        for token in tokens:
+            token.cancel(reason)
+
+    def check(self, estimate: int) -> Optional[str]:
+        """estimate 為下一項測試最多可能下載的位元組數；進行中的測試以其估計值計入"""
+        with self.lock:
+            return self._check(estimate)
+
+    def _check(self, estimate: int) -> Optional[str]:
+        if self.reason is not None:
+            return self.reason
+        if self.max_bytes is not None and self.used_bytes + self.reserved_bytes + estimate > self.max_bytes:
+            return (f"{self.label} byte budget exhausted "
+                    f"({self.used_bytes / 1024 ** 2:.0f}/{self.max_bytes / 1024 ** 2:.0f} MiB used)")
+        return None
+
+    def admit(self, token: CancelToken, estimate: int) -> Optional[str]:
+        """預算足夠時保留 estimate 並登記 token；不足時回傳原因"""
+        with self.lock:
+            reason = self._check(estimate)
+            if reason is None:
+                self.tokens.add(token)
+                self.reserved_bytes += estimate
+        return reason
+
+    def release(self, token: CancelToken, estimate: int, used_bytes: int):
+        with self.lock:
+            self.tokens.discard(token)
+            self.reserved_bytes -= estimate
+            self.used_bytes += used_bytes
+
+class PlanOutputs:
+    """計畫中的輸出：ndjson 邊測邊附加，json 在結束時寫入完整陣列"""
+
+    def __init__(self, outputs: List[Dict[str, Any]]):
+        self.outputs = outputs
+        self.streams = []
+        self.records: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def open(self):
+        self.streams = [open(output["path"], "a", encoding="utf-8")
+                        for output in self.outputs if output["type"] == "ndjson"]
+
+    def write(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.records.append(record)
+            for stream in self.streams:
+                stream.write(line)
+                stream.flush()
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+        for output in self.outputs:
+            if output["type"] == "json":
+                with open(output["path"], "w", encoding="utf-8") as f:
+                    json.dump(self.records, f, ensure_ascii=False, indent=2)
+
+    @property
+    def paths(self) -> List[str]:
+        return [output["path"] for output in self.outputs]
+
+class PlanRunner:
+    """執行已驗證的計畫
+
+    listeners 會訂閱每個步驟的 SpeedTestEngine (例如 ConsoleReporter)；
+    on_result 在每項結果 (含因預算而略過的項目) 產生時呼叫。
+    exclude(step, server) 回傳原因時，該機房不測試並記錄為略過 (例如 --max-distance 與已知失效的測試檔)。
+    """
+
+    def __init__(self, plan: Dict[str, Any], lang: str = "en", show_progress: bool = True,
+                 engine_factory: Callable[..., SpeedTestEngine] = SpeedTestEngine,
+                 listeners: Iterable[Callable] = (), on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 write_outputs: bool = True,
+                 exclude: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Optional[str]]] = None):
+        self.plan = plan
+        self.exclude = exclude
+        self.lang = lang
+        self.show_progress = show_progress
+        self.engine_factory = engine_factory
+        self.listeners = list(listeners)
+        self.on_result = on_result
+        self.outputs = PlanOutputs(plan["outputs"] if write_outputs else [])
+        self.budget = Budget(plan["budget"]["max_bytes"], plan["budget"]["max_seconds"])
+        self.results: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.interrupted = False
+        # 測試檔案 URL → 估計的下載位元組數
+        self.file_sizes: Dict[str, int] = {}
+
+    def cancel(self, reason: str = "cancelled"):
+        """中止計畫：進行中的測試以 partial 結果結束，其餘項目標記為略過"""
+        self.budget.cancel(reason)
+
+    def run(self) -> List[Dict[str, Any]]:
+        """依序執行各步驟；被 Ctrl+C 中斷時回傳已完成的結果"""
+        self.results = []
+        self.interrupted = False
+        self.outputs.open()
+        self.budget.start()
+        try:
+            for index, step in enumerate(self.plan["steps"]):
+                with get_tracer().span("plan_step", step=step["name"], kind=step["kind"],
+                                       targets=len(step["targets"])):
+                    self.run_step(index, step)
+        except KeyboardInterrupt as e:
+            self.interrupted = True
+            self.budget.cancel("interrupted")
+            partial = getattr(e, "result", None)
+            if isinstance(partial, dict):
+                self.record(partial, None)
+        finally:
+            self.budget.stop()
+            self.outputs.close()
+        return self.results
+
+    def create_engine(self, step: Dict[str, Any], show_progress: bool) -> SpeedTestEngine:
+        engine = self.engine_factory(step["test_size"], step["quick"], self.lang, step["zone"], step["cooldown"],
+                                     step["timeout"], show_progress, max_rate=step["max_rate"],
+                                     target_rate=step["target_rate"])
+        engine.custom_servers = self.plan["servers"]
+        for listener in self.listeners:
+            engine.subscribe(listener)
+        return engine
+
+    def run_step(self, index: int, step: Dict[str, Any]):
+        budget = Budget(step["budget"]["max_bytes"], step["budget"]["max_seconds"], f"step {step['name']}")
+        budget.start()
+        try:
+            concurrency = min(step["concurrency"], len(step["targets"]))
+            if concurrency <= 1:
+                engine = self.create_engine(step, self.show_progress)
+                for i, target in enumerate(step["targets"]):
+                    if (i > 0 and step["kind"] == "download" and step["cooldown"] > 0
+                            and not self.skip_reason(step, budget, target)):
+                        with get_tracer().span("cooldown", seconds=step["cooldown"]):
+                            time.sleep(step["cooldown"])
+                    self.run_target(index, step, target, engine, budget)
+            else:
+                # 每個目標使用自己的引擎 (引擎的監聽者與狀態不是執行緒安全的)；
+                # 並行時進度列會互相覆蓋，只保留結果輸出
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    futures = [pool.submit(self.run_target, index, step, target, self.create_engine(step, False), budget)
+                               for target in step["targets"]]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except KeyboardInterrupt:
+                        budget.cancel("interrupted")
+                        raise
+        finally:
+            budget.stop()
+
+    def limits_bytes(self, budget: Budget) -> bool:
+        return self.budget.max_bytes is not None or budget.max_bytes is not None
+
+    def estimate(self, step: Dict[str, Any], target: Any, budget: Budget) -> int:
+        """下載量估計：伺服器宣告的 file_size，其次為 HEAD 回報的 Content-Length，都沒有時為測試大小
+
+        估計值即為該次下載的位元組上限，因此實際下載量不會超出流量預算。
+        """
+        if step["kind"] != "download":
+            return 0
+        fallback = TEST_SIZE_BYTES[step["test_size"]]
+        if not self.limits_bytes(budget):
+            return fallback
+        server = resolve_catalog(target, self.plan["servers"], step["zone"])
+        if server is None:
+            return fallback
+        if server.get("file_size"):
+            return parse_size(server["file_size"])
+        url = get_test_url(server, step["test_size"])
+        if not url:
+            return fallback
+        with self.lock:
+            size = self.file_sizes.get(url)
+        if size is None:
+            size = head_content_length(url, float(step["timeout"])) or fallback
+            with self.lock:
+                self.file_sizes[url] = size
+        return size
+
+    def excluded(self, step: Dict[str, Any], target: Any) -> Optional[str]:
+        if self.exclude is None or step["kind"] == "netcheck":
+            return None
+        server = resolve_catalog(target, self.plan["servers"], step["zone"])
+        return self.exclude(step, server) if server is not None else None
+
+    def skip_reason(self, step: Dict[str, Any], budget: Budget, target: Any) -> Optional[str]:
+        reason = self.excluded(step, target)
+        if reason is not None:
+            return reason
+        estimate = self.estimate(step, target, budget)
+        return self.budget.check(estimate) or budget.check(estimate)
+
+    def run_target(self, index: int, step: Dict[str, Any], target: Any, engine: SpeedTestEngine,
+                   budget: Budget) -> Dict[str, Any]:
+        reason = self.excluded(step, target)
+        if reason is not None:
+            return self.record(self.skipped(step, target, reason), step, index)
+        token = CancelToken()
+        estimate = self.estimate(step, target, budget)
+        reason = self.budget.admit(token, estimate)
+        if reason is None:
+            reason = budget.admit(token, estimate)
+            if reason is not None:
+                self.budget.release(token, estimate, 0)
+        if reason is not None:
+            return self.record(self.skipped(step, target, reason), step, index)
+
+        result: Dict[str, Any] = {}
+        try:
+            if step["kind"] == "download":
+                result = engine.run_server(target, token, estimate if self.limits_bytes(budget) else None)
+            elif step["kind"] == "latency":
+                result = self.run_latency(engine, target, token)
+            else:
+                result = self.run_netcheck(step, target)
+        except KeyboardInterrupt as e:
+            partial = getattr(e, "result", None)
+            if isinstance(partial, dict):
+                self.annotate(partial, step, index)
+            raise
+        finally:
+            # 沿用快取的結果沒有實際下載
+            used = 0 if result.get("cached") else result.get("downloaded_bytes", 0)
+            self.budget.release(token, estimate, used)
+            budget.release(token, estimate, used)
+        return self.record(result, step, index)
+
+    def run_latency(self, engine: SpeedTestEngine, key: str, token: CancelToken) -> SpeedTestResult:
+        server = engine.resolve_server(key)
+        with get_tracer().span("latency", host=server["host"]) as span:
+            ping_ms = span["ping_ms"] = engine.measure_ping(server, engine.create_speed_test(), token)
+        result = SpeedTestResult(
+            server_key=key,
+            server_name=get_server_name(server, self.lang),
+            server_host=server["host"],
+            region=server["region"],
+            provider=server["provider"],
+            ping_ms=ping_ms,
+            success=ping_ms > 0,
+            timestamp=dt.datetime.now(dt.timezone.utc).isoformat()
+        )
+        if ping_ms <= 0:
+            result["error"] = "ping failed"
+        return result
+
+    def run_netcheck(self, step: Dict[str, Any], site: Dict[str, Any]) -> Dict[str, Any]:
+        host = site["host"]
+        with get_tracer().span("site", host=host):
+            result = test_connection_speed(host, float(step["timeout"]), self.lang)
+        label = site["label"] or (get_site_label(site["site"], self.lang) if "site" in site else host)
+        result.update({
+            "label": label,
+            "host": host,
+            "region": site["region"],
+            "score": calculate_score(result),
+            "timestamp": dt.datetime.now(dt.timezone.utc).isoformat()
+        })
+        return result
+
+    def skipped(self, step: Dict[str, Any], target: Any, reason: str) -> Dict[str, Any]:
+        if step["kind"] == "netcheck":
+            return {"host": target["host"], "label": target["label"] or target["host"], "region": target["region"],
+                    "success": False, "skipped": True, "error": reason}
+        return SpeedTestResult(server_key=target, server_name=target, skipped=True, error=reason)
+
+    def annotate(self, result: Dict[str, Any], step: Dict[str, Any], index: int):
+        result.update({"kind": step["kind"], "plan_id": self.plan["id"], "step": index, "step_name": step["name"]})
+
+    def record(self, result: Dict[str, Any], step: Optional[Dict[str, Any]], index: Optional[int] = None) -> Dict[str, Any]:
+        if step is not None and "kind" not in result:
+            self.annotate(result, step, index)
+        with self.lock:
+            self.results.append(result)
+        self.outputs.write(result)
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+def succeeded(record: Dict[str, Any]) -> bool:
+    """下載結果以有無速度判斷，其餘以 success 欄位判斷"""
+    return bool(record.get("success", "download_mbps" in record))
+
+def format_result(record: Dict[str, Any]) -> str:
+    """結果的單行摘要 (fleet 的紀錄會加上代理程式名稱)"""
+    prefix = f"[{record['agent']}] " if record.get("agent") else ""
+    kind = record.get("kind", "download" if "server_key" in record else "netcheck")
+    name = record.get("server_key") or record.get("label") or record.get("host", "")
+    if record.get("skipped"):
+        return f"{prefix}{kind} {name}: skipped ({record.get('error')})"
+    suffix = " (cached)" if record.get("cached") else ""
+    if kind == "download" and "download_mbps" in record:
+        return f"{prefix}{kind} {name}: {record['download_mbps']:.1f} Mbps | ping {record['ping_ms']:.1f} ms{suffix}"
+    if kind == "latency" and record.get("success"):
+        return f"{prefix}{kind} {name}: {record['ping_ms']:.1f} ms"
+    if kind == "netcheck" and record.get("success"):
+        return f"{prefix}{kind} {name}: {record['total_ms']:.1f} ms (score {record.get('score', 0):.0f})"
+    return f"{prefix}{kind} {name}: {record.get('error')}"
+
+def describe_plan(plan: Dict[str, Any]) -> List[str]:
+    """驗證後的計畫摘要，供 --check 與執行前顯示"""
+    lines = [f"Plan '{plan['id']}': {len(plan['steps'])} steps, {count_tests(plan)} tests"]
+    for step in plan["steps"]:
+        targets = [target["host"] if isinstance(target, dict) else target for target in step["targets"]]
+        options = f"{step['test_size']}{' quick' if step['quick'] else ''}, " if step["kind"] == "download" else ""
+        lines.append(f"  {step['name']:<16} {step['kind']:<9} {options}x{step['concurrency']}: {', '.join(targets)}")
+    budget = plan["budget"]
+    if budget["max_bytes"] is not None or budget["max_seconds"] is not None:
+        limits = []
+        if budget["max_bytes"] is not None:
+            limits.append(f"{budget['max_bytes'] / 1024 ** 2:.0f} MiB")
+        if budget["max_seconds"] is not None:
+            limits.append(f"{budget['max_seconds']:g}s")
+        lines.append(f"  budget: {', '.join(limits)}")
+    for output in plan["outputs"]:
+        lines.append(f"  output: {output['type']} -> {output['path']}")
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate or run a JSON test plan")
+    parser.add_argument("plan", help="Test plan JSON file")
+    parser.add_argument("--check", action="store_true", help="Only validate the plan and print the expanded steps")
+    parser.add_argument("--lang", choices=["en", "zh", "ja"], default="en", help="Display language")
+    parser.add_argument("--no-progress", action="store_true", help="Disable progress display")
+    args = parser.parse_args()
+
+    try:
+        plan = load_plan(args.plan)
+    except (OSError, PlanError) as e:
+        errors = e.errors if isinstance(e, PlanError) else [str(e)]
+        sys.exit("invalid plan:\n  " + "\n  ".join(errors))
+    print("\n".join(describe_plan(plan)))
+    if args.check:
+        return
+
+    from vultr_speedtest import ConsoleReporter
+    reporter = ConsoleReporter(args.lang, not args.no_progress)
+
+    def on_result(record: Dict[str, Any]):
+        if record.get("kind") != "download" or record.get("skipped"):
+            print(format_result(record), flush=True)
+
+    runner = PlanRunner(plan, args.lang, not args.no_progress, listeners=[reporter], on_result=on_result)
+    results = runner.run()
+    print(f"\n{sum(1 for r in results if succeeded(r))}/{count_tests(plan)} tests succeeded")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""測試共用的設定：匯入專案根目錄的模組，並提供本機的測試檔伺服器"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_doctor import MockCatalogServer  # noqa: E402
+from vultr_speedtest import SpeedTestEngine  # noqa: E402
+
+class LocalEngine(SpeedTestEngine):
+    """本機伺服器用的引擎：不執行 ping (每次約需 2 秒)，只量測下載"""
+
+    def measure_ping(self, server, speed_test, cancel_token=None) -> float:
+        return -1
+
+@pytest.fixture(scope="session")
+def file_server():
+    """/<N>MB.bin 回應 N MiB 的資料並支援 HEAD (catalog_doctor 的模擬伺服器)"""
+    server = MockCatalogServer(("127.0.0.1", 0)).start()
+    yield server.base_url
+    server.stop()
@@ -0,0 +1,66 @@
+"""anomaly：EWMA / CUSUM 基準與告警 (user-044)"""
+
+import random
+
+from anomaly import AnomalyDetector, MetricBaseline, record_metrics, server_id
+
+def download(value: float, **fields):
+    return dict(fields, server_key="tokyo", test_size="100MB", quick_test=False, success=True,
+                download_mbps=value)
+
+def feed(detector, values, **fields):
+    return [detector.observe(download(value, **fields)) for value in values]
+
+def test_ewma_converges_to_mean():
+    baseline = MetricBaseline()
+    for value in [100.0] * 50:
+        baseline.update(value, 0.1)
+    assert abs(baseline.mean - 100.0) < 1e-9
+    assert baseline.var < 1e-9
+
+def test_warmup_never_alarms():
+    detector = AnomalyDetector(warmup=5)
+    assert feed(detector, [100, 10, 500, 1, 100]) == [[]] * 5
+
+def test_sudden_drop_triggers_ewma():
+    rng = random.Random(1)
+    detector = AnomalyDetector()
+    assert not any(feed(detector, [100 + rng.uniform(-2, 2) for _ in range(30)]))
+    anomalies = detector.observe(download(20.0))
+    assert [a["detector"] for a in anomalies] == ["ewma"]
+    assert anomalies[0]["direction"] == "drop" and anomalies[0]["server"] == "tokyo@100MB"
+
+def test_gradual_drift_triggers_cusum():
+    rng = random.Random(2)
+    detector = AnomalyDetector()
+    feed(detector, [100 + rng.uniform(-2, 2) for _ in range(30)])
+    # 每筆只低約 1.5 個標準差：EWMA 不會告警，累積後由 CUSUM 抓到
+    drifted = feed(detector, [92.0] * 10)
+    detectors = [a["detector"] for anomalies in drifted for a in anomalies]
+    assert detectors and set(detectors) == {"cusum"}
+
+def test_improvement_does_not_alarm():
+    detector = AnomalyDetector()
+    feed(detector, [100.0] * 20)
+    assert detector.observe(download(400.0)) == []
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / "state.json")
+    detector = AnomalyDetector(path)
+    feed(detector, [100.0] * 10)
+    restored = AnomalyDetector(path)
+    baseline = restored.servers["tokyo@100MB"]["download_mbps"]
+    assert baseline.count == 10 and abs(baseline.mean - 100.0) < 1e-9
+
+def test_paced_and_partial_runs_are_not_learned():
+    assert record_metrics(download(50.0, max_rate_mbit_s=50.0)) == []
+    assert record_metrics(download(50.0, target_rate={"mbit_s": 50.0})) == []
+    assert record_metrics(download(50.0, partial_reason="interrupted")) == []
+    assert record_metrics(download(50.0, cached=True)) == []
+    assert record_metrics(download(50.0, partial_reason="deadline")) == [("download_mbps", 50.0, True)]
+
+def test_server_id_separates_size_and_quick_mode():
+    assert server_id(download(1)) == "tokyo@100MB"
+    assert server_id(dict(download(1), test_size="1GB", quick_test=True)) == "tokyo@1GB/quick"
+    assert server_id(dict(download(1), agent="node-a")) == "node-a/tokyo@100MB"
+    assert server_id({"host": "www.google.com", "total_ms": 30.0}) == "www.google.com"
@@ -0,0 +1,84 @@
+"""interactive_vultr_test.BackgroundRunner：佇列、跳過與取消 (user-030)"""
+
+import time
+
+from conftest import LocalEngine
+from interactive_vultr_test import BackgroundRunner
+from vultr_speedtest import SpeedTestEvent
+
+def lab_runner(file_server) -> BackgroundRunner:
+    # 與互動介面相同開啟進度事件 (狀態列使用；引擎本身不輸出)
+    engine = LocalEngine(show_progress=True, cooldown=0)
+    engine.custom_servers = {
+        "small": {"host": "127.0.0.1", "test_url": f"{file_server}/1MB.bin"},
+        # 夠大，取消前不會下載完
+        "huge": {"host": "127.0.0.1", "test_url": f"{file_server}/100000MB.bin"},
+    }
+    return BackgroundRunner(engine)
+
+def wait_for(runner: BackgroundRunner, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while runner.is_running() and time.monotonic() < deadline:
+        runner.wait(0.1)
+    assert not runner.is_running()
+
+def wait_until_downloading(runner: BackgroundRunner, key: str, timeout: float = 10.0):
+    """等到 key 已開始傳輸 (有進度)，取消時才會留下部分結果"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = runner.status()
+        if status["current"] == key and status["progress"]:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"{key} did not start downloading")
+
+def test_enqueue_after_worker_drains(file_server):
+    runner = lab_runner(file_server)
+    runner.enqueue(["small"])
+    wait_for(runner)
+    assert runner.thread is None
+    # 前一個執行緒已結束，新的項目必須由新的執行緒執行
+    runner.enqueue(["small", "small"])
+    wait_for(runner)
+    assert [r.success for r in runner.results] == [True, True, True]
+    assert runner.status() == {"completed": 3, "total": 3, "current": None, "progress": None}
+
+def test_skip_current_keeps_partial_result(file_server):
+    runner = lab_runner(file_server)
+    runner.enqueue(["huge", "small"])
+    wait_until_downloading(runner, "huge")
+    assert runner.skip_current() == "huge"
+    wait_for(runner)
+    assert runner.results[0].partial_reason == "skipped"
+    assert runner.results[1].success and not runner.results[1].partial
+
+def test_enqueue_after_cancel_runs_new_keys(file_server):
+    runner = lab_runner(file_server)
+    runner.enqueue(["huge", "small", "small"])
+    wait_until_downloading(runner, "huge")
+    runner.cancel_all()
+    # 工作執行緒可能還在結束中；新項目不能因為 stop_event 被遺留在佇列裡
+    runner.enqueue(["small"])
+    wait_for(runner)
+    assert [r.server_key for r in runner.results] == ["huge", "small"]
+    assert runner.results[-1].success
+    assert runner.status()["total"] == 2
+
+def test_failing_listener_records_error_and_keeps_worker(file_server):
+    runner = lab_runner(file_server)
+    failures = ["state file is read-only"]
+
+    def failing_listener(event: SpeedTestEvent):
+        # 只讓第一個結果事件失敗，模擬寫入狀態檔時的 OSError
+        if event.kind == SpeedTestEvent.RESULT and failures:
+            raise OSError(failures.pop())
+
+    runner.engine.subscribe(failing_listener)
+    runner.enqueue(["small", "small"])
+    wait_for(runner)
+    assert runner.thread is None
+    assert runner.results[0].error == "OSError: state file is read-only"
+    assert runner.results[1].success
+    runner.enqueue(["small"])
+    wait_for(runner)
+    assert [r.success for r in runner.results] == [False, True, True]
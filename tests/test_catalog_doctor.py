@@ -0,0 +1,75 @@
+"""catalog_doctor：模擬目錄的判定、略過已知失效的機房與 check --mock (user-050)"""
+
+import datetime as dt
+
+import pytest
+
+import catalog_doctor
+from catalog_doctor import (HealthCache, MockCatalogServer, catalog_entries, mock_catalog, run_doctor,
+                            skip_known_bad)
+from vultr_speedtest import get_server_by_key_with_zone, get_test_url
+
+EXPECTED = {"good": "ok", "good_1g": "ok",
+            "moved": "warn", "noranges": "warn", "slow": "warn", "nohead": "warn",
+            "missing": "bad", "error": "bad", "truncated": "bad", "loop": "bad", "down": "bad"}
+
+@pytest.fixture(scope="module")
+def mock_server():
+    # slow 項目延遲 0.3 秒，搭配 slow_ms=200 判定為 warn
+    server = MockCatalogServer(("127.0.0.1", 0), slow_ms=300).start()
+    yield server
+    server.stop()
+
+def mock_entries(base_url):
+    servers = mock_catalog(base_url)["servers"]
+    for key, server in servers.items():
+        server.update(key=key, region="mock", provider="mock")
+    return list(catalog_entries(servers))
+
+def test_mock_catalog_verdicts(mock_server):
+    cache = HealthCache(None)
+    results = run_doctor(mock_entries(mock_server.base_url), cache, timeout=5, slow_ms=200)
+    assert {r["key"]: r["health"] for r in results} == EXPECTED
+    problems = {r["key"]: "; ".join(r["problems"]) for r in results}
+    assert problems["missing"] == "HTTP 404" and problems["error"] == "HTTP 503"
+    assert "Content-Length 10.0 MiB" in problems["truncated"]
+    assert "HEAD not supported" in problems["nohead"]
+    assert "no Accept-Ranges" in problems["noranges"]
+    assert problems["moved"].startswith("redirected (1x)")
+    # 結果留在記憶體快取，下一次直接沿用
+    again = run_doctor(mock_entries(mock_server.base_url), cache, timeout=5, slow_ms=200)
+    assert all(r["cached"] for r in again)
+
+def known_bad_record(url, health="bad"):
+    return {"url": url, "health": health, "problems": ["HTTP 404"],
+            "timestamp": dt.datetime.now(dt.timezone.utc).isoformat()}
+
+def test_skip_known_bad_drops_only_bad_keys():
+    keys = ["tokyo", "singapore", "frankfurt"]
+    cache = HealthCache(None)
+    urls = {key: get_test_url(get_server_by_key_with_zone(key, None), "100MB") for key in keys}
+    cache.store(known_bad_record(urls["tokyo"]), ttl=3600)
+    cache.store(known_bad_record(urls["singapore"], health="warn"), ttl=3600)
+    # 其他大小的測試檔失效不影響本次測試
+    cache.store(known_bad_record(get_test_url(get_server_by_key_with_zone("frankfurt", None), "1GB")), ttl=3600)
+    kept, skipped = skip_known_bad(keys, None, "100MB", cache)
+    assert kept == ["singapore", "frankfurt"]
+    assert [key for key, _ in skipped] == ["tokyo"]
+    assert skipped[0][1]["problems"] == ["HTTP 404"]
+
+def test_expired_bad_record_is_not_skipped():
+    cache = HealthCache(None)
+    url = get_test_url(get_server_by_key_with_zone("tokyo", None), "100MB")
+    record = known_bad_record(url)
+    record["timestamp"] = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=2)).isoformat()
+    cache.store(record, ttl=3600)
+    assert skip_known_bad(["tokyo"], None, "100MB", cache) == (["tokyo"], [])
+
+def test_check_mock_does_not_touch_health_file(tmp_path, monkeypatch, capsys):
+    health_file = tmp_path / "health.json"
+    monkeypatch.setattr("sys.argv", ["catalog_doctor.py", "check", "--mock", "--slow-ms", "200",
+                                     "--health-file", str(health_file)])
+    with pytest.raises(SystemExit):
+        catalog_doctor.main()
+    assert "2 ok, 4 warnings, 5 bad" in capsys.readouterr().out
+    assert not health_file.exists()
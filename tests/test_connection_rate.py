@@ -0,0 +1,47 @@
+"""連線速率階梯 (user-046)：對本機 LocalAcceptServer 以 IPv4 與 IPv6 執行"""
+
+import socket
+
+import pytest
+
+from simple_netcheck import LocalAcceptServer, sweep_connection_rate, test_connection_rate as connection_rate
+
+def has_ipv6() -> bool:
+    if not socket.has_ipv6:
+        return False
+    try:
+        with socket.socket(socket.AF_INET6, socket.SOCK_STREAM) as sock:
+            sock.bind(("::1", 0))
+    except OSError:
+        return False
+    return True
+
+@pytest.fixture(params=["127.0.0.1", "::1"])
+def accept_server(request):
+    if request.param == "::1" and not has_ipv6():
+        pytest.skip("IPv6 loopback unavailable")
+    server = LocalAcceptServer(host=request.param).start()
+    yield server
+    server.shutdown()
+
+def test_sweep_completes_without_onset(accept_server):
+    host, port = accept_server.address[:2]
+    result = sweep_connection_rate(host, port, rates=[20, 40], duration=0.25, concurrency=8)
+    assert result["ip"] == host
+    assert result["onset"] is None
+    assert [step["failed"] for step in result["steps"]] == [0, 0]
+    assert [step["connected"] for step in result["steps"]] == [5, 10]
+    assert result["max_connections_per_sec"] > 0
+
+def test_refused_connections_are_counted(accept_server):
+    sockaddr = accept_server.address
+    accept_server.shutdown()
+    step = connection_rate(sockaddr, 20, duration=0.25, concurrency=4, timeout=1.0)
+    assert step["connected"] == 0
+    assert step["failures"] == {"refused": 5}
+
+def test_unexpected_errors_do_not_kill_workers():
+    # 格式錯誤的位址會讓 connect 拋出非 OSError 的例外，仍應逐次記為失敗
+    step = connection_rate(("127.0.0.1", "not-a-port"), 20, duration=0.25, concurrency=4)
+    assert step["failed"] == step["attempts"] == 5
+    assert step["failures"] == {"other": 5}
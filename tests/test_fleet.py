@@ -0,0 +1,70 @@
+"""fleet：同一上行鏈路的代理程式依序執行，協調器收集串流結果 (user-039)"""
+
+import json
+import threading
+
+import pytest
+
+from conftest import LocalEngine
+from fleet import AgentEndpoint, AgentServer, Coordinator, FleetAgent, is_loopback, parse_listen
+from test_plan import succeeded
+
+def lab_plan(file_server):
+    return {"id": "fleet-test", "defaults": {"cooldown": 0},
+            "servers": {key: {"host": "127.0.0.1", "test_url": f"{file_server}/2MB.bin", "file_size": "2MB"}
+                        for key in ("lab1", "lab2")},
+            "steps": [{"kind": "download", "servers": ["lab1", "lab2"]}]}
+
+@pytest.fixture
+def agents():
+    """兩個共用上行鏈路 u1 的代理程式"""
+    servers = []
+    for name in ("a1", "a2"):
+        agent = FleetAgent(name, uplink="u1", token="s3cret", engine_factory=LocalEngine)
+        server = AgentServer(("127.0.0.1", 0), agent)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    yield [AgentEndpoint(f"127.0.0.1:{server.server_address[1]}") for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_shared_uplink_runs_do_not_overlap(agents, file_server):
+    coordinator = Coordinator(agents, lab_plan(file_server), token="s3cret", timeout=30)
+    records = coordinator.run()
+
+    assert [agent.name for agent in agents] == ["a1", "a2"]
+    assert all(agent.uplink == "u1" for agent in agents)
+    runs = sorted(coordinator.runs, key=lambda r: r["started"])
+    # 沒收到 plan_end 的串流會被記為 "stream ended before plan_end"
+    assert [run["error"] for run in runs] == [None, None]
+    assert [run["completed"] for run in runs] == [2, 2]
+    assert runs[1]["started"] >= runs[0]["finished"]
+
+    assert len(records) == 4
+    assert sorted((r["agent"], r["test_index"]) for r in records) == [("a1", 0), ("a1", 1), ("a2", 0), ("a2", 1)]
+    assert all(succeeded(r) and r["downloaded_bytes"] == 2 * 1024 ** 2 and r["uplink"] == "u1" for r in records)
+
+def test_agent_stream_ends_with_plan_end(agents, file_server):
+    conn = agents[0].connect(30)
+    conn.request("POST", "/run", body=json.dumps(lab_plan(file_server)).encode("utf-8"),
+                 headers={"Authorization": "Bearer s3cret"})
+    response = conn.getresponse()
+    lines = [json.loads(line) for line in response.read().decode("utf-8").splitlines()]
+    conn.close()
+    assert response.status == 200
+    assert [line.get("server_key") for line in lines[:-1]] == ["lab1", "lab2"]
+    assert lines[-1]["event"] == "plan_end"
+    assert lines[-1]["completed"] == lines[-1]["total"] == 2
+
+def test_wrong_token_is_rejected(agents, file_server):
+    coordinator = Coordinator(agents[:1], lab_plan(file_server), token="wrong", timeout=30)
+    records = coordinator.run()
+    assert len(records) == 1
+    assert records[0]["success"] is False and records[0]["error"] == "unauthorized"
+
+def test_listen_defaults_to_loopback():
+    assert parse_listen("8780") == ("127.0.0.1", 8780)
+    assert parse_listen("[::1]:8780") == ("::1", 8780)
+    assert is_loopback("127.0.0.1") and is_loopback("::1") and is_loopback("localhost")
+    assert not is_loopback("0.0.0.0") and not is_loopback("example.com")
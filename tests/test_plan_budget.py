@@ -0,0 +1,102 @@
+"""test_plan：計畫驗證與流量預算 (user-043)"""
+
+import json
+import sys
+
+import pytest
+
+import vultr_speedtest
+from conftest import LocalEngine
+from test_plan import PlanError, PlanRunner, validate_plan
+
+MiB = 1024 ** 2
+
+def lab_plan(servers, steps, budget=None):
+    plan = {"id": "test", "servers": servers, "defaults": {"cooldown": 0}, "steps": steps}
+    if budget is not None:
+        plan["budget"] = budget
+    return validate_plan(plan)
+
+def run_plan(plan, **kwargs):
+    return PlanRunner(plan, show_progress=False, engine_factory=LocalEngine, **kwargs).run()
+
+def test_validate_plan_lists_all_errors():
+    with pytest.raises(PlanError) as info:
+        validate_plan({"steps": [{"kind": "download", "servers": ["nowhere"], "colour": 1},
+                                 {"kind": "upload", "servers": ["tokyo"]}],
+                       "budget": {"max_bytes": "lots"}})
+    errors = info.value.errors
+    assert "step #0: unknown key 'colour'" in errors
+    assert "step #0: server 'nowhere' not found" in errors
+    assert any(error.startswith("step #1: 'kind'") for error in errors)
+    assert "plan: invalid max_bytes 'lots'" in errors
+
+def test_validate_plan_expands_groups_and_defaults():
+    plan = validate_plan({"groups": {"asia": ["tokyo", "singapore"]},
+                          "defaults": {"test_size": "1GB", "quick": True},
+                          "steps": [{"kind": "latency", "group": "asia", "servers": ["tokyo"]}],
+                          "budget": {"max_bytes": "2G"}})
+    step = plan["steps"][0]
+    assert step["targets"] == ["tokyo", "singapore"]
+    assert step["test_size"] == "1GB" and step["quick"] is True
+    assert plan["budget"]["max_bytes"] == 2 * 1024 ** 3
+
+def test_budget_skips_downloads_larger_than_remaining(file_server):
+    servers = {"big": {"host": "127.0.0.1", "test_url": f"{file_server}/8MB.bin", "file_size": "8MB"},
+               "small": {"host": "127.0.0.1", "test_url": f"{file_server}/3MB.bin", "file_size": "3MB"}}
+    plan = lab_plan(servers, [{"kind": "download", "servers": ["big", "small", "small"]}],
+                    budget={"max_bytes": "5MB"})
+    results = run_plan(plan)
+    assert [bool(r.get("skipped")) for r in results] == [True, False]
+    assert "byte budget exhausted" in results[0]["error"]
+    assert results[1]["downloaded_bytes"] == 3 * MiB
+
+def test_budget_estimate_uses_head_content_length(file_server):
+    # 沒有 file_size：以 HEAD 回報的大小估計，而不是 100MB 的測試大小
+    servers = {"lab": {"host": "127.0.0.1", "test_url": f"{file_server}/2MB.bin"}}
+    plan = lab_plan(servers, [{"kind": "download", "servers": ["lab"]}], budget={"max_bytes": "4MB"})
+    results = run_plan(plan)
+    assert not results[0].get("skipped")
+    assert results[0]["downloaded_bytes"] == 2 * MiB
+
+def test_budget_is_a_hard_cap_when_the_declared_size_is_wrong(file_server):
+    servers = {"liar": {"host": "127.0.0.1", "test_url": f"{file_server}/12MB.bin", "file_size": "4MB"}}
+    plan = lab_plan(servers, [{"kind": "download", "servers": ["liar"]}], budget={"max_bytes": "6MB"})
+    result = run_plan(plan)[0]
+    assert result["downloaded_bytes"] == 4 * MiB
+    assert result["partial_reason"] == "budget"
+
+def test_concurrent_step_stays_within_budget(file_server):
+    servers = {f"lab{i}": {"host": "127.0.0.1", "test_url": f"{file_server}/{i + 2}MB.bin"} for i in range(4)}
+    plan = lab_plan(servers,
+                    [{"kind": "download", "servers": sorted(servers), "concurrency": 4}],
+                    budget={"max_bytes": "7MB"})
+    results = run_plan(plan)
+    assert len(results) == 4
+    assert sum(r.get("downloaded_bytes", 0) for r in results) <= 7 * MiB
+    assert any(r.get("skipped") for r in results)
+
+def test_exclude_hook_skips_targets_without_spending_budget(file_server):
+    servers = {"near": {"host": "127.0.0.1", "test_url": f"{file_server}/1MB.bin", "file_size": "1MB"},
+               "far": {"host": "localhost", "test_url": f"{file_server}/1MB.bin", "file_size": "1MB"}}
+    plan = lab_plan(servers, [{"kind": "download", "servers": ["far", "near"]}],
+                    budget={"max_bytes": "1MB"})
+    results = run_plan(plan, exclude=lambda step, server: "too far" if server["host"] == "localhost" else None)
+    assert results[0]["skipped"] and results[0]["error"] == "too far"
+    assert results[1]["downloaded_bytes"] == MiB
+
+def test_cli_rate_limits_apply_to_plan_steps(file_server, tmp_path, monkeypatch):
+    servers = {"lab": {"host": "127.0.0.1", "test_url": f"{file_server}/2MB.bin", "file_size": "2MB"}}
+    plan = {"id": "rate", "servers": servers, "defaults": {"cooldown": 0},
+            "steps": [{"kind": "download", "servers": ["lab"]},
+                      {"kind": "download", "servers": ["lab"], "max_rate": 80}]}
+    plan_path, output = tmp_path / "plan.json", tmp_path / "results.json"
+    plan_path.write_text(json.dumps(plan))
+    monkeypatch.setattr(sys, "argv", ["vultr_speedtest.py", "--plan", str(plan_path), "--max-rate", "40",
+                                      "--no-progress", "--health-file", str(tmp_path / "health.json"),
+                                      "--output", str(output)])
+    vultr_speedtest.main()
+    # 未設定速率的步驟沿用 --max-rate，步驟自己的 max_rate 優先
+    rates = [r["download_mbps"] for r in json.loads(output.read_text())]
+    assert rates[0] == pytest.approx(40, rel=0.25)
+    assert rates[1] == pytest.approx(80, rel=0.25)
@@ -0,0 +1,103 @@
+"""result_cache：快取鍵與 --max-age 沿用 (user-049)"""
+
+import datetime as dt
+import os
+
+import pytest
+
+from conftest import LocalEngine
+from result_cache import ResultCache, cache_key, parse_duration, reusable
+
+def lab_engine(file_server, **kwargs) -> LocalEngine:
+    engine = LocalEngine(show_progress=False, cooldown=0, **kwargs)
+    engine.custom_servers = {"lab": {"host": "127.0.0.1", "test_url": f"{file_server}/1MB.bin"}}
+    return engine
+
+def stamped(age_s: float, **fields):
+    timestamp = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=age_s)
+    return dict(fields, success=True, download_mbps=100.0, timestamp=timestamp.isoformat())
+
+def test_parse_duration():
+    assert parse_duration("90") == 90
+    assert parse_duration("15m") == 900
+    assert parse_duration("1.5h") == 5400
+    with pytest.raises(Exception):
+        parse_duration("soon")
+
+def test_engine_cache_key_separates_measurement_settings():
+    server = {"provider": "vultr"}
+    keys = {
+        LocalEngine().cache_key("tokyo", server),
+        LocalEngine(quick_test=True).cache_key("tokyo", server),
+        LocalEngine(max_rate=50).cache_key("tokyo", server),
+        LocalEngine(target_rate=50).cache_key("tokyo", server),
+        LocalEngine(rcvbuf=1 << 20).cache_key("tokyo", server),
+        LocalEngine(sink_dir="").cache_key("tokyo", server),
+        LocalEngine(test_size="1GB").cache_key("tokyo", server),
+    }
+    assert len(keys) == 7
+    assert LocalEngine().cache_key("tokyo", server) == cache_key("tokyo", "vultr", "download", "100MB")
+
+def test_engine_cache_key_includes_custom_test_url():
+    engine = LocalEngine()
+    first = engine.cache_key("lab", {"provider": "custom", "test_url": "http://a/100MB.bin"})
+    second = engine.cache_key("lab", {"provider": "custom", "test_url": "http://b/100MB.bin"})
+    assert first != second
+
+def test_reusable_only_keeps_complete_results():
+    assert reusable(stamped(0))
+    assert reusable(stamped(0, partial_reason="deadline"))
+    for fields in ({"partial_reason": "interrupted"}, {"partial_reason": "budget"}, {"skipped": True},
+                   {"cached": True}, {"replayed": True}):
+        assert not reusable(stamped(0, **fields))
+
+def test_fresh_honours_max_age(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.json"))
+    cache.store("old", stamped(600))
+    cache.store("new", stamped(30, anomalies=[{"metric": "ping_ms"}]))
+    assert cache.fresh("old", 300) is None
+    record = cache.fresh("new", 300)
+    assert record["cached"] is True and 29 <= record["cached_age_s"] < 60
+    assert "anomalies" not in record
+    # 重新載入後內容相同
+    assert ResultCache(cache.path).fresh("new", 300)["download_mbps"] == 100.0
+
+def test_eviction_by_count_and_retention(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.json"), max_entries=2, retention=3600)
+    cache.store("expired", stamped(7200))
+    for key in ("a", "b", "c"):
+        cache.store(key, stamped(0))
+    assert list(cache.entries) == ["b", "c"]
+
+def test_corrupt_cache_is_ignored(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text("{not json")
+    assert ResultCache(str(path)).entries == {}
+
+def test_engine_reuses_fresh_result(file_server, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.json"))
+    first = lab_engine(file_server)
+    first.result_cache, first.max_age = cache, 300
+    measured = first.run(["lab"])[0]
+    assert not measured.get("cached")
+
+    second = lab_engine(file_server)
+    second.result_cache, second.max_age = cache, 300
+    reused = second.run(["lab"])[0]
+    assert reused["cached"] is True
+    assert reused["download_mbps"] == measured["download_mbps"]
+    assert reused["timestamp"] == measured["timestamp"]
+
+def test_paced_run_does_not_reuse_plain_result(file_server, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.json"))
+    plain = lab_engine(file_server)
+    plain.result_cache, plain.max_age = cache, 300
+    plain.run(["lab"])
+
+    paced = lab_engine(file_server, max_rate=400)
+    paced.result_cache, paced.max_age = cache, 300
+    result = paced.run(["lab"])[0]
+    assert not result.get("cached")
+    assert result["max_rate_mbit_s"] == 400
+    assert len(cache.entries) == 2
+    assert os.path.exists(cache.path)
@@ -0,0 +1,72 @@
+"""result_set：欄式結果集的分組統計與中位數矩陣 (user-029)"""
+
+import json
+
+import pytest
+
+from result_set import ResultMatrix, ResultSet, iter_records, percentile
+
+def speedtest(server, mbps, region="asia", **fields):
+    return dict(fields, server_key=server, region=region, provider="vultr", download_mbps=mbps, ping_ms=30.0,
+                timestamp="2026-10-19T08:15:00+00:00")
+
+def sample_set():
+    result_set = ResultSet()
+    result_set.extend([
+        speedtest("tokyo", 100.0), speedtest("tokyo", 300.0), speedtest("tokyo", 200.0),
+        speedtest("paris", 50.0, region="europe"),
+        # 不列入：失敗、用戶端 CPU 瓶頸、沿用快取
+        {"server_key": "paris", "region": "europe", "provider": "vultr", "error": "timeout", "ping_ms": -1},
+        speedtest("paris", 5000.0, region="europe", client_limited=True),
+    ])
+    result_set.append(speedtest("paris", 1.0, region="europe", cached=True))
+    return result_set
+
+def test_percentile_interpolates():
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([7.0], 90) == 7.0
+    assert percentile([], 50) != percentile([], 50)  # NaN
+
+def test_group_by_server_medians():
+    groups = sample_set().group_by("server", "download_mbps", ("count", "mean", "p50", "min", "max"))
+    assert groups["tokyo"] == {"count": 3, "mean": 200.0, "p50": 200.0, "min": 100.0, "max": 300.0}
+    assert groups["paris"]["count"] == 1 and groups["paris"]["p50"] == 50.0
+
+def test_group_by_region_and_hour():
+    result_set = sample_set()
+    assert result_set.group_by("region", "download_mbps", ("count",)) == {"asia": {"count": 3},
+                                                                          "europe": {"count": 1}}
+    assert result_set.group_by("hour", "download_mbps", ("count",)) == {"08:00": {"count": 4}}
+
+def test_client_limited_can_be_included():
+    groups = sample_set().group_by("server", "download_mbps", ("max",), include_client_limited=True)
+    assert groups["paris"]["max"] == 5000.0
+
+def test_failed_ping_is_not_counted():
+    # 失敗結果的 ping -1 以 NaN 儲存，只剩兩筆成功結果的延遲
+    groups = sample_set().group_by("server", "ping_ms", ("count",), success_only=False, include_client_limited=True)
+    assert groups["paris"]["count"] == 2
+
+def test_timestamp_is_not_a_metric():
+    with pytest.raises(ValueError):
+        sample_set().group_by("server", "timestamp")
+    with pytest.raises(ValueError):
+        ResultMatrix("timestamp")
+
+def test_iter_records_reads_json_and_ndjson(tmp_path):
+    records = [speedtest("tokyo", 1.0), speedtest("paris", 2.0)]
+    json_path = tmp_path / "a.json"
+    json_path.write_text(json.dumps(records))
+    ndjson_path = tmp_path / "b.ndjson"
+    ndjson_path.write_text("\n".join(json.dumps(r) for r in records) + "\n")
+    assert list(iter_records(str(json_path))) == records
+    assert list(iter_records(str(ndjson_path))) == records
+
+def test_matrix_medians_and_best_source():
+    matrix = ResultMatrix("download_mbps")
+    for mbps in (100.0, 120.0, 110.0):
+        matrix.add("node-a", speedtest("tokyo", mbps))
+    matrix.add("node-b", speedtest("tokyo", 90.0))
+    matrix.add("ignored", speedtest("tokyo", 1.0, agent="node-b"))
+    assert matrix.medians() == {"node-a": {"tokyo": 110.0}, "node-b": {"tokyo": 45.5}}
+    assert matrix.best_sources() == {"tokyo": ("node-a", 110.0)}
@@ -0,0 +1,58 @@
+"""session_trace：varint 編碼、記錄檔格式與重播 (user-048)"""
+
+import pytest
+
+from conftest import LocalEngine
+from session_trace import (KIND_DOWNLOAD, ReplayEngine, SessionRecorder, TraceWriter, decode_varint,
+                           encode_varint, iter_sessions)
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32, 2 ** 63 - 1])
+def test_varint_round_trip(value):
+    out = bytearray(b"x")
+    encode_varint(value, out)
+    assert decode_varint(bytes(out), 1) == (value, len(out))
+
+def test_small_varints_use_one_byte():
+    out = bytearray()
+    encode_varint(127, out)
+    encode_varint(128, out)
+    assert len(out) == 3
+
+def test_trace_file_round_trip(tmp_path):
+    path = str(tmp_path / "sweep.trace")
+    reads = [(0.000125, 65536), (0.0031, 65536), (0.0031, 1200), (1.5, 7)]
+    TraceWriter(path).write(KIND_DOWNLOAD, {"server_key": "tokyo"}, reads)
+    # 附加寫入時沿用既有的檔頭
+    TraceWriter(path).write(KIND_DOWNLOAD, {"server_key": "paris"})
+    sessions = list(iter_sessions(path))
+    assert [s["meta"]["server_key"] for s in sessions] == ["tokyo", "paris"]
+    assert sessions[0]["kind"] == "download"
+    assert sessions[0]["reads"] == [(0.000125, 65536), (0.0031, 65536), (0.0031, 1200), (1.5, 7)]
+    assert sessions[1]["reads"] == []
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a trace file at all")
+    with pytest.raises(ValueError):
+        list(iter_sessions(str(path)))
+
+def test_record_and_replay_download(file_server, tmp_path):
+    path = str(tmp_path / "lab.trace")
+    engine = LocalEngine(show_progress=False, cooldown=0)
+    engine.custom_servers = {"lab": {"host": "127.0.0.1", "test_url": f"{file_server}/2MB.bin"}}
+    recorder = SessionRecorder(TraceWriter(path), {"test_size": "100MB"})
+    engine.recorder = recorder
+    engine.subscribe(recorder)
+    recorded = engine.run(["lab"])[0]
+
+    sessions = list(iter_sessions(path))
+    assert len(sessions) == 1
+    session = sessions[0]
+    assert sum(size for _, size in session["reads"]) == recorded["downloaded_bytes"] == 2 * 1024 ** 2
+    assert session["meta"]["recorded"]["download_mbps"] == recorded["download_mbps"]
+
+    replayed = ReplayEngine(sessions, show_progress=False).run(["0"])[0]
+    assert replayed["replayed"] is True and replayed["server_key"] == "lab"
+    assert replayed["downloaded_bytes"] == recorded["downloaded_bytes"]
+    # 虛擬時鐘以微秒記錄，速度只差在取整誤差
+    assert replayed["download_mbps"] == pytest.approx(recorded["download_mbps"], rel=0.05)
@@ -0,0 +1,67 @@
+"""TokenBucket 限速與目標速率判定 (user-042)，以虛擬時鐘執行不實際等待"""
+
+import pytest
+
+from vultr_speedtest import TokenBucket, evaluate_target_rate
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+def bucket(rate, burst=None):
+    clock = FakeClock()
+    return TokenBucket(rate, burst, clock=clock, sleep=clock.sleep), clock
+
+def test_burst_is_free():
+    tokens, clock = bucket(1000, burst=500)
+    tokens.consume(500)
+    assert clock.slept == [] and tokens.waited == 0
+
+def test_sleeps_for_the_deficit():
+    tokens, clock = bucket(1000, burst=500)
+    tokens.consume(800)
+    assert clock.slept == [pytest.approx(0.3)]
+
+def test_tokens_refill_with_time_up_to_burst():
+    tokens, clock = bucket(1000, burst=500)
+    tokens.consume(500)
+    clock.now += 10  # 閒置很久也只補到 burst
+    tokens.consume(500)
+    assert clock.slept == []
+    tokens.consume(100)
+    assert clock.slept == [pytest.approx(0.1)]
+
+def test_long_run_average_matches_rate():
+    rate = 1e6
+    tokens, clock = bucket(rate)
+    start = clock.now
+    total = 0
+    for _ in range(2000):
+        tokens.consume(16384)
+        total += 16384
+    elapsed = clock.now - start
+    # 扣掉一開始的突發量後，平均速率即為設定值
+    assert (total - tokens.burst) / elapsed == pytest.approx(rate, rel=1e-6)
+    assert tokens.waited == pytest.approx(elapsed)
+
+def test_default_burst_is_50ms_with_floor():
+    assert TokenBucket(10e6).burst == 500000
+    assert TokenBucket(1000).burst == 65536
+
+def test_evaluate_target_rate():
+    # 每 0.1 秒 125000 位元組 = 10 Mbit/s
+    steady = [(i * 0.1, i * 125000) for i in range(31)]
+    met = evaluate_target_rate(steady, 10.0)
+    assert met["achieved_mbit_s"] == pytest.approx(10.0)
+    assert met["windows"] == 3 and met["target_met"] is True
+    assert evaluate_target_rate(steady, 20.0)["target_met"] is False
+    # 完整視窗不足兩個
+    assert evaluate_target_rate(steady[:15], 10.0) is None
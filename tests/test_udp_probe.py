@@ -0,0 +1,59 @@
+"""udp_probe：遺失 / 亂序 / 重複統計、RFC 3550 抖動與本機迴路探測 (user-045)"""
+
+import pytest
+
+from udp_probe import UdpResponder, analyze_probe, parse_address, rfc3550_jitter, udp_probe
+
+MS = 1_000_000
+
+def arrival(seq, transit_ms=10.0, interval_ms=20.0):
+    """每 interval_ms 送出一個封包，去程與回程各 transit_ms"""
+    sent = int(seq * interval_ms * MS)
+    return seq, sent, sent + int(transit_ms * MS), sent + int(2 * transit_ms * MS)
+
+def test_rfc3550_jitter_known_sequence():
+    # 每 20 ms 送出；傳輸時間變化為 +5、-5、+10 ms
+    pairs = [(0, 100 * MS), (20 * MS, 125 * MS), (40 * MS, 140 * MS), (60 * MS, 170 * MS)]
+    # J = J + (|D| - J) / 16：0.3125 → 0.60546875 → 1.192626953125
+    assert rfc3550_jitter(pairs) == pytest.approx(1.192626953125)
+
+def test_rfc3550_jitter_ignores_constant_clock_offset():
+    pairs = [(i * 20 * MS, i * 20 * MS + 5_000 * MS) for i in range(10)]
+    assert rfc3550_jitter(pairs) == 0.0
+    assert rfc3550_jitter(pairs[:1]) == 0.0
+
+def test_analyze_probe_counts_loss_reordering_and_duplicates():
+    arrivals = [arrival(seq) for seq in (0, 1, 3, 2, 2, 5, 9)]
+    result = analyze_probe(10, arrivals)
+    assert result["received"] == 6
+    assert result["lost"] == 4 and result["loss_pct"] == pytest.approx(40.0)
+    # 4 單獨遺失，6、7、8 連續遺失
+    assert result["max_loss_burst"] == 3
+    assert result["reordered"] == 1
+    assert result["duplicates"] == 1
+    assert result["jitter_ms"] == 0.0
+    assert result["rtt"]["min_ms"] == pytest.approx(20.0)
+
+def test_analyze_probe_trailing_loss_and_empty_input():
+    result = analyze_probe(5, [arrival(0), arrival(1)])
+    assert result["lost"] == 3 and result["max_loss_burst"] == 3
+    empty = analyze_probe(0, [])
+    assert empty["loss_pct"] == 0.0 and empty["received"] == 0
+
+def test_parse_address():
+    assert parse_address("example.com") == ("example.com", 8790)
+    assert parse_address("example.com:9000") == ("example.com", 9000)
+    assert parse_address("[::1]:9000") == ("::1", 9000)
+    assert parse_address("::1") == ("::1", 8790)
+
+def test_loopback_probe_has_no_loss():
+    responder = UdpResponder("127.0.0.1", 0).start()
+    try:
+        host, port = responder.address
+        result = udp_probe(host, port, count=50, rate=500, timeout=0.3)
+    finally:
+        responder.shutdown()
+    assert result["success"]
+    assert result["received"] == 50 and result["loss_pct"] == 0.0
+    assert result["duplicates"] == 0 and result["send_errors"] == 0
+    assert responder.replied == 50
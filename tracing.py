@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Phase Tracing
+以單調奈秒時鐘記錄各測試階段的 span，並匯出為 Chrome trace-event 或 OTLP-JSON
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Python 3.6 沒有 perf_counter_ns / time_ns
+perf_counter_ns = getattr(time, "perf_counter_ns", lambda: int(time.perf_counter() * 1e9))
+time_ns = getattr(time, "time_ns", lambda: int(time.time() * 1e9))
+
+TRACE_FORMATS = ("chrome", "otlp")
+
+class Span:
+    """一段已結束的階段"""
+
+    __slots__ = ("name", "start_ns", "end_ns", "attributes", "thread_id", "span_id", "parent_id")
+
+    def __init__(self, name: str, start_ns: int, end_ns: int, attributes: Dict[str, Any],
+                 thread_id: int, span_id: int, parent_id: Optional[int]):
+        self.name = name
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.attributes = attributes
+        self.thread_id = thread_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+
+class Tracer:
+    """收集 span；巢狀的 span() 會依執行緒自動記錄父子關係"""
+
+    enabled = True
+
+    def __init__(self, service_name: str = "global_speedtest_cli"):
+        self.service_name = service_name
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.next_id = 1
+        # 單調時鐘與 Unix 時間的對應，匯出 OTLP 時換算成絕對時間
+        self.origin_ns = perf_counter_ns()
+        self.epoch_offset_ns = time_ns() - self.origin_ns
+        self.trace_id = os.urandom(16).hex()
+
+    def _stack(self) -> List[int]:
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def _new_id(self) -> int:
+        with self.lock:
+            span_id = self.next_id
+            self.next_id += 1
+        return span_id
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, **attributes) -> int:
+        """記錄一段已知起訖時間的 span (父 span 為目前執行緒最內層的 span)"""
+        stack = self._stack()
+        span_id = self._new_id()
+        span = Span(name, start_ns, end_ns, attributes, threading.get_ident(), span_id,
+                    stack[-1] if stack else None)
+        with self.lock:
+            self.spans.append(span)
+        return span_id
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """以 with 區塊量測一個階段；可在區塊內修改回傳的 attributes"""
+        stack = self._stack()
+        span_id = self._new_id()
+        parent_id = stack[-1] if stack else None
+        stack.append(span_id)
+        start_ns = perf_counter_ns()
+        try:
+            yield attributes
+        finally:
+            end_ns = perf_counter_ns()
+            stack.pop()
+            with self.lock:
+                self.spans.append(Span(name, start_ns, end_ns, attributes, threading.get_ident(),
+                                       span_id, parent_id))
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Chrome trace-event 格式 (可用 Perfetto / chrome://tracing 開啟)"""
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+                   "args": {"name": self.service_name}}]
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        for span in spans:
+            events.append({
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": (span.start_ns - self.origin_ns) / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": span.attributes,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ns"}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON (ExportTraceServiceRequest) 格式"""
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        otlp_spans = []
+        for span in spans:
+            item = {
+                "traceId": self.trace_id,
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns + self.epoch_offset_ns),
+                "endTimeUnixNano": str(span.end_ns + self.epoch_offset_ns),
+                "attributes": [otlp_attribute(key, value) for key, value in span.attributes.items()],
+            }
+            if span.parent_id is not None:
+                item["parentSpanId"] = f"{span.parent_id:016x}"
+            otlp_spans.append(item)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "global_speedtest_cli.tracing"}, "spans": otlp_spans}]
+            }]
+        }
+
+    def export(self, path: str, trace_format: str = "chrome"):
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"unknown trace format: {trace_format}")
+        data = self.to_chrome() if trace_format == "chrome" else self.to_otlp()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+class NullTracer:
+    """未啟用追蹤時使用，所有操作都不做任何事"""
+
+    enabled = False
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, **attributes) -> int:
+        return 0
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        yield attributes
+
+def otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """轉成 OTLP 的 KeyValue"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+_tracer = NullTracer()
+
+def get_tracer():
+    return _tracer
+
+def set_tracer(tracer) -> None:
+    global _tracer
+    _tracer = tracer if tracer is not None else NullTracer()
+
+def start_tracing(service_name: str) -> Tracer:
+    """建立並啟用全域 tracer"""
+    tracer = Tracer(service_name)
+    set_tracer(tracer)
+    return tracer
+
+def export_tracing(path: Optional[str], trace_format: str = "chrome") -> bool:
+    """若已啟用追蹤且指定了路徑，匯出目前的 tracer"""
+    tracer = get_tracer()
+    if not path or not tracer.enabled:
+        return False
+    tracer.export(path, trace_format)
+    return True
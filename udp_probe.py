@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+UDP Jitter / Loss Probe
+以固定速率送出帶序號與時間戳記的 UDP 封包到回應程式，量測 RFC 3550 抖動、遺失、亂序與重複
+同一個檔案也是回應程式 (serve)，可部署在自己的主機上或在本機迴路上測試
+"""
+
+import argparse
+import json
+import select
+import socket
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from simple_netcheck import summarize_latencies
+from tracing import get_tracer, perf_counter_ns
+
+DEFAULT_PORT = 8790
+MAGIC = b"GSUP"
+REQUEST = 0
+REPLY = 1
+# magic、類型、序號、送出時間 (探測端單調時鐘 ns)、回應時間 (回應端單調時鐘 ns)
+HEADER = struct.Struct("!4sB3xIQQ")
+MIN_SIZE = HEADER.size
+MAX_SIZE = 1472  # 1500 MTU 扣除 IPv4 與 UDP 標頭，避免分片
+# RFC 3550 抖動估計的平滑係數
+JITTER_GAIN = 1 / 16
+
+def parse_address(value: str, default_port: int = DEFAULT_PORT) -> Tuple[str, int]:
+    """HOST[:PORT] (IPv6 位址請寫成 [::1]:PORT)"""
+    if value.startswith("["):
+        host, _, rest = value[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else ""
+    elif value.count(":") == 1:
+        host, _, port = value.partition(":")
+    else:
+        host, port = value, ""
+    try:
+        return host or "0.0.0.0", int(port) if port else default_port
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid address: {value}")
+
+class UdpResponder:
+    """回應程式：把合法的探測封包加上接收時間戳記後原樣大小送回
+
+    只回覆帶有正確 magic 的請求封包，回覆與請求一樣大，不會被拿來放大流量。
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = DEFAULT_PORT):
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()[:2]
+        self.replied = 0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def serve_forever(self):
+        try:
+            while not self.stopped.is_set():
+                readable, _, _ = select.select([self.sock], [], [], 0.5)
+                if not readable:
+                    continue
+                try:
+                    data, peer = self.sock.recvfrom(65535)
+                except OSError:
+                    continue
+                received_ns = perf_counter_ns()
+                if len(data) < MIN_SIZE:
+                    continue
+                magic, kind, seq, sent_ns, _ = HEADER.unpack_from(data)
+                if magic != MAGIC or kind != REQUEST:
+                    continue
+                reply = HEADER.pack(MAGIC, REPLY, seq, sent_ns, received_ns) + data[MIN_SIZE:]
+                try:
+                    self.sock.sendto(reply, peer)
+                    self.replied += 1
+                except OSError:
+                    pass
+        finally:
+            self.sock.close()
+
+    def start(self) -> "UdpResponder":
+        """在背景執行緒中執行 (本機迴路測試用)"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+def rfc3550_jitter(pairs: List[Tuple[int, int]]) -> float:
+    """RFC 3550 6.4.1 的到達間隔抖動 (ms)
+
+    pairs 依到達順序排列，每項為 (送出時間 ns, 到達時間 ns)；兩端時鐘的固定偏移在差值中抵銷，
+    所以送出與到達可以是不同主機的時鐘。
+    """
+    jitter = 0.0
+    for (prev_sent, prev_arrived), (sent, arrived) in zip(pairs, pairs[1:]):
+        transit_change = (arrived - prev_arrived) - (sent - prev_sent)
+        jitter += (abs(transit_change) - jitter) * JITTER_GAIN
+    return jitter / 1e6
+
+def analyze_probe(sent: int, arrivals: List[Tuple[int, int, int, int]]) -> Dict[str, Any]:
+    """依到達順序的 (序號, 送出 ns, 回應端接收 ns, 回到探測端 ns) 計算遺失、亂序、重複與抖動
+
+    - 亂序：序號小於先前已收到的最大序號
+    - 遺失：沒有收到回覆的序號 (逾時後才到的也算遺失)；max_loss_burst 為最長的連續遺失
+    - jitter_ms 為去程 (探測端 → 回應端)、return_jitter_ms 為回程、rtt_jitter_ms 為來回時間的抖動
+    """
+    seen = set()
+    duplicates = 0
+    reordered = 0
+    highest = -1
+    unique = []
+    for arrival in arrivals:
+        seq = arrival[0]
+        if seq in seen:
+            duplicates += 1
+            continue
+        seen.add(seq)
+        if seq < highest:
+            reordered += 1
+        highest = max(highest, seq)
+        unique.append(arrival)
+
+    longest_burst = burst = 0
+    for seq in range(sent):
+        burst = 0 if seq in seen else burst + 1
+        longest_burst = max(longest_burst, burst)
+
+    lost = sent - len(unique)
+    result = {
+        "sent": sent,
+        "received": len(unique),
+        "lost": lost,
+        "loss_pct": lost / sent * 100 if sent else 0.0,
+        "max_loss_burst": longest_burst,
+        "reordered": reordered,
+        "duplicates": duplicates,
+        "jitter_ms": rfc3550_jitter([(a[1], a[2]) for a in unique]),
+        "return_jitter_ms": rfc3550_jitter([(a[2], a[3]) for a in unique]),
+        "rtt_jitter_ms": rfc3550_jitter([(a[1], a[3]) for a in unique]),
+    }
+    rtts = [(a[3] - a[1]) / 1e6 for a in unique]
+    result["rtt"] = dict(summarize_latencies(rtts), min_ms=min(rtts) if rtts else 0.0)
+    return result
+
+def udp_probe(host: str, port: int = DEFAULT_PORT, count: int = 100, rate: float = 50.0, size: int = 64,
+              timeout: float = 1.0) -> Dict[str, Any]:
+    """以每秒 rate 個、每個 size 位元組的封包探測回應程式，最後一個封包送出後再等 timeout 秒"""
+    size = min(max(size, MIN_SIZE), MAX_SIZE)
+    result = {"host": host, "port": port, "count": count, "rate_pps": rate, "size": size}
+    try:
+        family, _, _, _, address = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+    except socket.gaierror as e:
+        result.update({"success": False, "error": f"DNS resolution failed: {e}"})
+        return result
+    result["ip"] = address[0]
+
+    arrivals: List[Tuple[int, int, int, int]] = []
+    stopped = threading.Event()
+    padding = bytes(size - MIN_SIZE)
+    tracer = get_tracer()
+
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        # connect 後只會收到來自回應程式的封包
+        sock.connect(address)
+
+        def receive():
+            while not stopped.is_set():
+                readable, _, _ = select.select([sock], [], [], 0.05)
+                if not readable:
+                    continue
+                try:
+                    data = sock.recv(65535)
+                except OSError:
+                    continue  # 目的地不可達 (ICMP) 等錯誤視同遺失
+                arrived = perf_counter_ns()
+                if len(data) < MIN_SIZE:
+                    continue
+                magic, kind, seq, sent_ns, responder_ns = HEADER.unpack_from(data)
+                if magic == MAGIC and kind == REPLY and seq < count:
+                    arrivals.append((seq, sent_ns, responder_ns, arrived))
+
+        receiver = threading.Thread(target=receive, daemon=True)
+        receiver.start()
+        send_errors = 0
+        start = perf_counter_ns()
+        interval_ns = 1e9 / rate
+        try:
+            with tracer.span("udp_probe", host=host, port=port, count=count, rate=rate, size=size):
+                for seq in range(count):
+                    # 依排程時間送出，不累積 sleep 的誤差
+                    delay = (start + seq * interval_ns - perf_counter_ns()) / 1e9
+                    if delay > 0:
+                        time.sleep(delay)
+                    try:
+                        sock.send(HEADER.pack(MAGIC, REQUEST, seq, perf_counter_ns(), 0) + padding)
+                    except OSError:
+                        send_errors += 1
+                time.sleep(timeout)
+        finally:
+            stopped.set()
+            receiver.join()
+
+    result.update(analyze_probe(count, list(arrivals)))
+    result["send_errors"] = send_errors
+    result["duration_s"] = (perf_counter_ns() - start) / 1e9
+    result["success"] = result["received"] > 0
+    if not result["success"]:
+        result["error"] = "No replies (is the responder running and the UDP port reachable?)"
+    return result
+
+def format_probe(result: Dict[str, Any]) -> str:
+    if not result.get("success"):
+        return f"{result['host']}:{result['port']}: {result.get('error')}"
+    return (f"{result['host']}:{result['port']}: loss {result['loss_pct']:.1f}% ({result['lost']}/{result['sent']}, "
+            f"burst {result['max_loss_burst']}) | jitter {result['jitter_ms']:.2f} ms "
+            f"(return {result['return_jitter_ms']:.2f}) | rtt p50 {result['rtt']['p50_ms']:.1f} ms "
+            f"p99 {result['rtt']['p99_ms']:.1f} ms | reordered {result['reordered']} | dup {result['duplicates']}")
+
+def run_serve_command(args):
+    responder = UdpResponder(*args.listen)
+    print(f"UDP responder listening on {responder.address[0]}:{responder.address[1]} (Ctrl+C to stop)")
+    try:
+        responder.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStopped after {responder.replied} replies")
+
+def run_probe_command(args):
+    responder = None
+    targets = [parse_address(target) for target in args.targets]
+    if args.loopback:
+        responder = UdpResponder("127.0.0.1", 0).start()
+        targets.append(responder.address)
+    if not targets:
+        print("No targets (give HOST[:PORT] or --loopback)")
+        return
+
+    results = []
+    try:
+        for host, port in targets:
+            result = udp_probe(host, port, args.count, args.rate, args.size, args.timeout)
+            print(format_probe(result), flush=True)
+            results.append(result)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted ({len(results)}/{len(targets)} completed)")
+    finally:
+        if responder is not None:
+            responder.shutdown()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP jitter, loss and reordering probe with a bundled echo responder")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="Run the echo responder on this host")
+    serve_parser.add_argument("--listen", type=parse_address, default=("0.0.0.0", DEFAULT_PORT), metavar="HOST:PORT",
+                              help=f"Address to listen on (default: 0.0.0.0:{DEFAULT_PORT})")
+
+    probe_parser = subparsers.add_parser("probe", help="Probe one or more responders")
+    probe_parser.add_argument("targets", nargs="*", metavar="HOST[:PORT]",
+                              help=f"Responders to probe (default port: {DEFAULT_PORT})")
+    probe_parser.add_argument("--loopback", action="store_true",
+                              help="Also start a responder on 127.0.0.1 and probe it")
+    probe_parser.add_argument("--count", type=int, default=100, help="Packets to send (default: 100)")
+    probe_parser.add_argument("--rate", type=float, default=50.0,
+                              help="Packets per second (default: 50, a 20 ms voice frame interval)")
+    probe_parser.add_argument("--size", type=int, default=64,
+                              help=f"Packet payload size in bytes, {MIN_SIZE}-{MAX_SIZE} (default: 64)")
+    probe_parser.add_argument("--timeout", type=float, default=1.0,
+                              help="Seconds to wait for replies after the last packet (default: 1)")
+    probe_parser.add_argument("--output", help="Save results as JSON")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        run_serve_command(args)
+    elif args.command == "probe":
+        if args.count <= 0 or args.rate <= 0:
+            parser.error("--count and --rate must be positive")
+        run_probe_command(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
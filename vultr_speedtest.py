@@ -5,6 +5,7 @@ Vultr Global Speed Test
 """
 
 import argparse
+import os
 import time
 import sys
 from typing import Dict, List, Optional, Any
@@ -16,6 +17,32 @@ import datetime as dt
 import threading
 import subprocess
 import signal
+import socket
+import struct
+import functools
+import http.client
+import mmap
+import queue
+import tempfile
+from typing import Callable, Iterator, Tuple
+from urllib.parse import urlparse
+
+from anomaly import AnomalyDetector, AnomalyLog, format_anomaly
+from geo import locate, parse_origin, rtt_anomaly, within_distance
+from result_cache import DEFAULT_CACHE_PATH, ResultCache, cache_key, format_age, parse_duration
+from simple_netcheck import summarize_latencies
+from tracing import TRACE_FORMATS, export_tracing, get_tracer, perf_counter_ns, start_tracing
+
+try:
+    # Windows 沒有 resource 模組，改用 os.times()
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # 多語言支持
 LANGUAGES = {
@@ -47,7 +74,51 @@ LANGUAGES = {
         "result_saved_to": "[INFO] Results saved to",
         "connection_error": "Connection error",
         "test_timeout": "Test duration too short",
-        "server_not_found": "Server not found"
+        "server_not_found": "Server not found",
+        "tcp_stats": "TCP stats",
+        "rtt_unavailable": "RTT unavailable, cannot compute bandwidth-delay product",
+        "buffer_advice": "Socket buffer advice",
+        "default_buffers": "Default buffers",
+        "current_setting": "Current setting",
+        "recommended_sysctl": "Recommended sysctl",
+        "test_cancelled": "Test cancelled",
+        "partial": "partial",
+        "partial_results": "Partial results",
+        "connection_closed": "Connection closed before the full file was received",
+        "latency_under_load": "Latency under load",
+        "idle": "idle",
+        "loaded": "loaded",
+        "probe_lost": "lost",
+        "avg_bufferbloat": "Average latency increase under load",
+        "rtt_anomaly_slow_path": "RTT far above the physical minimum, possible detour routing",
+        "rtt_anomaly_below_minimum": "RTT below the speed-of-light minimum, check coordinates or anycast",
+        "rtt_anomalies": "RTT anomalies",
+        "pruned_by_distance": "Skipped beyond distance limit",
+        "max_distance_needs_origin": "--max-distance requires --origin",
+        "connection_timing": "Connection",
+        "steady": "steady",
+        "ramp_up": "ramp-up",
+        "avg_steady_speed": "Average steady-state throughput (SI)",
+        "trace_saved_to": "[INFO] Trace saved to",
+        "target_rate": "Target rate",
+        "target_met": "met",
+        "target_missed": "missed",
+        "target_met_summary": "Target rate met",
+        "invalid_rate": "--max-rate and --target-rate must be positive, and --target-rate cannot exceed --max-rate",
+        "invalid_plan": "[ERROR] Invalid test plan",
+        "anomaly": "Anomaly",
+        "anomalies_summary": "Anomalies (departures from each server's baseline)",
+        "round": "Round",
+        "next_round_in": "[INFO] Next round in",
+        "result_appended_to": "[INFO] Results appended to",
+        "sessions_recorded_to": "[INFO] Sessions recorded to",
+        "cached": "cached",
+        "cached_results": "Reused cached results",
+        "skipped_known_bad": "[WARN] Skipped, test file failed the last catalog check (--include-bad to test anyway)",
+        "disk_sink": "Disk sink",
+        "avg_end_to_end_speed": "Average end-to-end throughput (disk)",
+        "client_limited": "Client-limited: the download thread saturated a CPU core, speed reflects this machine rather than the network",
+        "client_limited_results": "Client-limited results (exclude from capacity reports)"
     },
     "zh": {
         "title": "🚀 Vultr 全球機房網路速度測試",
@@ -77,7 +148,51 @@ LANGUAGES = {
         "result_saved_to": "[INFO] 結果已儲存至",
         "connection_error": "連接錯誤",
         "test_timeout": "測試時間過短",
-        "server_not_found": "找不到伺服器"
+        "server_not_found": "找不到伺服器",
+        "tcp_stats": "TCP 統計",
+        "rtt_unavailable": "無法取得 RTT，無法計算頻寬延遲乘積",
+        "buffer_advice": "Socket 緩衝區建議",
+        "default_buffers": "預設緩衝區",
+        "current_setting": "目前設定",
+        "recommended_sysctl": "建議的 sysctl",
+        "test_cancelled": "測試已取消",
+        "partial": "部分結果",
+        "partial_results": "部分結果",
+        "connection_closed": "檔案尚未傳完連線就被關閉",
+        "latency_under_load": "負載下延遲",
+        "idle": "閒置",
+        "loaded": "負載",
+        "probe_lost": "遺失",
+        "avg_bufferbloat": "負載下平均延遲增加",
+        "rtt_anomaly_slow_path": "RTT 遠高於物理下限，可能繞路",
+        "rtt_anomaly_below_minimum": "RTT 低於光速下限，請檢查座標或 anycast",
+        "rtt_anomalies": "RTT 異常",
+        "pruned_by_distance": "超過距離上限而略過",
+        "max_distance_needs_origin": "--max-distance 需要搭配 --origin",
+        "connection_timing": "連線",
+        "steady": "穩態",
+        "ramp_up": "爬升",
+        "avg_steady_speed": "平均穩態吞吐量 (SI)",
+        "trace_saved_to": "[INFO] 追蹤記錄已儲存至",
+        "target_rate": "目標速率",
+        "target_met": "達成",
+        "target_missed": "未達成",
+        "target_met_summary": "達成目標速率",
+        "invalid_rate": "--max-rate 與 --target-rate 必須大於 0，且 --target-rate 不可超過 --max-rate",
+        "invalid_plan": "[ERROR] 測試計畫不合法",
+        "anomaly": "異常",
+        "anomalies_summary": "異常 (偏離各伺服器的基準)",
+        "round": "輪次",
+        "next_round_in": "[INFO] 下一輪開始於",
+        "result_appended_to": "[INFO] 結果已附加至",
+        "sessions_recorded_to": "[INFO] 測試過程已記錄至",
+        "cached": "快取",
+        "cached_results": "沿用快取的結果",
+        "skipped_known_bad": "[WARN] 已略過，上次目錄檢查判定測試檔失效 (--include-bad 仍要測試)",
+        "disk_sink": "寫入磁碟",
+        "avg_end_to_end_speed": "平均端到端吞吐量 (磁碟)",
+        "client_limited": "受限於用戶端：下載執行緒已佔滿一個 CPU 核心，速度反映的是本機效能而非網路",
+        "client_limited_results": "受限於用戶端的結果 (請勿列入容量報表)"
     },
     "ja": {
         "title": "🚀 Vultr グローバルスピードテスト",
@@ -107,7 +222,51 @@ LANGUAGES = {
         "result_saved_to": "[INFO] 結果を保存しました",
         "connection_error": "接続エラー",
         "test_timeout": "テスト時間が短すぎます",
-        "server_not_found": "サーバーが見つかりません"
+        "server_not_found": "サーバーが見つかりません",
+        "tcp_stats": "TCP 統計",
+        "rtt_unavailable": "RTT を取得できないため、帯域遅延積を計算できません",
+        "buffer_advice": "ソケットバッファの推奨設定",
+        "default_buffers": "デフォルトバッファ",
+        "current_setting": "現在の設定",
+        "recommended_sysctl": "推奨 sysctl",
+        "test_cancelled": "テストがキャンセルされました",
+        "partial": "部分結果",
+        "partial_results": "部分結果",
+        "connection_closed": "ファイルの受信完了前に接続が切断されました",
+        "latency_under_load": "負荷時の遅延",
+        "idle": "アイドル",
+        "loaded": "負荷時",
+        "probe_lost": "損失",
+        "avg_bufferbloat": "負荷時の平均遅延増加",
+        "rtt_anomaly_slow_path": "RTT が物理的下限を大きく上回っています (迂回経路の可能性)",
+        "rtt_anomaly_below_minimum": "RTT が光速の下限を下回っています (座標または anycast を確認)",
+        "rtt_anomalies": "RTT 異常",
+        "pruned_by_distance": "距離上限を超えたためスキップ",
+        "max_distance_needs_origin": "--max-distance には --origin が必要です",
+        "connection_timing": "接続",
+        "steady": "定常",
+        "ramp_up": "立ち上がり",
+        "avg_steady_speed": "平均定常スループット (SI)",
+        "trace_saved_to": "[INFO] トレースを保存しました",
+        "target_rate": "目標レート",
+        "target_met": "達成",
+        "target_missed": "未達",
+        "target_met_summary": "目標レート達成",
+        "invalid_rate": "--max-rate と --target-rate は正の値で、--target-rate は --max-rate 以下にしてください",
+        "invalid_plan": "[ERROR] テスト計画が不正です",
+        "anomaly": "異常",
+        "anomalies_summary": "異常 (各サーバーのベースラインからの逸脱)",
+        "round": "ラウンド",
+        "next_round_in": "[INFO] 次のラウンドまで",
+        "result_appended_to": "[INFO] 結果を追記しました",
+        "sessions_recorded_to": "[INFO] セッションを記録しました",
+        "cached": "キャッシュ",
+        "cached_results": "キャッシュから再利用した結果",
+        "skipped_known_bad": "[WARN] スキップ：前回のカタログチェックでテストファイルが無効と判定 (--include-bad で強制テスト)",
+        "disk_sink": "ディスク書き込み",
+        "avg_end_to_end_speed": "平均エンドツーエンドスループット (ディスク)",
+        "client_limited": "クライアント律速: ダウンロードスレッドが CPU コアを使い切っており、速度はネットワークではなくこのマシンの性能を示しています",
+        "client_limited_results": "クライアント律速の結果 (容量レポートから除外してください)"
     }
 }
 
@@ -129,12 +288,14 @@ HINET_SERVERS = {
         "hinet_250m": {
             "names": {"en": "Taiwan-HiNet (250MB)", "zh": "台灣-HiNet (250MB)", "ja": "台湾-HiNet (250MB)"},
             "host": "http.speed.hinet.net",
+            "lat": 25.03, "lon": 121.57,
             "test_url": "http://http.speed.hinet.net/test_250m.zip",
             "file_size": "250MB"
         },
         "hinet_2g": {
             "names": {"en": "Taiwan-HiNet (2GB)", "zh": "台灣-HiNet (2GB)", "ja": "台湾-HiNet (2GB)"},
             "host": "http.speed.hinet.net",
+            "lat": 25.03, "lon": 121.57,
             "test_url": "http://http.speed.hinet.net/test_2048m.zip",
             "file_size": "2GB"
         }
@@ -147,6 +308,7 @@ LINODE_SERVERS = {
         "tokyo2": {
             "names": {"en": "Japan-Tokyo 2", "zh": "日本-東京 2", "ja": "日本-東京 2"},
             "host": "speedtest.tokyo2.linode.com",
+            "lat": 35.68, "lon": 139.69,
             "test_urls": {
                 "100MB": "https://speedtest.tokyo2.linode.com/100MB-tokyo2.bin",
                 "1GB": "https://speedtest.tokyo2.linode.com/1GB-tokyo2.bin"
@@ -155,6 +317,7 @@ LINODE_SERVERS = {
         "tokyo3": {
             "names": {"en": "Japan-Tokyo 3", "zh": "日本-東京 3", "ja": "日本-東京 3"},
             "host": "jp-tyo-3.speedtest.linode.com",
+            "lat": 35.68, "lon": 139.69,
             "test_urls": {
                 "100MB": "https://jp-tyo-3.speedtest.linode.com/100MB-tokyo3.bin",
                 "1GB": "https://jp-tyo-3.speedtest.linode.com/1GB-tokyo3.bin"
@@ -163,6 +326,7 @@ LINODE_SERVERS = {
         "singapore": {
             "names": {"en": "Singapore", "zh": "新加坡", "ja": "シンガポール"},
             "host": "speedtest.singapore.linode.com",
+            "lat": 1.35, "lon": 103.82,
             "test_urls": {
                 "100MB": "https://speedtest.singapore.linode.com/100MB-singapore.bin",
                 "1GB": "https://speedtest.singapore.linode.com/1GB-singapore.bin"
@@ -171,6 +335,7 @@ LINODE_SERVERS = {
         "mumbai": {
             "names": {"en": "India-Mumbai", "zh": "印度-孟買", "ja": "インド-ムンバイ"},
             "host": "speedtest.mumbai1.linode.com",
+            "lat": 19.08, "lon": 72.88,
             "test_urls": {
                 "100MB": "https://speedtest.mumbai1.linode.com/100MB-mumbai.bin",
                 "1GB": "https://speedtest.mumbai1.linode.com/1GB-mumbai.bin"
@@ -181,6 +346,7 @@ LINODE_SERVERS = {
         "fremont": {
             "names": {"en": "USA-Fremont", "zh": "美國-弗里蒙特", "ja": "米国-フリーモント"},
             "host": "speedtest.fremont.linode.com",
+            "lat": 37.55, "lon": -121.99,
             "test_urls": {
                 "100MB": "https://speedtest.fremont.linode.com/100MB-fremont.bin",
                 "1GB": "https://speedtest.fremont.linode.com/1GB-fremont.bin"
@@ -189,6 +355,7 @@ LINODE_SERVERS = {
         "newark": {
             "names": {"en": "USA-Newark", "zh": "美國-紐瓦克", "ja": "米国-ニューアーク"},
             "host": "speedtest.newark.linode.com",
+            "lat": 40.74, "lon": -74.17,
             "test_urls": {
                 "100MB": "https://speedtest.newark.linode.com/100MB-newark.bin",
                 "1GB": "https://speedtest.newark.linode.com/1GB-newark.bin"
@@ -197,6 +364,7 @@ LINODE_SERVERS = {
         "atlanta": {
             "names": {"en": "USA-Atlanta", "zh": "美國-亞特蘭大", "ja": "米国-アトランタ"},
             "host": "speedtest.atlanta.linode.com",
+            "lat": 33.75, "lon": -84.39,
             "test_urls": {
                 "100MB": "https://speedtest.atlanta.linode.com/100MB-atlanta.bin",
                 "1GB": "https://speedtest.atlanta.linode.com/1GB-atlanta.bin"
@@ -205,6 +373,7 @@ LINODE_SERVERS = {
         "dallas": {
             "names": {"en": "USA-Dallas", "zh": "美國-達拉斯", "ja": "米国-ダラス"},
             "host": "speedtest.dallas.linode.com",
+            "lat": 32.78, "lon": -96.8,
             "test_urls": {
                 "100MB": "https://speedtest.dallas.linode.com/100MB-dallas.bin",
                 "1GB": "https://speedtest.dallas.linode.com/1GB-dallas.bin"
@@ -213,6 +382,7 @@ LINODE_SERVERS = {
         "toronto": {
             "names": {"en": "Canada-Toronto", "zh": "加拿大-多倫多", "ja": "カナダ-トロント"},
             "host": "speedtest.toronto1.linode.com",
+            "lat": 43.65, "lon": -79.38,
             "test_urls": {
                 "100MB": "https://speedtest.toronto1.linode.com/100MB-toronto.bin",
                 "1GB": "https://speedtest.toronto1.linode.com/1GB-toronto.bin"
@@ -223,6 +393,7 @@ LINODE_SERVERS = {
         "london": {
             "names": {"en": "UK-London", "zh": "英國-倫敦", "ja": "英国-ロンドン"},
             "host": "speedtest.london.linode.com",
+            "lat": 51.51, "lon": -0.13,
             "test_urls": {
                 "100MB": "https://speedtest.london.linode.com/100MB-london.bin",
                 "1GB": "https://speedtest.london.linode.com/1GB-london.bin"
@@ -231,6 +402,7 @@ LINODE_SERVERS = {
         "frankfurt": {
             "names": {"en": "Germany-Frankfurt", "zh": "德國-法蘭克福", "ja": "ドイツ-フランクフルト"},
             "host": "speedtest.frankfurt.linode.com",
+            "lat": 50.11, "lon": 8.68,
             "test_urls": {
                 "100MB": "https://speedtest.frankfurt.linode.com/100MB-frankfurt.bin",
                 "1GB": "https://speedtest.frankfurt.linode.com/1GB-frankfurt.bin"
@@ -245,172 +417,204 @@ VULTR_SERVERS = {
         "tokyo": {
             "names": {"en": "Japan-Tokyo", "zh": "日本-東京", "ja": "日本-東京"},
             "host": "hnd-jp-ping.vultr.com",
-            "ip": "108.61.201.151"
+            "ip": "108.61.201.151",
+            "lat": 35.55, "lon": 139.78
         },
         "osaka": {
             "names": {"en": "Japan-Osaka", "zh": "日本-大阪", "ja": "日本-大阪"},
             "host": "osk-jp-ping.vultr.com",
-            "ip": "64.176.34.94"
+            "ip": "64.176.34.94",
+            "lat": 34.69, "lon": 135.5
         },
         "seoul": {
             "names": {"en": "South Korea-Seoul", "zh": "韓國-首爾", "ja": "韓国-ソウル"},
             "host": "sel-kor-ping.vultr.com",
-            "ip": "141.164.34.61"
+            "ip": "141.164.34.61",
+            "lat": 37.57, "lon": 126.98
         },
         "singapore": {
             "names": {"en": "Singapore", "zh": "新加坡", "ja": "シンガポール"},
             "host": "sgp-ping.vultr.com",
-            "ip": "45.32.100.168"
+            "ip": "45.32.100.168",
+            "lat": 1.35, "lon": 103.82
         },
         "bangalore": {
             "names": {"en": "India-Bangalore", "zh": "印度-班加羅爾", "ja": "インド-バンガロール"},
             "host": "blr-in-ping.vultr.com",
-            "ip": "139.84.130.100"
+            "ip": "139.84.130.100",
+            "lat": 12.97, "lon": 77.59
         },
         "delhi": {
             "names": {"en": "India-Delhi NCR", "zh": "印度-德里NCR", "ja": "インド-デリー"},
             "host": "del-in-ping.vultr.com",
-            "ip": "139.84.162.104"
+            "ip": "139.84.162.104",
+            "lat": 28.61, "lon": 77.21
         },
         "mumbai": {
             "names": {"en": "India-Mumbai", "zh": "印度-孟買", "ja": "インド-ムンバイ"},
             "host": "bom-in-ping.vultr.com",
-            "ip": "65.20.66.100"
+            "ip": "65.20.66.100",
+            "lat": 19.08, "lon": 72.88
         },
         "tel_aviv": {
             "names": {"en": "Israel-Tel Aviv", "zh": "以色列-特拉維夫", "ja": "イスラエル-テルアビブ"},
             "host": "tlv-il-ping.vultr.com",
-            "ip": "64.176.162.16"
+            "ip": "64.176.162.16",
+            "lat": 32.09, "lon": 34.78
         }
     },
     "europe": {
         "london": {
             "names": {"en": "UK-London", "zh": "英國-倫敦", "ja": "イギリス-ロンドン"},
             "host": "lon-gb-ping.vultr.com",
-            "ip": "108.61.196.101"
+            "ip": "108.61.196.101",
+            "lat": 51.51, "lon": -0.13
         },
         "manchester": {
             "names": {"en": "UK-Manchester", "zh": "英國-曼徹斯特", "ja": "イギリス-マンチェスター"},
             "host": "man-uk-ping.vultr.com",
-            "ip": "64.176.178.136"
+            "ip": "64.176.178.136",
+            "lat": 53.48, "lon": -2.24
         },
         "frankfurt": {
             "names": {"en": "Germany-Frankfurt", "zh": "德國-法蘭克福", "ja": "ドイツ-フランクフルト"},
             "host": "fra-de-ping.vultr.com",
-            "ip": "108.61.210.117"
+            "ip": "108.61.210.117",
+            "lat": 50.11, "lon": 8.68
         },
         "paris": {
             "names": {"en": "France-Paris", "zh": "法國-巴黎", "ja": "フランス-パリ"},
             "host": "par-fr-ping.vultr.com",
-            "ip": "108.61.209.127"
+            "ip": "108.61.209.127",
+            "lat": 48.86, "lon": 2.35
         },
         "amsterdam": {
             "names": {"en": "Netherlands-Amsterdam", "zh": "荷蘭-阿姆斯特丹", "ja": "オランダ-アムステルダム"},
             "host": "ams-nl-ping.vultr.com",
-            "ip": "108.61.198.102"
+            "ip": "108.61.198.102",
+            "lat": 52.37, "lon": 4.9
         },
         "warsaw": {
             "names": {"en": "Poland-Warsaw", "zh": "波蘭-華沙", "ja": "ポーランド-ワルシャワ"},
             "host": "waw-pl-ping.vultr.com",
-            "ip": "70.34.242.24"
+            "ip": "70.34.242.24",
+            "lat": 52.23, "lon": 21.01
         },
         "stockholm": {
             "names": {"en": "Sweden-Stockholm", "zh": "瑞典-斯德哥爾摩", "ja": "スウェーデン-ストックホルム"},
             "host": "sto-se-ping.vultr.com",
-            "ip": "70.34.194.86"
+            "ip": "70.34.194.86",
+            "lat": 59.33, "lon": 18.07
         },
         "madrid": {
             "names": {"en": "Spain-Madrid", "zh": "西班牙-馬德里", "ja": "スペイン-マドリード"},
             "host": "mad-es-ping.vultr.com",
-            "ip": "208.76.222.30"
+            "ip": "208.76.222.30",
+            "lat": 40.42, "lon": -3.7
         }
     },
     "north_america": {
         "atlanta": {
             "names": {"en": "USA-Atlanta", "zh": "美國-亞特蘭大", "ja": "アメリカ-アトランタ"},
             "host": "ga-us-ping.vultr.com",
-            "ip": "108.61.193.166"
+            "ip": "108.61.193.166",
+            "lat": 33.75, "lon": -84.39
         },
         "chicago": {
             "names": {"en": "USA-Chicago", "zh": "美國-芝加哥", "ja": "アメリカ-シカゴ"},
             "host": "il-us-ping.vultr.com",
-            "ip": "107.191.51.12"
+            "ip": "107.191.51.12",
+            "lat": 41.88, "lon": -87.63
         },
         "dallas": {
             "names": {"en": "USA-Dallas", "zh": "美國-達拉斯", "ja": "アメリカ-ダラス"},
             "host": "tx-us-ping.vultr.com",
-            "ip": "108.61.224.175"
+            "ip": "108.61.224.175",
+            "lat": 32.78, "lon": -96.8
         },
         "honolulu": {
             "names": {"en": "USA-Honolulu", "zh": "美國-火奴魯魯", "ja": "アメリカ-ホノルル"},
             "host": "hon-hi-us-ping.vultr.com",
-            "ip": "208.72.154.76"
+            "ip": "208.72.154.76",
+            "lat": 21.31, "lon": -157.86
         },
         "los_angeles": {
             "names": {"en": "USA-Los Angeles", "zh": "美國-洛杉磯", "ja": "アメリカ-ロサンゼルス"},
             "host": "lax-ca-us-ping.vultr.com",
-            "ip": "108.61.219.200"
+            "ip": "108.61.219.200",
+            "lat": 34.05, "lon": -118.24
         },
         "miami": {
             "names": {"en": "USA-Miami", "zh": "美國-邁阿密", "ja": "アメリカ-マイアミ"},
             "host": "fl-us-ping.vultr.com",
-            "ip": "104.156.244.232"
+            "ip": "104.156.244.232",
+            "lat": 25.76, "lon": -80.19
         },
         "new_york": {
             "names": {"en": "USA-New York", "zh": "美國-紐約", "ja": "アメリカ-ニューヨーク"},
             "host": "nj-us-ping.vultr.com",
-            "ip": "108.61.149.182"
+            "ip": "108.61.149.182",
+            "lat": 40.55, "lon": -74.46
         },
         "seattle": {
             "names": {"en": "USA-Seattle", "zh": "美國-西雅圖", "ja": "アメリカ-シアトル"},
             "host": "wa-us-ping.vultr.com",
-            "ip": "108.61.194.105"
+            "ip": "108.61.194.105",
+            "lat": 47.61, "lon": -122.33
         },
         "silicon_valley": {
             "names": {"en": "USA-Silicon Valley", "zh": "美國-硅谷", "ja": "アメリカ-シリコンバレー"},
             "host": "sjo-ca-us-ping.vultr.com",
-            "ip": "104.156.230.107"
+            "ip": "104.156.230.107",
+            "lat": 37.34, "lon": -121.89
         },
         "toronto": {
             "names": {"en": "Canada-Toronto", "zh": "加拿大-多倫多", "ja": "カナダ-トロント"},
             "host": "tor-ca-ping.vultr.com",
-            "ip": "149.248.50.81"
+            "ip": "149.248.50.81",
+            "lat": 43.65, "lon": -79.38
         },
         "mexico_city": {
             "names": {"en": "Mexico-Mexico City", "zh": "墨西哥-墨西哥城", "ja": "メキシコ-メキシコシティ"},
             "host": "mex-mx-ping.vultr.com",
-            "ip": "216.238.66.16"
+            "ip": "216.238.66.16",
+            "lat": 19.43, "lon": -99.13
         }
     },
     "south_america": {
         "sao_paulo": {
             "names": {"en": "Brazil-São Paulo", "zh": "巴西-聖保羅", "ja": "ブラジル-サンパウロ"},
             "host": "sao-br-ping.vultr.com",
-            "ip": "216.238.98.118"
+            "ip": "216.238.98.118",
+            "lat": -23.55, "lon": -46.63
         },
         "santiago": {
             "names": {"en": "Chile-Santiago", "zh": "智利-聖地牙哥", "ja": "チリ-サンティアゴ"},
             "host": "scl-cl-ping.vultr.com",
-            "ip": "64.176.2.7"
+            "ip": "64.176.2.7",
+            "lat": -33.45, "lon": -70.67
         }
     },
     "africa": {
         "johannesburg": {
             "names": {"en": "South Africa-Johannesburg", "zh": "南非-約翰內斯堡", "ja": "南アフリカ-ヨハネスブルグ"},
             "host": "jnb-za-ping.vultr.com",
-            "ip": "139.84.226.78"
+            "ip": "139.84.226.78",
+            "lat": -26.2, "lon": 28.05
         }
     },
     "oceania": {
         "melbourne": {
             "names": {"en": "Australia-Melbourne", "zh": "澳大利亞-墨爾本", "ja": "オーストラリア-メルボルン"},
             "host": "mel-au-ping.vultr.com",
-            "ip": "67.219.110.24"
+            "ip": "67.219.110.24",
+            "lat": -37.81, "lon": 144.96
         },
         "sydney": {
             "names": {"en": "Australia-Sydney", "zh": "澳大利亞-雪梨", "ja": "オーストラリア-シドニー"},
             "host": "syd-au-ping.vultr.com",
-            "ip": "108.61.212.117"
+            "ip": "108.61.212.117",
+            "lat": -33.87, "lon": 151.21
         }
     }
 }
@@ -418,28 +622,688 @@ VULTR_SERVERS = {
 # 預設測試組合
 DEFAULT_TEST_SET = ["hinet_250m", "tokyo", "singapore", "new_york", "paris", "sydney"]
 
+# catalog_doctor.py 的檢查結果，測速前略過測試檔已知失效的伺服器
+DEFAULT_HEALTH_PATH = os.path.join(os.path.expanduser("~"), ".cache", "global_speedtest", "catalog_health.json")
+
+# Linux struct tcp_info 欄位配置 (較舊核心回傳的長度較短，不足部分補零；rcv_wnd 需 6.2 以上)
+TCP_INFO_FORMAT = "=8B24I4Q6IQ3Q2I2Q6I"
+TCP_INFO_FIELDS = (
+    "state", "ca_state", "retransmits", "probes", "backoff", "options", "wscale", "flags",
+    "rto", "ato", "snd_mss", "rcv_mss", "unacked", "sacked", "lost", "retrans", "fackets",
+    "last_data_sent", "last_ack_sent", "last_data_recv", "last_ack_recv",
+    "pmtu", "rcv_ssthresh", "rtt", "rttvar", "snd_ssthresh", "snd_cwnd", "advmss", "reordering",
+    "rcv_rtt", "rcv_space", "total_retrans",
+    "pacing_rate", "max_pacing_rate", "bytes_acked", "bytes_received",
+    "segs_out", "segs_in", "notsent_bytes", "min_rtt", "data_segs_in", "data_segs_out",
+    "delivery_rate",
+    "busy_time", "rwnd_limited", "sndbuf_limited", "delivered", "delivered_ce",
+    "bytes_sent", "bytes_retrans", "dsack_dups", "reord_seen", "rcv_ooopack", "snd_wnd",
+    "rcv_wnd", "rehash"
+)
+TCP_INFO_SIZE = struct.calcsize(TCP_INFO_FORMAT)
+
+def read_tcp_info(sock: Optional[socket.socket]) -> Optional[Dict[str, int]]:
+    """讀取 socket 的 TCP_INFO 核心統計 (僅 Linux)"""
+    if sock is None or not hasattr(socket, "TCP_INFO"):
+        return None
+    try:
+        raw = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_SIZE)
+    except (OSError, ValueError):
+        return None
+    raw = raw[:TCP_INFO_SIZE].ljust(TCP_INFO_SIZE, b"\0")
+    return dict(zip(TCP_INFO_FIELDS, struct.unpack(TCP_INFO_FORMAT, raw)))
+
+def get_response_socket(response) -> Optional[socket.socket]:
+    """取得 urlopen 回應底層的 socket"""
+    raw = getattr(getattr(response, "fp", None), "raw", None)
+    return getattr(raw, "_sock", None)
+
+class TcpInfoSampler:
+    """在下載過程中定期取樣 TCP_INFO 並彙整摘要"""
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.samples: List[Dict[str, int]] = []
+        self.last_sample = float("-inf")
+
+    def maybe_sample(self, sock: Optional[socket.socket], now: float, force: bool = False):
+        """距離上次取樣超過間隔時才取樣"""
+        if not force and now - self.last_sample < self.interval:
+            return
+        self.last_sample = now
+        info = read_tcp_info(sock)
+        if info is not None:
+            self.samples.append(info)
+
+    def summary(self, speed_bytes_per_s: float = 0.0, rcvbuf: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """彙整接收端 (下載方向) 的 RTT、亂序與接收視窗，並推測瓶頸
+
+        rtt、cwnd、重傳、delivery_rate 等欄位描述的是本機送出的方向 (請求與 ACK)，
+        下載時不代表伺服器端的狀態，只放在 sender 底下供參考，不用於判定。
+        rcvbuf 為手動設定的 SO_RCVBUF (核心回報值)，自動調整時為 None。
+        """
+        if not self.samples:
+            return None
+        last = self.samples[-1]
+        rcv_rtts = [s["rcv_rtt"] for s in self.samples if s["rcv_rtt"]]
+        rcv_wnds = [s["rcv_wnd"] for s in self.samples if s["rcv_wnd"]]
+        rtts = [s["rtt"] for s in self.samples if s["rtt"]]
+        segs_in = last["data_segs_in"] or last["segs_in"]
+        summary = {
+            "samples": len(self.samples),
+            "rcv_rtt_ms": sum(rcv_rtts) / len(rcv_rtts) / 1000 if rcv_rtts else None,
+            "rcv_rtt_max_ms": max(rcv_rtts) / 1000 if rcv_rtts else None,
+            # 交握時量到的連線 RTT
+            "min_rtt_ms": last["min_rtt"] / 1000 if last["min_rtt"] else None,
+            "rcv_ooopack": last["rcv_ooopack"],
+            "ooo_ratio": last["rcv_ooopack"] / segs_in if segs_in else None,
+            "peak_rcv_space": max(s["rcv_space"] for s in self.samples),
+            "peak_rcv_ssthresh": max(s["rcv_ssthresh"] for s in self.samples),
+            # 較舊的核心沒有 rcv_wnd
+            "peak_rcv_wnd": max(rcv_wnds) if rcv_wnds else None,
+            "rcvbuf": rcvbuf,
+            "window_mbit_s": None,
+            "sender": {
+                "rtt_ms": sum(rtts) / len(rtts) / 1000 if rtts else None,
+                "rttvar_ms": last["rttvar"] / 1000,
+                "total_retrans": last["total_retrans"],
+                "peak_cwnd": max(s["snd_cwnd"] for s in self.samples),
+                "delivery_rate_mbit_s": max(s["delivery_rate"] for s in self.samples) * 8 / 1e6,
+                "pacing_rate_mbit_s": max(s["pacing_rate"] for s in self.samples) * 8 / 1e6,
+            },
+        }
+        window = summary["peak_rcv_wnd"] or summary["peak_rcv_ssthresh"]
+        if summary["rcv_rtt_ms"] and window:
+            # 接收視窗 / 接收端 RTT 即為視窗允許的最大速率
+            summary["window_mbit_s"] = window * 8 / (summary["rcv_rtt_ms"] / 1000) / 1e6
+        summary["limit"] = classify_tcp_limit(summary, speed_bytes_per_s * 8 / 1e6)
+        return summary
+
+# 下載執行緒佔用單一核心的比例超過此值時，視為受限於用戶端 CPU
+CLIENT_LIMIT_THRESHOLD = 0.9
+# 量測時間太短時 CPU 時間的解析度不足，不做判定
+CLIENT_LIMIT_MIN_SECONDS = 0.5
+
+def read_cpu_times() -> Dict[str, Optional[float]]:
+    """目前行程的 user / sys CPU 秒數，以及呼叫端執行緒的 CPU 秒數 (不支援時為 None)"""
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        user, system = usage.ru_utime, usage.ru_stime
+    else:
+        times = os.times()
+        user, system = times.user, times.system
+    if resource is not None and hasattr(resource, "RUSAGE_THREAD"):
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+        thread = usage.ru_utime + usage.ru_stime
+    elif hasattr(time, "thread_time"):
+        thread = time.thread_time()
+    else:
+        thread = None
+    return {"user": user, "sys": system, "thread": thread}
+
+class CpuMeter:
+    """量測一段期間內行程與目前執行緒的 CPU 時間，並與經過時間比較
+
+    必須在同一個執行緒建立與呼叫 summary()；多條下載串流時每條串流各用一個。
+    """
+
+    def __init__(self):
+        self.start_wall = time.perf_counter()
+        self.start = read_cpu_times()
+
+    def summary(self) -> Dict[str, Any]:
+        wall = time.perf_counter() - self.start_wall
+        end = read_cpu_times()
+        user = end["user"] - self.start["user"]
+        system = end["sys"] - self.start["sys"]
+        thread = end["thread"] - self.start["thread"] if end["thread"] is not None else None
+        process_utilization = (user + system) / wall if wall > 0 else None
+        thread_utilization = thread / wall if thread is not None and wall > 0 else None
+        cpu_count = os.cpu_count() or 1
+        client_limited = None
+        if wall >= CLIENT_LIMIT_MIN_SECONDS:
+            # 讀取迴圈只能用到一個核心；整個行程吃滿所有核心也同樣不可信
+            busiest = thread_utilization if thread_utilization is not None else process_utilization
+            client_limited = (busiest >= CLIENT_LIMIT_THRESHOLD or
+                              process_utilization >= CLIENT_LIMIT_THRESHOLD * cpu_count)
+        return {
+            "wall_s": wall,
+            "user_s": user,
+            "sys_s": system,
+            "thread_s": thread,
+            "process_utilization": process_utilization,
+            "thread_utilization": thread_utilization,
+            "cpu_count": cpu_count,
+            "client_limited": client_limited,
+        }
+
+def classify_tcp_limit(summary: Dict[str, Any], speed_mbit_s: float) -> str:
+    """依接收端的 TCP_INFO 摘要推測下載瓶頸：loss / rcvbuf / window (速率皆為 SI Mbit/s)
+
+    亂序封包超過 1% 視為路徑掉包；吞吐量達到接收視窗 / 接收端 RTT 的 80% 時受限於視窗，
+    手動設定的 SO_RCVBUF 已被視窗用滿時為 rcvbuf-limited。都不符合時瓶頸在伺服器或路徑，
+    只看接收端無法區分。
+    """
+    if summary["ooo_ratio"] is not None and summary["ooo_ratio"] > 0.01:
+        return "loss-limited"
+    if summary["window_mbit_s"] and speed_mbit_s >= summary["window_mbit_s"] * 0.8:
+        window = summary["peak_rcv_wnd"] or summary["peak_rcv_ssthresh"]
+        # 核心回報的 SO_RCVBUF 含簿記開銷，可用的視窗約為一半
+        if summary["rcvbuf"] and window >= summary["rcvbuf"] / 2 * 0.9:
+            return "rcvbuf-limited"
+        return "window-limited"
+    return "unclassified"
+
+def steady_state_throughput(samples: List[Tuple[float, int]], ramp_threshold: float = 0.8,
+                            min_intervals: int = 4) -> Optional[Dict[str, float]]:
+    """由 (秒, 累計位元組) 取樣估計扣除慢啟動後的穩態吞吐量 (SI Mbit/s)
+
+    以後半段各區間速率的中位數為參考值，第一個達到參考值 ramp_threshold 倍的區間
+    視為爬升結束，之後的位元組 / 時間即為穩態吞吐量。取樣不足時回傳 None。
+    """
+    if len(samples) < min_intervals + 1:
+        return None
+    rates = []
+    for (t0, b0), (t1, b1) in zip(samples, samples[1:]):
+        rates.append((b1 - b0) / (t1 - t0) if t1 > t0 else 0.0)
+    tail = sorted(rates[len(rates) // 2:])
+    reference = tail[len(tail) // 2]
+    if reference <= 0:
+        return None
+    ramp_end = next(i for i, rate in enumerate(rates) if rate >= reference * ramp_threshold)
+    start_time, start_bytes = samples[ramp_end]
+    end_time, end_bytes = samples[-1]
+    first_time, first_bytes = samples[0]
+    if end_time <= start_time:
+        return None
+    return {
+        "steady_mbit_s": (end_bytes - start_bytes) * 8 / (end_time - start_time) / 1e6,
+        "transfer_mbit_s": (end_bytes - first_bytes) * 8 / (end_time - first_time) / 1e6,
+        "ramp_up_seconds": start_time - first_time,
+        "steady_seconds": end_time - start_time,
+    }
+
+# 目標速率判定：每秒視窗速率達到目標 90% 以上的時間比例需達 90%
+TARGET_WINDOW_RATIO = 0.9
+TARGET_TIME_RATIO = 0.9
+
+def evaluate_target_rate(samples: List[Tuple[float, int]], target_mbit_s: float, skip_seconds: float = 0.0,
+                         window: float = 1.0) -> Optional[Dict[str, Any]]:
+    """判斷路徑能否維持目標速率，並以每秒視窗速率的變異係數表示穩定度
+
+    skip_seconds 為略過的爬升時間 (通常是 steady_state_throughput 的 ramp_up_seconds)。
+    完整視窗不足兩個時回傳 None。
+    """
+    if not samples:
+        return None
+    first_time = samples[0][0] + skip_seconds
+    rates = []
+    window_start = None
+    for t, b in samples:
+        if t < first_time:
+            continue
+        if window_start is None:
+            window_start, window_bytes = t, b
+        elif t - window_start >= window:
+            rates.append((b - window_bytes) * 8 / (t - window_start) / 1e6)
+            window_start, window_bytes = t, b
+    if len(rates) < 2:
+        return None
+    mean = sum(rates) / len(rates)
+    stdev = (sum((rate - mean) ** 2 for rate in rates) / len(rates)) ** 0.5
+    ordered = sorted(rates)
+    time_at_target = sum(1 for rate in rates if rate >= target_mbit_s * TARGET_WINDOW_RATIO) / len(rates)
+    return {
+        "target_mbit_s": target_mbit_s,
+        "achieved_mbit_s": mean,
+        "min_mbit_s": ordered[0],
+        "p10_mbit_s": ordered[int(len(ordered) * 0.1)],
+        "cv": stdev / mean if mean > 0 else None,
+        "time_at_target": time_at_target,
+        "windows": len(rates),
+        "target_met": time_at_target >= TARGET_TIME_RATIO,
+    }
+
+class SpeedTestEvent:
+    """測試引擎發出的事件"""
+    PHASE_START = "phase_start"
+    PHASE_END = "phase_end"
+    PROGRESS = "progress"
+    RESULT = "result"
+    ERROR = "error"
+    INTERRUPTED = "interrupted"
+
+    __slots__ = ("kind", "server_key", "data", "timestamp")
+
+    def __init__(self, kind: str, server_key: Optional[str], data: Dict[str, Any]):
+        self.kind = kind
+        self.server_key = server_key
+        self.data = data
+        self.timestamp = time.time()
+
+    def __repr__(self):
+        return f"SpeedTestEvent({self.kind!r}, {self.server_key!r}, {self.data!r})"
+
+class EventEmitter:
+    """事件分派；沒有監聽者時 emit 不做任何事"""
+
+    def __init__(self):
+        self._listeners: List[Callable[[SpeedTestEvent], None]] = []
+
+    @property
+    def active(self) -> bool:
+        return bool(self._listeners)
+
+    def subscribe(self, callback: Callable[[SpeedTestEvent], None]):
+        self._listeners.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Callable[[SpeedTestEvent], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def emit(self, kind: str, server_key: Optional[str] = None, **data):
+        if not self._listeners:
+            return
+        event = SpeedTestEvent(kind, server_key, data)
+        for callback in list(self._listeners):
+            callback(event)
+
+class SpeedTestResult(dict):
+    """單一伺服器的測試結果
+
+    仍然是 dict (可直接 json.dump，與舊版欄位相容)，另外提供具型別的屬性存取。
+    """
+
+    @property
+    def server_key(self) -> str:
+        return self.get("server_key", "")
+
+    @property
+    def server_name(self) -> str:
+        return self.get("server_name", self.server_key)
+
+    @property
+    def success(self) -> bool:
+        return "download_mbps" in self
+
+    @property
+    def download_mbps(self) -> Optional[float]:
+        return self.get("download_mbps")
+
+    @property
+    def ping_ms(self) -> Optional[float]:
+        return self.get("ping_ms")
+
+    @property
+    def downloaded_bytes(self) -> int:
+        return self.get("downloaded_bytes", 0)
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.get("error")
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.get("partial"))
+
+    @property
+    def partial_reason(self) -> Optional[str]:
+        return self.get("partial_reason")
+
+    @property
+    def steady_mbit_s(self) -> Optional[float]:
+        return self.get("steady_mbit_s")
+
+    @property
+    def client_limited(self) -> bool:
+        return bool(self.get("client_limited"))
+
+    @property
+    def target_met(self) -> Optional[bool]:
+        return self.get("target_met")
+
+    @property
+    def bufferbloat_ms(self) -> Optional[float]:
+        return self.get("bufferbloat_ms")
+
+    @property
+    def rtt_anomaly(self) -> Optional[str]:
+        return self.get("rtt_anomaly")
+
+class CancelToken:
+    """取消單一測試用的旗標；取消時會呼叫已註冊的回呼 (例如關閉阻塞中的 socket)"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback: Callable[[], None]):
+        """註冊取消時要執行的動作；若已取消則立即執行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: float) -> bool:
+        """等待最多 timeout 秒，期間被取消則提早返回 True"""
+        return self._event.wait(timeout)
+
+def shutdown_socket(sock: Optional[socket.socket]):
+    """中止阻塞中的 recv，讓讀取迴圈立即返回"""
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def parse_size(value: str) -> int:
+    """解析位元組大小字串 (例如 4M、512K、8388608)"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = str(value).strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def create_tuned_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None,
+                            rcvbuf: Optional[int] = None, resolver: Optional[Callable] = None,
+                            timings: Optional[Dict[str, float]] = None) -> socket.socket:
+    """與 socket.create_connection 相同，但在 connect 之前設定接收緩衝區
+
+    SO_RCVBUF 必須在三向交握之前設定，視窗縮放 (window scaling) 才會依此協商。
+    resolver 與 socket.getaddrinfo 介面相同，可替換成有快取的解析函式。
+    timings 不為 None 時記錄 DNS 解析與 TCP 連線耗時 (ms)。
+    """
+    host, port = address
+    error = None
+    tracer = get_tracer()
+    resolve_start = perf_counter_ns()
+    addresses = (resolver or socket.getaddrinfo)(host, port, 0, socket.SOCK_STREAM)
+    resolve_end = perf_counter_ns()
+    tracer.add_span("resolve", resolve_start, resolve_end, host=host)
+    if timings is not None:
+        timings["dns_ms"] = (resolve_end - resolve_start) / 1e6
+    for family, socktype, proto, _, sockaddr in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            connect_start = perf_counter_ns()
+            sock.connect(sockaddr)
+            connect_end = perf_counter_ns()
+            tracer.add_span("connect", connect_start, connect_end, address=str(sockaddr[0]), port=port)
+            if timings is not None:
+                timings["tcp_connect_ms"] = (connect_end - connect_start) / 1e6
+                timings["tcp_connected_ns"] = connect_end
+            return sock
+        except OSError as e:
+            error = e
+            if sock is not None:
+                sock.close()
+    if error is not None:
+        raise error
+    raise OSError(f"getaddrinfo returns an empty list for {host}")
+
+class _TunedConnectionMixin:
+    """讓 http.client 連線改用 create_tuned_connection 建立 socket"""
+
+    def __init__(self, *args, rcvbuf: Optional[int] = None, resolver: Optional[Callable] = None,
+                 timings: Optional[Dict[str, float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rcvbuf = rcvbuf
+        self.resolver = resolver
+        # 未指定時仍需記錄，供 TLS 耗時計算使用
+        self.timings = timings if timings is not None else {}
+        self._create_connection = self._create_tuned_connection
+
+    def _create_tuned_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+        return create_tuned_connection(address, timeout, source_address, rcvbuf=self.rcvbuf, resolver=self.resolver,
+                                       timings=self.timings)
+
+    def connect(self):
+        timings = self.timings
+        super().connect()
+        now = perf_counter_ns()
+        timings["connected_ns"] = now
+        if isinstance(self, http.client.HTTPSConnection) and "tcp_connected_ns" in timings:
+            # HTTPSConnection.connect = TCP 連線 + TLS 交握
+            timings["tls_ms"] = (now - timings["tcp_connected_ns"]) / 1e6
+            get_tracer().add_span("tls", timings["tcp_connected_ns"], now, host=self.host)
+
+class TunedHTTPConnection(_TunedConnectionMixin, http.client.HTTPConnection):
+    pass
+
+class TunedHTTPSConnection(_TunedConnectionMixin, http.client.HTTPSConnection):
+    pass
+
+class TunedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, rcvbuf: Optional[int] = None, resolver: Optional[Callable] = None,
+                 timings: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rcvbuf = rcvbuf
+        self.resolver = resolver
+        self.timings = timings
+
+    def http_open(self, req):
+        return self.do_open(TunedHTTPConnection, req, rcvbuf=self.rcvbuf, resolver=self.resolver,
+                            timings=self.timings)
+
+class TunedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, rcvbuf: Optional[int] = None, resolver: Optional[Callable] = None,
+                 timings: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rcvbuf = rcvbuf
+        self.resolver = resolver
+        self.timings = timings
+
+    def https_open(self, req):
+        return self.do_open(TunedHTTPSConnection, req, context=self._context, rcvbuf=self.rcvbuf,
+                            resolver=self.resolver, timings=self.timings)
+
+class LatencyProber:
+    """以 TCP 連線建立時間 (SYN → SYN-ACK) 持續量測 RTT
+
+    下載進行中探測封包與下載資料共用同一個瓶頸佇列，
+    負載下 RTT 與閒置 RTT 的差值即為 bufferbloat。
+    """
+
+    def __init__(self, host: str, port: int = 80, interval: float = 0.2, timeout: float = 3.0):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.timeout = timeout
+        self.idle: List[float] = []
+        self.loaded: List[float] = []
+        self.lost = 0
+        self._address = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_target(cls, target: str, default_port: int = 80, interval: float = 0.2) -> "LatencyProber":
+        """由 "host[:port]" 或 URL 建立探測器"""
+        if "://" in target:
+            parsed = urlparse(target)
+            port = parsed.port or (443 if parsed.scheme == "https" else 80)
+            return cls(parsed.hostname, port, interval)
+        host, _, port = target.rpartition(":") if target.count(":") == 1 else (target, "", "")
+        return cls(host, int(port) if port else default_port, interval)
+
+    def probe_once(self) -> Optional[float]:
+        """建立一次 TCP 連線並回傳耗時 (ms)，失敗時回傳 None"""
+        try:
+            if self._address is None:
+                # 只解析一次，避免 DNS 時間混入 RTT
+                family, socktype, proto, _, address = socket.getaddrinfo(
+                    self.host, self.port, 0, socket.SOCK_STREAM)[0]
+                self._address = (family, socktype, proto, address)
+            family, socktype, proto, address = self._address
+            sock = socket.socket(family, socktype, proto)
+        except OSError:
+            return None
+        try:
+            sock.settimeout(self.timeout)
+            start = perf_counter_ns()
+            sock.connect(address)
+            end = perf_counter_ns()
+            get_tracer().add_span("latency_probe", start, end, target=f"{self.host}:{self.port}")
+            return (end - start) / 1e6
+        except OSError:
+            return None
+        finally:
+            sock.close()
+
+    def sample_idle(self, count: int = 5, cancel_token: Optional[CancelToken] = None):
+        """下載前量測閒置 RTT"""
+        for i in range(count):
+            if cancel_token is not None and cancel_token.cancelled:
+                break
+            rtt = self.probe_once()
+            if rtt is None:
+                self.lost += 1
+            else:
+                self.idle.append(rtt)
+            if i < count - 1:
+                time.sleep(self.interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rtt = self.probe_once()
+            if self._stop.is_set():
+                break
+            if rtt is None:
+                self.lost += 1
+            else:
+                self.loaded.append(rtt)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout + 1)
+
+    def summary(self) -> Dict[str, Any]:
+        """閒置 / 負載 RTT 統計與差值"""
+        idle = summarize_latencies(self.idle)
+        loaded = summarize_latencies(self.loaded)
+        result = {
+            "target": f"{self.host}:{self.port}",
+            "method": "tcp_connect",
+            "idle_samples": len(self.idle),
+            "loaded_samples": len(self.loaded),
+            "lost": self.lost,
+            "idle_ms": idle["p50_ms"] if self.idle else None,
+            "loaded_p50_ms": loaded["p50_ms"] if self.loaded else None,
+            "loaded_p90_ms": loaded["p90_ms"] if self.loaded else None,
+            "loaded_p99_ms": loaded["p99_ms"] if self.loaded else None,
+            "loaded_max_ms": loaded["max_ms"] if self.loaded else None,
+            "delta_ms": None,
+        }
+        if self.idle and self.loaded:
+            result["delta_ms"] = result["loaded_p50_ms"] - result["idle_ms"]
+        return result
+
 class SpeedTest:
-    def __init__(self, timeout: int = 30):
+    def __init__(self, timeout: int = 30, tcp_info: bool = True, tcp_info_interval: float = 0.25,
+                 rcvbuf: Optional[int] = None, resolver: Optional[Callable] = None,
+                 sink_dir: Optional[str] = None, sink_mode: str = "buffered",
+                 max_rate_mbit_s: Optional[float] = None, target_rate_mbit_s: Optional[float] = None):
         self.timeout = timeout
+        # 限速 (SI Mbit/s)；只指定目標速率時以目標速率限速，不佔用多餘頻寬
+        self.max_rate_mbit_s = max_rate_mbit_s or target_rate_mbit_s
+        self.target_rate_mbit_s = target_rate_mbit_s
+        if self.max_rate_mbit_s and rcvbuf is None:
+            # 限制接收緩衝區約為 100 ms 的額度，避免自動調整讓伺服器一次送出大量資料
+            rcvbuf = max(65536, int(self.max_rate_mbit_s * 1e6 / 8 * 0.1))
+        # sink_dir 不為 None 時把下載資料寫入該目錄的暫存檔 ("" 為系統暫存目錄)
+        self.sink_dir = sink_dir
+        self.sink_mode = sink_mode
+        self.tcp_info = tcp_info and hasattr(socket, "TCP_INFO")
+        self.tcp_info_interval = tcp_info_interval
+        self.rcvbuf = rcvbuf
+        # 最近一次連線的 DNS / TCP / TLS 耗時，由連線類別填入
+        self.connection_timings: Dict[str, float] = {}
+        self.opener = urllib.request.build_opener(TunedHTTPHandler(rcvbuf, resolver, self.connection_timings),
+                                                  TunedHTTPSHandler(rcvbuf, resolver, self.connection_timings))
+        # 下載量測使用的時鐘；重播記錄時換成虛擬時鐘 (見 session_trace.py)
+        self.clock: Callable[[], float] = time.perf_counter
+        # 不為 None 時記錄每次讀取的時間與位元組數 (session_trace.SessionRecorder)
+        self.recorder = None
+        # 不為 None 時下載到此位元組數即停止 (測試計畫的流量預算)，結果標記 partial_reason "budget"
+        self.max_bytes: Optional[int] = None
 
-    def ping_test(self, host: str) -> float:
+    def use_resolver(self, resolver: Optional[Callable]):
+        """替換之後連線使用的名稱解析函式 (介面與 socket.getaddrinfo 相同)"""
+        for handler in self.opener.handlers:
+            if isinstance(handler, (TunedHTTPHandler, TunedHTTPSHandler)):
+                handler.resolver = resolver
+
+    def ping_test(self, host: str, cancel_token: Optional[CancelToken] = None) -> float:
         """測試延遲"""
         try:
             # 使用 ping 命令測試延遲
-            result = subprocess.run(
+            process = subprocess.Popen(
                 ["ping", "-c", "3", host],
-                capture_output=True,
-                text=True,
-                timeout=10
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True
             )
-            if result.returncode == 0:
+            if cancel_token is not None:
+                cancel_token.add_callback(process.kill)
+            try:
+                stdout, _ = process.communicate(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                return -1
+            finally:
+                if cancel_token is not None:
+                    cancel_token.remove_callback(process.kill)
+            if process.returncode == 0:
                 # 解析 ping 結果，提取平均延遲
-                lines = result.stdout.split('\n')
+                lines = stdout.split('\n')
                 for line in lines:
                     if 'avg' in line or '平均' in line:
-                        # macOS/Linux: time=xx.xx ms
                         import re
-                        match = re.search(r'(\d+\.?\d*)\s*ms', line)
+                        # macOS/Linux: rtt min/avg/max/mdev = 1.1/2.2/3.3/0.4 ms，取第二個值
+                        match = re.search(r'=\s*[\d.]+/([\d.]+)/', line)
+                        if not match:
+                            match = re.search(r'(\d+\.?\d*)\s*ms', line)
                         if match:
                             return float(match.group(1))
             return -1
@@ -449,8 +1313,18 @@ class SpeedTest:
         except Exception:
             return -1
 
-    def download_test(self, host: str, test_size: str = "100MB", show_progress: bool = True, quick_test: bool = False, custom_url: str = None, lang: str = "en") -> Dict[str, Any]:
-        """下載速度測試"""
+    def download_test(self, host: str, test_size: str = "100MB", show_progress: bool = True, quick_test: bool = False, custom_url: str = None, lang: str = "en",
+                      events: Optional["EventEmitter"] = None, server_key: Optional[str] = None,
+                      cancel_token: Optional[CancelToken] = None) -> Dict[str, Any]:
+        """下載速度測試
+
+        進度不再直接輸出，而是透過 events 發出 progress 事件；沒有監聽者時不計算任何進度數值。
+        被取消、超過時限或傳輸中發生錯誤時，已下載的部分仍會回傳為 partial 結果；
+        Ctrl+C 則以 PartialResultInterrupt 把部分結果帶給上層。
+        """
+        report_progress = show_progress and events is not None and events.active
+        tracer = get_tracer()
+        abort = None
         if custom_url:
             test_url = custom_url
         else:
@@ -460,19 +1334,38 @@ class SpeedTest:
             else:
                 test_url = f"http://{host}/vultr.com.1000MB.bin"
 
+        # 準備進度追蹤
+        measurement = DownloadMeasurement(test_url, self.clock())
+        measurement.tcp_sampler = TcpInfoSampler(self.tcp_info_interval) if self.tcp_info else None
+        bucket = TokenBucket(self.max_rate_mbit_s * 1e6 / 8) if self.max_rate_mbit_s else None
+        stop_reason = None
+        self.connection_timings.clear()
+
         try:
-            # 準備進度追蹤
-            start_time = time.time()
-            total_downloaded = 0
             chunk_size = 8192
-            last_update = start_time
-            speed_samples = []
+            last_update = measurement.start_time
 
             # 創建請求
             req = urllib.request.Request(test_url)
             req.add_header('User-Agent', 'Vultr-SpeedTest/1.0')
 
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                measurement.headers_at = self.clock()
+                if "connected_ns" in self.connection_timings:
+                    tracer.add_span("request", self.connection_timings["connected_ns"], int(measurement.headers_at * 1e9),
+                                    url=test_url, status=response.status)
+                interval_start, interval_bytes = measurement.headers_at, 0
+                # 只計算資料傳輸期間的 CPU，交握等待不算在內
+                measurement.cpu = CpuMeter()
+                if self.sink_dir is not None:
+                    measurement.sink = DiskSink(self.sink_dir, self.sink_mode)
+                    measurement.sink.open()
+                sock = measurement.sock = get_response_socket(response)
+                if cancel_token is not None:
+                    abort = lambda: shutdown_socket(sock)
+                    cancel_token.add_callback(abort)
+                measurement.effective_rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) if sock else None
+                measurement.connection = dict(self.connection_timings)
                 content_length = response.headers.get('Content-Length')
                 if content_length:
                     total_size = int(content_length)
@@ -487,74 +1380,430 @@ class SpeedTest:
                     else:
                         total_size = 100 * 1024 * 1024  # 100MB fallback
 
-                if show_progress:
-                    print(f"    {get_text('file_size', lang)}: {total_size / 1024 / 1024:.1f} MB")
-                    print("    ", end="", flush=True)
+                if self.recorder is not None:
+                    self.recorder.on_response(measurement, content_length)
+                if events is not None:
+                    events.emit(SpeedTestEvent.PHASE_START, server_key, phase="transfer",
+                                total_bytes=total_size, test_url=test_url)
 
                 # 下載資料並計算速度
-                while total_downloaded < total_size:
-                    chunk_start = time.time()
-                    chunk = response.read(chunk_size)
+                while measurement.downloaded < total_size:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        stop_reason = cancel_token.reason
+                        break
+                    if self.max_bytes is not None and measurement.downloaded >= self.max_bytes:
+                        stop_reason = "budget"
+                        break
+
+                    chunk = response.read(chunk_size if self.max_bytes is None
+                                          else min(chunk_size, self.max_bytes - measurement.downloaded))
                     if not chunk:
+                        if cancel_token is not None and cancel_token.cancelled:
+                            # 取消時關閉 socket 造成的連線結束
+                            stop_reason = cancel_token.reason
+                        elif content_length:
+                            # 伺服器在 Content-Length 之前就關閉連線
+                            stop_reason = "error"
                         break
 
-                    chunk_time = time.time() - chunk_start
-                    total_downloaded += len(chunk)
-                    current_time = time.time()
-                    elapsed = current_time - start_time
+                    measurement.downloaded += len(chunk)
+                    if measurement.sink is not None:
+                        measurement.sink.write(chunk)
+                    if bucket is not None:
+                        bucket.consume(len(chunk))
+                    current_time = self.clock()
+                    measurement.add_sample(current_time)
+                    if self.recorder is not None:
+                        self.recorder.on_read(current_time, len(chunk))
+                    elapsed = current_time - measurement.start_time
 
-                    # 計算即時速度 (每0.5秒更新一次)
-                    if show_progress and (current_time - last_update) >= 0.5:
+                    if tracer.enabled and current_time - interval_start >= 0.5:
+                        interval_mbit_s = (measurement.downloaded - interval_bytes) * 8 / (current_time - interval_start) / 1e6
+                        tracer.add_span("transfer.interval", int(interval_start * 1e9), int(current_time * 1e9),
+                                        bytes=measurement.downloaded - interval_bytes, mbit_s=interval_mbit_s)
+                        interval_start, interval_bytes = current_time, measurement.downloaded
+
+                    if measurement.tcp_sampler:
+                        measurement.tcp_sampler.maybe_sample(sock, current_time)
+
+                    # 發出進度取樣 (每0.5秒一次)
+                    if report_progress and (current_time - last_update) >= 0.5:
                         if elapsed > 0:
-                            current_speed_mbps = (total_downloaded / elapsed) / 1024 / 1024 * 8
-                            progress_percent = (total_downloaded / total_size) * 100
-                            downloaded_mb = total_downloaded / 1024 / 1024
-
-                            # 清除當前行並顯示進度
-                            progress_bar = "█" * int(progress_percent // 5) + "░" * (20 - int(progress_percent // 5))
-                            print(f"\r    [{progress_bar}] {progress_percent:.1f}% | "
-                                  f"{downloaded_mb:.1f}MB | {current_speed_mbps:.1f} Mbps",
-                                  end="", flush=True)
+                            events.emit(SpeedTestEvent.PROGRESS, server_key,
+                                        downloaded_bytes=measurement.downloaded, total_bytes=total_size,
+                                        elapsed_seconds=elapsed,
+                                        speed_mbps=(measurement.downloaded / elapsed) / 1024 / 1024 * 8)
                         last_update = current_time
 
                     # 限制下載時間，避免過長
                     if elapsed > self.timeout:
+                        stop_reason = "deadline"
                         break
 
                     # 如果是快速測試模式，可以提前結束
-                    if quick_test and elapsed >= 5 and total_downloaded >= 1048576:  # 至少5秒和1MB
+                    if quick_test and elapsed >= 5 and measurement.downloaded >= 1048576:  # 至少5秒和1MB
                         # 但如果是100MB測試且速度很快，至少下載10MB
-                        if test_size == "100MB" and total_downloaded < 10485760 and elapsed < 10:
+                        if test_size == "100MB" and measurement.downloaded < 10485760 and elapsed < 10:
                             continue
                         break
 
-                if show_progress:
-                    print()  # 換行
-
-            end_time = time.time()
-            elapsed = end_time - start_time
-
-            if elapsed > 0:
-                speed_bps = total_downloaded / elapsed
-                speed_mbps = speed_bps / 1024 / 1024 * 8  # 轉換為 Mbps
-
-                return {
-                    "success": True,
-                    "speed_mbps": speed_mbps,
-                    "downloaded_bytes": total_downloaded,
-                    "elapsed_seconds": elapsed,
-                    "test_url": test_url
-                }
-            else:
-                return {"success": False, "error": get_text("test_timeout", lang)}
+                if measurement.tcp_sampler:
+                    # 結束前再取樣一次，確保重傳等累計值是最新的
+                    measurement.tcp_sampler.maybe_sample(sock, self.clock(), force=True)
 
         except KeyboardInterrupt:
-            # 重新拋出 KeyboardInterrupt 讓上層處理
+            # 保留中斷前已下載的部分，再讓上層處理 KeyboardInterrupt
+            result = self.finish_download(measurement, "interrupted", lang, events, server_key)
+            if result["success"]:
+                raise PartialResultInterrupt(result) from None
             raise
-        except urllib.error.URLError as e:
-            return {"success": False, "error": f"{get_text('connection_error', lang)}: {e}"}
         except Exception as e:
-            return {"success": False, "error": f"{get_text('test_failed', lang)}: {e}"}
+            if cancel_token is not None and cancel_token.cancelled:
+                # 取消時關閉 socket 造成的讀取錯誤
+                stop_reason = cancel_token.reason
+            elif measurement.downloaded > 0:
+                return self.finish_download(measurement, "error", lang, events, server_key,
+                                            error=f"{get_text('test_failed', lang)}: {e}")
+            elif isinstance(e, urllib.error.URLError):
+                measurement.discard_sink()
+                return {"success": False, "error": f"{get_text('connection_error', lang)}: {e}"}
+            else:
+                measurement.discard_sink()
+                return {"success": False, "error": f"{get_text('test_failed', lang)}: {e}"}
+        finally:
+            if abort is not None:
+                cancel_token.remove_callback(abort)
+
+        if stop_reason == "error":
+            return self.finish_download(measurement, stop_reason, lang, events, server_key,
+                                        error=get_text("connection_closed", lang))
+        if stop_reason is not None and stop_reason != "deadline" and measurement.downloaded == 0:
+            measurement.discard_sink()
+            return {"success": False, "cancelled": True,
+                    "error": f"{get_text('test_cancelled', lang)} ({stop_reason})"}
+        return self.finish_download(measurement, stop_reason, lang, events, server_key)
+
+    def finish_download(self, measurement: "DownloadMeasurement", partial_reason: Optional[str], lang: str = "en",
+                        events: Optional["EventEmitter"] = None, server_key: Optional[str] = None,
+                        error: Optional[str] = None) -> Dict[str, Any]:
+        """由目前為止的量測值組成下載結果；partial_reason 不為 None 時標記為部分結果"""
+        end_time = self.clock()
+        elapsed = end_time - measurement.start_time
+        # 等待寫入執行緒把剩下的資料寫完 (不計入原本的下載時間)
+        disk = measurement.sink.close() if measurement.sink is not None else None
+        tracer = get_tracer()
+        if tracer.enabled and measurement.samples and measurement.headers_at is not None:
+            first_byte_at = measurement.samples[0][0]
+            tracer.add_span("first_byte", int(measurement.headers_at * 1e9), int(first_byte_at * 1e9))
+            tracer.add_span("transfer", int(first_byte_at * 1e9), int(measurement.last_byte_at * 1e9),
+                            bytes=measurement.downloaded, partial_reason=partial_reason or "")
+
+        if elapsed <= 0 or measurement.downloaded == 0:
+            return {"success": False, "error": error or get_text("test_timeout", lang)}
+
+        speed_bps = measurement.downloaded / elapsed
+        speed_mbps = speed_bps / 1024 / 1024 * 8  # 轉換為 Mbps
+
+        result = {
+            "success": True,
+            "speed_mbps": speed_mbps,
+            "downloaded_bytes": measurement.downloaded,
+            "elapsed_seconds": elapsed,
+            "test_url": measurement.test_url
+        }
+        if partial_reason is not None:
+            result["partial"] = True
+            result["partial_reason"] = partial_reason
+            if error:
+                result["partial_error"] = error
+        if self.rcvbuf:
+            result["rcvbuf_requested"] = self.rcvbuf
+            result["rcvbuf_effective"] = measurement.effective_rcvbuf
+
+        tcp_summary = (measurement.tcp_sampler.summary(speed_bps, measurement.effective_rcvbuf if self.rcvbuf else None)
+                       if measurement.tcp_sampler else None)
+        if tcp_summary:
+            result["tcp_info"] = tcp_summary
+
+        result.update(measurement.timing_summary())
+
+        if measurement.cpu is not None:
+            cpu = measurement.cpu.summary()
+            result["cpu"] = cpu
+            result["client_limited"] = bool(cpu["client_limited"])
+
+        if disk is not None:
+            result.update(measurement.sink_summary(disk))
+
+        if self.max_rate_mbit_s:
+            result["max_rate_mbit_s"] = self.max_rate_mbit_s
+        if self.target_rate_mbit_s:
+            target = evaluate_target_rate(measurement.samples, self.target_rate_mbit_s,
+                                          result.get("ramp_up_seconds") or 0.0)
+            result["target_rate"] = target
+            result["target_met"] = target["target_met"] if target is not None else None
+
+        if events is not None:
+            events.emit(SpeedTestEvent.PHASE_END, server_key, phase="transfer", result=result)
+        return result
+
+class TokenBucket:
+    """以 token bucket 限制讀取速率；consume() 在額度不足時睡眠到補足為止
+
+    讀取變慢後接收視窗跟著縮小，TCP 流量控制會讓伺服器端降速。
+    clock / sleep 可替換成虛擬時鐘 (測試用)。
+    """
+
+    def __init__(self, rate_bytes: float, burst_bytes: Optional[int] = None,
+                 clock: Callable[[], float] = time.perf_counter, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate_bytes
+        # 預設允許 50 ms 的突發量
+        self.burst = burst_bytes if burst_bytes is not None else max(65536, int(rate_bytes * 0.05))
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.waited = 0.0
+
+    def consume(self, amount: int):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            delay = -self.tokens / self.rate
+            self.sleep(delay)
+            self.waited += delay
+
+SINK_MODES = ("buffered", "fdatasync", "direct")
+
+class DiskSink:
+    """把下載的資料交給寫入執行緒存到暫存檔，量測磁碟寫入速度
+
+    mode:
+        buffered  一般寫入 (經過 page cache，不等待落盤)
+        fdatasync 每寫入 sync_bytes 與結束時呼叫 fdatasync
+        direct    O_DIRECT 以對齊的區塊寫入，繞過 page cache (僅 Linux)
+    佇列滿時 write() 會阻塞，磁碟較慢時下載也會跟著放慢，端到端速度即反映磁碟瓶頸。
+    """
+
+    def __init__(self, directory: Optional[str] = None, mode: str = "buffered", block_size: int = 1 << 20,
+                 queue_blocks: int = 64, sync_bytes: int = 64 << 20):
+        if mode not in SINK_MODES:
+            raise ValueError(f"unknown sink mode: {mode}")
+        if mode == "direct" and not hasattr(os, "O_DIRECT"):
+            raise ValueError("O_DIRECT is not supported on this platform")
+        self.directory = directory or None
+        self.mode = mode
+        self.block_size = block_size
+        self.sync_bytes = sync_bytes
+        # 佇列以下載的 chunk 為單位，容量換算成約 queue_blocks 個寫入區塊
+        self.queue: "queue.Queue[Optional[bytes]]" = queue.Queue(max(1, queue_blocks * block_size // 8192))
+        self.path: Optional[str] = None
+        self.fd: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[OSError] = None
+        self.written = 0
+        self.write_seconds = 0.0
+        self.sync_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.closed_at: Optional[float] = None
+
+    def open(self):
+        fd, self.path = tempfile.mkstemp(prefix="speedtest-", suffix=".bin", dir=self.directory)
+        if self.mode == "direct":
+            os.close(fd)
+            fd = os.open(self.path, os.O_WRONLY | os.O_DIRECT)
+        self.fd = fd
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, chunk: bytes):
+        """交給寫入執行緒；佇列滿時阻塞，並記錄阻塞的時間"""
+        if self.error is not None:
+            raise self.error
+        try:
+            self.queue.put_nowait(chunk)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(chunk)
+            self.blocked_seconds += time.perf_counter() - start
+
+    def _run(self):
+        if self.mode == "direct":
+            # O_DIRECT 要求緩衝區、長度與位移都對齊；mmap 配置的記憶體以頁面對齊
+            block = mmap.mmap(-1, self.block_size)
+        else:
+            block = bytearray(self.block_size)
+        view = memoryview(block)
+        filled = 0
+        unsynced = 0
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            if self.error is not None:
+                continue  # 已經失敗，只是把佇列清空讓下載端不會卡住
+            offset = 0
+            while offset < len(chunk):
+                n = min(len(chunk) - offset, self.block_size - filled)
+                view[filled:filled + n] = chunk[offset:offset + n]
+                filled += n
+                offset += n
+                if filled == self.block_size:
+                    unsynced += self._write_block(view, filled)
+                    filled = 0
+                    if self.mode == "fdatasync" and unsynced >= self.sync_bytes:
+                        self._sync()
+                        unsynced = 0
+        if filled and self.error is None:
+            if self.mode == "direct":
+                # 最後不足一個區塊的部分關閉 O_DIRECT 後寫入
+                flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+                fcntl.fcntl(self.fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+            self._write_block(view, filled)
+        if self.mode != "buffered" and self.error is None:
+            self._sync()
+        view.release()
+        if self.mode == "direct":
+            block.close()
+
+    def _write_block(self, view: memoryview, length: int) -> int:
+        start = time.perf_counter()
+        try:
+            written = 0
+            while written < length:
+                written += os.write(self.fd, view[written:length])
+        except OSError as e:
+            self.error = e
+            return 0
+        finally:
+            self.write_seconds += time.perf_counter() - start
+        self.written += length
+        return length
+
+    def _sync(self):
+        start = time.perf_counter()
+        try:
+            getattr(os, "fdatasync", os.fsync)(self.fd)
+        except OSError as e:
+            self.error = e
+        self.sync_seconds += time.perf_counter() - start
+
+    def close(self) -> Dict[str, Any]:
+        """等待寫入 (與落盤) 完成、刪除檔案並回傳統計"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.closed_at = time.perf_counter()
+        self.discard()
+        disk_seconds = self.write_seconds + self.sync_seconds
+        return {
+            "mode": self.mode,
+            "directory": self.directory or tempfile.gettempdir(),
+            "written_bytes": self.written,
+            "write_seconds": self.write_seconds,
+            "sync_seconds": self.sync_seconds,
+            "blocked_seconds": self.blocked_seconds,
+            "disk_mbit_s": self.written * 8 / disk_seconds / 1e6 if disk_seconds > 0 else None,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+    def discard(self):
+        """關閉並刪除暫存檔 (可重複呼叫)"""
+        if self.thread is not None:
+            self.error = self.error or OSError("sink discarded")
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+class DownloadMeasurement:
+    """單次下載目前為止的量測狀態"""
+
+    def __init__(self, test_url: str, start_time: float, sample_interval: float = 0.1):
+        self.test_url = test_url
+        self.start_time = start_time
+        self.downloaded = 0
+        self.sock: Optional[socket.socket] = None
+        self.effective_rcvbuf: Optional[int] = None
+        self.tcp_sampler: Optional[TcpInfoSampler] = None
+        self.cpu: Optional[CpuMeter] = None
+        self.sink: Optional[DiskSink] = None
+        self.connection: Dict[str, float] = {}
+        self.headers_at: Optional[float] = None
+        # (perf_counter 秒, 累計位元組)，第一筆為收到第一個位元組的時間
+        self.samples: List[Tuple[float, int]] = []
+        self.sample_interval = sample_interval
+        self.last_byte_at = 0.0
+
+    def discard_sink(self):
+        if self.sink is not None:
+            self.sink.discard()
+
+    def sink_summary(self, disk: Dict[str, Any]) -> Dict[str, Any]:
+        """分開計算網路接收、磁碟寫入與端到端速度 (SI Mbit/s)
+
+        網路接收時間扣除等待寫入佇列的時間；端到端從收到回應到資料全部寫完 (含 fdatasync)。
+        """
+        summary: Dict[str, Any] = {"disk_sink": disk, "disk_mbit_s": disk["disk_mbit_s"],
+                                   "network_mbit_s": None, "end_to_end_mbit_s": None, "disk_limited": False}
+        if self.headers_at is None or not self.samples:
+            return summary
+        transfer_seconds = self.last_byte_at - self.headers_at
+        network_seconds = transfer_seconds - disk["blocked_seconds"]
+        if network_seconds > 0:
+            summary["network_mbit_s"] = self.downloaded * 8 / network_seconds / 1e6
+        if self.sink.closed_at is not None and self.sink.closed_at > self.headers_at:
+            summary["end_to_end_mbit_s"] = disk["written_bytes"] * 8 / (self.sink.closed_at - self.headers_at) / 1e6
+        # 超過一成的傳輸時間在等磁碟，表示瓶頸在儲存裝置
+        summary["disk_limited"] = transfer_seconds > 0 and disk["blocked_seconds"] > transfer_seconds * 0.1
+        return summary
+
+    def add_sample(self, now: float):
+        """記錄吞吐量取樣，最多每 sample_interval 秒一筆"""
+        if not self.samples or now - self.samples[-1][0] >= self.sample_interval:
+            self.samples.append((now, self.downloaded))
+        self.last_byte_at = now
+
+    def timing_summary(self) -> Dict[str, Any]:
+        """連線建立、首位元組時間與穩態吞吐量 (SI Mbit/s)"""
+        connection = self.connection
+        summary: Dict[str, Any] = {
+            "dns_ms": connection.get("dns_ms"),
+            "tcp_connect_ms": connection.get("tcp_connect_ms"),
+            "tls_ms": connection.get("tls_ms"),
+            "setup_ms": sum(connection.get(name) or 0 for name in ("dns_ms", "tcp_connect_ms", "tls_ms"))
+                        if connection else None,
+            "ttfb_ms": None,
+            "steady_mbit_s": None,
+            "ramp_up_seconds": None,
+        }
+        if self.samples and "connected_ns" in connection:
+            summary["ttfb_ms"] = (self.samples[0][0] - connection["connected_ns"] / 1e9) * 1000
+        samples = list(self.samples)
+        if samples and samples[-1][1] != self.downloaded:
+            samples.append((self.last_byte_at, self.downloaded))
+        steady = steady_state_throughput(samples)
+        if steady is not None:
+            summary.update(steady)
+        return summary
+
+class PartialResultInterrupt(KeyboardInterrupt):
+    """帶有部分量測結果的 KeyboardInterrupt"""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__()
+        self.result = result
 
 def get_server_by_key_with_zone(key: str, zone: str = None) -> Optional[Dict[str, str]]:
     """根據鍵值和指定區域獲取伺服器資訊"""
@@ -589,6 +1838,19 @@ def get_server_by_key_with_zone(key: str, zone: str = None) -> Optional[Dict[str
         # 如果沒指定區域，使用預設順序
         return get_server_by_key(key)
 
+def get_test_url(server: Dict[str, Any], test_size: str = "100MB") -> Optional[str]:
+    """伺服器對應大小的測試檔案 URL"""
+    if server.get("provider") == "hinet" or "test_url" in server:
+        # HiNet 與自訂伺服器直接指定測試檔案
+        return server.get("test_url")
+    elif server.get("provider") == "linode":
+        # Linode 伺服器使用 test_urls 中對應大小的 URL
+        return server.get("test_urls", {}).get(test_size)
+    # Vultr 使用的實際測試檔案路徑
+    if test_size == "100MB":
+        return f"http://{server['host']}/vultr.com.100MB.bin"
+    return f"http://{server['host']}/vultr.com.1000MB.bin"
+
 def get_server_by_key(key: str) -> Optional[Dict[str, str]]:
     """根據鍵值獲取伺服器資訊"""
     # 先檢查 HiNet 伺服器
@@ -619,7 +1881,26 @@ def get_server_by_key(key: str) -> Optional[Dict[str, str]]:
             return server
     return None
 
-def list_all_servers(lang: str = "en"):
+def format_distance(server: Dict[str, Any], origin: Optional[Tuple[float, float]]) -> str:
+    """列表用的距離與最小 RTT 說明；沒有起點時為空字串"""
+    location = locate(server, origin)
+    if location is None:
+        return ""
+    return f" ({location['distance_km']:.0f} km, ≥{location['min_rtt_ms']:.1f} ms)"
+
+def prune_by_distance(server_keys: List[str], zone: Optional[str], origin: Tuple[float, float],
+                      max_distance_km: float) -> Tuple[List[str], List[str]]:
+    """依距離上限分成 (保留, 略過) 兩組"""
+    kept, pruned = [], []
+    for key in server_keys:
+        server = get_server_by_key_with_zone(key, zone)
+        if server is None or within_distance(server, origin, max_distance_km):
+            kept.append(key)
+        else:
+            pruned.append(key)
+    return kept, pruned
+
+def list_all_servers(lang: str = "en", origin: Optional[Tuple[float, float]] = None):
     """列出所有可用的伺服器"""
     print(get_text("available_servers", lang))
     print("=" * 50)
@@ -629,7 +1910,7 @@ def list_all_servers(lang: str = "en"):
     for region, servers in HINET_SERVERS.items():
         for key, server in servers.items():
             server_name = get_server_name(server, lang)
-            print(f"  {key:<15} - {server_name}")
+            print(f"  {key:<15} - {server_name}{format_distance(server, origin)}")
 
     # 顯示 Linode 伺服器
     print(f"\n{get_text('linode_global', lang)}")
@@ -637,7 +1918,7 @@ def list_all_servers(lang: str = "en"):
         print(f"\n{region.upper().replace('_', ' ')}:")
         for key, server in servers.items():
             server_name = get_server_name(server, lang)
-            print(f"  {key:<15} - {server_name}")
+            print(f"  {key:<15} - {server_name}{format_distance(server, origin)}")
 
     # 顯示 Vultr 伺服器
     print(f"\n{get_text('vultr_global', lang)}")
@@ -645,49 +1926,213 @@ def list_all_servers(lang: str = "en"):
         print(f"\n{region.upper().replace('_', ' ')}:")
         for key, server in servers.items():
             server_name = get_server_name(server, lang)
-            print(f"  {key:<15} - {server_name}")
+            print(f"  {key:<15} - {server_name}{format_distance(server, origin)}")
 
-def test_single_server(key: str, test_size: str = "100MB", show_progress: bool = True, quick_test: bool = False, lang: str = "en", zone: str = None) -> Dict[str, Any]:
-    """測試單一伺服器"""
-    server = get_server_by_key_with_zone(key, zone)
-    if not server:
-        zone_info = f" in zone '{zone}'" if zone else ""
-        return {"success": False, "error": f"{get_text('server_not_found', lang)}: {key}{zone_info}"}
+class SpeedTestEngine(EventEmitter):
+    """可嵌入的測速引擎：回傳 SpeedTestResult，所有輸出都透過事件發出
+
+    用法：
+        engine = SpeedTestEngine(test_size="100MB")
+        engine.subscribe(callback)          # 或 for event in engine.iter_events(keys)
+        results = engine.run(["tokyo", "paris"])
+    """
+
+    def __init__(self, test_size: str = "100MB", quick_test: bool = False, lang: str = "en", zone: str = None,
+                 cooldown: float = 2.0, timeout: int = 30, show_progress: bool = True,
+                 rcvbuf: Optional[int] = None, latency_under_load: bool = False,
+                 probe_host: Optional[str] = None, probe_interval: float = 0.2,
+                 origin: Optional[Tuple[float, float]] = None, sink_dir: Optional[str] = None,
+                 sink_mode: str = "buffered", max_rate: Optional[float] = None, target_rate: Optional[float] = None):
+        super().__init__()
+        self.test_size = test_size
+        self.quick_test = quick_test
+        self.lang = lang
+        self.zone = zone
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.show_progress = show_progress
+        self.rcvbuf = rcvbuf
+        self.latency_under_load = latency_under_load
+        self.probe_host = probe_host
+        self.probe_interval = probe_interval
+        self.origin = origin
+        self.sink_dir = sink_dir
+        self.sink_mode = sink_mode
+        self.max_rate = max_rate
+        self.target_rate = target_rate
+        # 目錄以外的自訂伺服器 (例如測試計畫中的實驗室主機)
+        self.custom_servers: Dict[str, Dict[str, Any]] = {}
+        # 記錄下載的每次讀取 (session_trace.SessionRecorder，同時需訂閱引擎事件)
+        self.recorder = None
+        # 指定 max_age 時，result_cache 中不超過 max_age 秒的結果直接沿用 (result_cache.ResultCache)
+        self.result_cache = None
+        self.max_age: Optional[float] = None
+        self.interrupted = False
+
+    def create_speed_test(self) -> SpeedTest:
+        speed_test = SpeedTest(timeout=self.timeout, rcvbuf=self.rcvbuf, sink_dir=self.sink_dir,
+                               sink_mode=self.sink_mode, max_rate_mbit_s=self.max_rate,
+                               target_rate_mbit_s=self.target_rate)
+        speed_test.recorder = self.recorder
+        return speed_test
+
+    def resolve_server(self, key: str) -> Optional[Dict[str, Any]]:
+        """由鍵值取得伺服器設定；custom_servers 優先於內建目錄"""
+        if key in self.custom_servers:
+            server = dict(self.custom_servers[key])
+            server.setdefault("key", key)
+            server.setdefault("name", key)
+            server.setdefault("region", "custom")
+            server.setdefault("provider", "custom")
+            return server
+        return get_server_by_key_with_zone(key, self.zone)
+
+    def measure_ping(self, server: Dict[str, Any], speed_test: SpeedTest,
+                     cancel_token: Optional[CancelToken] = None) -> float:
+        """量測延遲；子類別可改為使用快取"""
+        return speed_test.ping_test(server["host"], cancel_token)
+
+    def cache_key(self, key: str, server: Dict[str, Any]) -> str:
+        """快取鍵：大小之外加上影響量測結果的設定，設定不同的結果不會互相沿用"""
+        variant = [self.test_size]
+        if self.quick_test:
+            variant.append("quick")
+        if self.max_rate is not None:
+            variant.append(f"max={self.max_rate:g}")
+        if self.target_rate is not None:
+            variant.append(f"target={self.target_rate:g}")
+        if self.rcvbuf is not None:
+            variant.append(f"rcvbuf={self.rcvbuf}")
+        if self.sink_dir is not None:
+            variant.append(f"sink={self.sink_mode}")
+        if self.latency_under_load:
+            variant.append(f"loaded={self.probe_host or 'self'}")
+        if "test_url" in server:
+            # 自訂伺服器 (與 HiNet) 以測試檔案 URL 區分
+            variant.append(server["test_url"])
+        return cache_key(key, server["provider"], "download", "/".join(variant))
+
+    def cached_result(self, key: str, server: Dict[str, Any]) -> Optional[SpeedTestResult]:
+        """快取中夠新的結果 (標記 cached)；沒有或未啟用時回傳 None"""
+        if self.result_cache is None or self.max_age is None:
+            return None
+        record = self.result_cache.fresh(self.cache_key(key, server), self.max_age)
+        return SpeedTestResult(record) if record is not None else None
+
+    def create_latency_prober(self, server: Dict[str, Any], test_url: Optional[str]) -> LatencyProber:
+        """預設探測下載的同一台主機與埠；指定 probe_host 時改用參考主機"""
+        target = self.probe_host or test_url or f"http://{server['host']}/"
+        return LatencyProber.for_target(target, interval=self.probe_interval)
+
+    def run_server(self, key: str, cancel_token: Optional[CancelToken] = None,
+                   max_bytes: Optional[int] = None) -> SpeedTestResult:
+        """測試單一伺服器
+
+        cancel_token 被取消時中止；已下載的部分會以 partial 結果回傳。
+        max_bytes 為下載量上限 (測試計畫的流量預算)，達到時以 partial 結果結束。
+        Ctrl+C 時拋出帶有本伺服器部分結果 (result 屬性) 的 PartialResultInterrupt。
+        """
+        with get_tracer().span("server", server_key=key) as span:
+            result = self._run_server(key, cancel_token, max_bytes)
+            span["success"] = result.success
+            return result
+
+    def _run_server(self, key: str, cancel_token: Optional[CancelToken] = None,
+                    max_bytes: Optional[int] = None) -> SpeedTestResult:
+        lang = self.lang
+        server = self.resolve_server(key)
+        if not server:
+            zone_info = f" in zone '{self.zone}'" if self.zone else ""
+            result = SpeedTestResult(server_key=key, server_name=key,
+                                     error=f"{get_text('server_not_found', lang)}: {key}{zone_info}")
+            self.emit(SpeedTestEvent.ERROR, key, error=result["error"])
+            self.emit(SpeedTestEvent.RESULT, key, result=result)
+            return result
+
+        result = self.cached_result(key, server)
+        if result is not None:
+            self.emit(SpeedTestEvent.RESULT, key, result=result)
+            return result
 
-    try:
         server_name = get_server_name(server, lang)
-        print(f"{get_text('testing_server', lang)} {server_name} ({server['host']})...")
+        self.emit(SpeedTestEvent.PHASE_START, key, phase="server", server_name=server_name, host=server["host"])
 
-        speed_test = SpeedTest()
+        speed_test = self.create_speed_test()
+        speed_test.max_bytes = max_bytes
 
         # Ping 測試
-        if show_progress:
-            print(f"    {get_text('testing_latency', lang)}")
-        ping_ms = speed_test.ping_test(server["host"])
+        self.emit(SpeedTestEvent.PHASE_START, key, phase="latency")
+        with get_tracer().span("latency", host=server["host"]) as span:
+            ping_ms = span["ping_ms"] = self.measure_ping(server, speed_test, cancel_token)
+        self.emit(SpeedTestEvent.PHASE_END, key, phase="latency", ping_ms=ping_ms)
 
         # 下載測試
-        if show_progress:
-            print(f"    {get_text('testing_download', lang)}")
+        self.emit(SpeedTestEvent.PHASE_START, key, phase="download")
 
         # 檢查不同提供商的伺服器，使用對應的測試 URL
-        if server.get("provider") == "hinet":
-            download_result = speed_test.download_test(server["host"], test_size, show_progress, quick_test, server.get("test_url"), lang)
-        elif server.get("provider") == "linode":
-            # Linode 伺服器使用 test_urls 中對應大小的 URL
-            test_url = server.get("test_urls", {}).get(test_size)
-            download_result = speed_test.download_test(server["host"], test_size, show_progress, quick_test, test_url, lang)
+        test_url = get_test_url(server, self.test_size)
+        prober = None
+        if self.latency_under_load and not (cancel_token is not None and cancel_token.cancelled):
+            prober = self.create_latency_prober(server, test_url)
+            prober.sample_idle(cancel_token=cancel_token)
+
+        def start_prober(event: SpeedTestEvent):
+            # 只在資料傳輸期間量測負載 RTT，不含連線與請求階段
+            if event.kind == SpeedTestEvent.PHASE_START and event.server_key == key and event.data.get("phase") == "transfer":
+                prober.start()
+
+        if cancel_token is not None and cancel_token.cancelled:
+            download_result = {"success": False, "cancelled": True,
+                               "error": f"{get_text('test_cancelled', lang)} ({cancel_token.reason})"}
         else:
-            download_result = speed_test.download_test(server["host"], test_size, show_progress, quick_test, None, lang)
+            if prober is not None:
+                self.subscribe(start_prober)
+            try:
+                with get_tracer().span("download", url=test_url or "") as span:
+                    download_result = speed_test.download_test(server["host"], self.test_size, self.show_progress,
+                                                               self.quick_test, test_url, lang, self, key, cancel_token)
+                    span["success"] = download_result["success"]
+            except PartialResultInterrupt as e:
+                e.result = self.build_result(key, server, server_name, ping_ms, e.result, prober)
+                self.emit(SpeedTestEvent.RESULT, key, result=e.result)
+                raise
+            finally:
+                if prober is not None:
+                    self.unsubscribe(start_prober)
+                    prober.stop()
+        self.emit(SpeedTestEvent.PHASE_END, key, phase="download", success=download_result["success"])
 
-        result = {
-            "server_key": key,
-            "server_name": server_name,
-            "server_host": server["host"],
-            "server_ip": server.get("ip", "N/A"),
-            "region": server["region"],
-            "ping_ms": ping_ms,
-            "timestamp": dt.datetime.now(dt.timezone.utc).isoformat()
-        }
+        result = self.build_result(key, server, server_name, ping_ms, download_result, prober)
+        if not result.success:
+            self.emit(SpeedTestEvent.ERROR, key, error=result["error"])
+
+        self.emit(SpeedTestEvent.RESULT, key, result=result)
+        if self.result_cache is not None:
+            self.result_cache.store(self.cache_key(key, server), result)
+        return result
+
+    def build_result(self, key: str, server: Dict[str, Any], server_name: str, ping_ms: float,
+                     download_result: Dict[str, Any], prober: Optional[LatencyProber] = None) -> SpeedTestResult:
+        """合併伺服器資訊與下載結果"""
+        result = SpeedTestResult(
+            server_key=key,
+            server_name=server_name,
+            server_host=server["host"],
+            server_ip=server.get("ip", "N/A"),
+            region=server["region"],
+            provider=server["provider"],
+            ping_ms=ping_ms,
+            test_size=self.test_size,
+            quick_test=self.quick_test,
+            timestamp=dt.datetime.now(dt.timezone.utc).isoformat()
+        )
+
+        # 與起點的距離，以及實測 RTT 相對於光速下限的倍數
+        location = locate(server, self.origin)
+        if location is not None:
+            result.update(location)
+            measured_rtt = ping_ms if ping_ms > 0 else (download_result.get("tcp_info") or {}).get("min_rtt_ms")
+            result.update(rtt_anomaly(measured_rtt, location["min_rtt_ms"]))
 
         if download_result["success"]:
             result.update({
@@ -696,44 +2141,439 @@ def test_single_server(key: str, test_size: str = "100MB", show_progress: bool =
                 "test_duration": download_result["elapsed_seconds"],
                 "test_url": download_result["test_url"]
             })
+            for field in ("steady_mbit_s", "transfer_mbit_s", "ramp_up_seconds", "setup_ms", "ttfb_ms",
+                          "dns_ms", "tcp_connect_ms", "tls_ms", "cpu", "client_limited",
+                          "disk_sink", "network_mbit_s", "disk_mbit_s", "end_to_end_mbit_s", "disk_limited",
+                          "max_rate_mbit_s", "target_rate", "target_met",
+                          "partial", "partial_reason", "partial_error",
+                          "tcp_info", "rcvbuf_requested", "rcvbuf_effective"):
+                if field in download_result:
+                    result[field] = download_result[field]
+            if prober is not None:
+                latency = prober.summary()
+                result["latency_under_load"] = latency
+                result["bufferbloat_ms"] = latency["delta_ms"]
         else:
             result["error"] = download_result["error"]
-
+            if download_result.get("cancelled"):
+                result["cancelled"] = True
         return result
 
-    except KeyboardInterrupt:
-        # 重新拋出 KeyboardInterrupt 讓上層處理
-        raise
+    def run(self, server_keys: List[str]) -> List[SpeedTestResult]:
+        """依序測試多個伺服器；被 Ctrl+C 中斷時回傳已完成的結果"""
+        results = []
+        self.interrupted = False
+
+        try:
+            for i, key in enumerate(server_keys):
+                results.append(self.run_server(key))
+
+                # 等待間隔（除了最後一個；沿用快取的結果沒有產生流量，不需要等待）
+                if i < len(server_keys) - 1 and self.cooldown > 0 and not results[-1].get("cached"):
+                    self.emit(SpeedTestEvent.PHASE_START, key, phase="cooldown", seconds=self.cooldown)
+                    with get_tracer().span("cooldown", seconds=self.cooldown):
+                        time.sleep(self.cooldown)
+                    self.emit(SpeedTestEvent.PHASE_END, key, phase="cooldown")
+
+        except KeyboardInterrupt as e:
+            self.interrupted = True
+            # 中斷當下那一台已下載的部分也保留下來
+            partial = getattr(e, "result", None)
+            if isinstance(partial, SpeedTestResult):
+                results.append(partial)
+            self.emit(SpeedTestEvent.INTERRUPTED, None, completed=len(results), total=len(server_keys))
+
+        return results
+
+    def iter_events(self, server_keys: List[str]) -> Iterator[SpeedTestEvent]:
+        """在背景執行緒執行測試，並以迭代器方式逐一產生事件"""
+        events: "queue.Queue[Optional[SpeedTestEvent]]" = queue.Queue()
+        self.subscribe(events.put)
+
+        def worker():
+            try:
+                self.run(server_keys)
+            finally:
+                events.put(None)
+
+        threading.Thread(target=worker, daemon=True).start()
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            self.unsubscribe(events.put)
+
+class ConsoleReporter:
+    """把引擎事件輸出成原本 CLI 的文字格式"""
+
+    def __init__(self, lang: str = "en", show_progress: bool = True):
+        self.lang = lang
+        self.show_progress = show_progress
+        self.progress_open = False
+
+    def close_progress(self):
+        if self.progress_open:
+            print()  # 換行
+            self.progress_open = False
+
+    def __call__(self, event: SpeedTestEvent):
+        lang = self.lang
+        data = event.data
+        if event.kind != SpeedTestEvent.PROGRESS:
+            self.close_progress()
+
+        if event.kind == SpeedTestEvent.PHASE_START:
+            phase = data["phase"]
+            if phase == "server":
+                print(f"{get_text('testing_server', lang)} {data['server_name']} ({data['host']})...")
+            elif not self.show_progress:
+                return
+            elif phase == "latency":
+                print(f"    {get_text('testing_latency', lang)}")
+            elif phase == "download":
+                print(f"    {get_text('testing_download', lang)}")
+            elif phase == "transfer":
+                print(f"    {get_text('file_size', lang)}: {data['total_bytes'] / 1024 / 1024:.1f} MB")
+                print("    ", end="", flush=True)
+                self.progress_open = True
+
+        elif event.kind == SpeedTestEvent.PROGRESS and self.show_progress:
+            progress_percent = (data["downloaded_bytes"] / data["total_bytes"]) * 100
+            downloaded_mb = data["downloaded_bytes"] / 1024 / 1024
+
+            # 清除當前行並顯示進度
+            progress_bar = "█" * int(progress_percent // 5) + "░" * (20 - int(progress_percent // 5))
+            print(f"\r    [{progress_bar}] {progress_percent:.1f}% | "
+                  f"{downloaded_mb:.1f}MB | {data['speed_mbps']:.1f} Mbps",
+                  end="", flush=True)
+            self.progress_open = True
+
+        elif event.kind == SpeedTestEvent.PHASE_END and data["phase"] == "transfer" and self.show_progress:
+            tcp_summary = data["result"].get("tcp_info")
+            if tcp_summary:
+                rtt = tcp_summary["rcv_rtt_ms"] if tcp_summary["rcv_rtt_ms"] is not None else -1
+                window = tcp_summary["peak_rcv_wnd"] or tcp_summary["peak_rcv_ssthresh"]
+                window_rate = (f" ({tcp_summary['window_mbit_s']:.1f} Mbit/s)"
+                               if tcp_summary["window_mbit_s"] is not None else "")
+                print(f"    {get_text('tcp_stats', lang)}: rcv_rtt {rtt:.1f} ms | "
+                      f"ooo {tcp_summary['rcv_ooopack']} | "
+                      f"rwnd {window / 1024:.0f} KiB{window_rate} | {tcp_summary['limit']}")
+            result = data["result"]
+            if result.get("setup_ms") is not None:
+                tls = f" + TLS {result['tls_ms']:.1f}" if result.get("tls_ms") is not None else ""
+                ttfb = f" | TTFB {result['ttfb_ms']:.1f} ms" if result.get("ttfb_ms") is not None else ""
+                steady = ""
+                if result.get("steady_mbit_s") is not None:
+                    steady = (f" | {get_text('steady', lang)} {result['steady_mbit_s']:.1f} Mbit/s "
+                              f"({get_text('ramp_up', lang)} {result['ramp_up_seconds']:.2f} s)")
+                print(f"    {get_text('connection_timing', lang)}: DNS {result['dns_ms'] or 0:.1f} + "
+                      f"TCP {result['tcp_connect_ms'] or 0:.1f}{tls} = {result['setup_ms']:.1f} ms{ttfb}{steady}")
+            disk = result.get("disk_sink")
+            if disk:
+                rates = " | ".join(f"{label} {result[field]:.1f}" if result[field] is not None else f"{label} -"
+                                   for label, field in (("network", "network_mbit_s"), ("disk", "disk_mbit_s"),
+                                                        ("end-to-end", "end_to_end_mbit_s")))
+                error = f" | {disk['error']}" if disk["error"] else ""
+                print(f"    {get_text('disk_sink', lang)} ({disk['mode']}): {rates} Mbit/s "
+                      f"(blocked {disk['blocked_seconds']:.2f} s){' ⚠️' if result['disk_limited'] else ''}{error}")
+
+        elif event.kind == SpeedTestEvent.RESULT:
+            result = data["result"]
+            if result.success:
+                partial = f" ({get_text('partial', lang)}: {result.partial_reason})" if result.partial else ""
+                if result.get("cached"):
+                    partial += f" [{get_text('cached', lang)}, {format_age(result['cached_age_s'])}]"
+                steady = (f" ({get_text('steady', lang)} {result.steady_mbit_s:.1f} Mbit/s)"
+                          if result.steady_mbit_s is not None else "")
+                print(f"{result.server_name}: "
+                      f"{get_text('download', lang)} {result.download_mbps:.1f} Mbps{steady} | "
+                      f"{get_text('ping', lang)} {result.ping_ms:.1f} ms{partial}")
+                latency = result.get("latency_under_load")
+                if latency and latency["delta_ms"] is not None:
+                    print(f"    {get_text('latency_under_load', lang)}: "
+                          f"{get_text('idle', lang)} {latency['idle_ms']:.1f} ms → "
+                          f"{get_text('loaded', lang)} p50 {latency['loaded_p50_ms']:.1f} / "
+                          f"p90 {latency['loaded_p90_ms']:.1f} / p99 {latency['loaded_p99_ms']:.1f} ms "
+                          f"({latency['delta_ms']:+.1f} ms, {get_text('probe_lost', lang)} {latency['lost']})")
+                target = result.get("target_rate")
+                if target:
+                    verdict = "✅ " + get_text('target_met', lang) if target["target_met"] else "❌ " + get_text('target_missed', lang)
+                    print(f"    {get_text('target_rate', lang)} {target['target_mbit_s']:.1f} Mbit/s: {verdict} "
+                          f"(avg {target['achieved_mbit_s']:.1f}, p10 {target['p10_mbit_s']:.1f}, "
+                          f"{target['time_at_target'] * 100:.0f}% ≥ {TARGET_WINDOW_RATIO * 100:.0f}%, CV {target['cv'] or 0:.2f})")
+                if result.client_limited:
+                    cpu = result["cpu"]
+                    thread = (f"thread {cpu['thread_utilization'] * 100:.0f}%, "
+                              if cpu["thread_utilization"] is not None else "")
+                    print(f"    ⚠️  {get_text('client_limited', lang)} "
+                          f"(CPU {thread}process {cpu['process_utilization'] * 100:.0f}% / {cpu['cpu_count']} cores)")
+            else:
+                print(f"{result.server_name}: {get_text('test_failed', lang)} - {result.error or get_text('unknown_error', lang)}")
+            if result.rtt_anomaly in ("slow_path", "below_minimum"):
+                print(f"    ⚠️  {get_text('rtt_anomaly_' + result.rtt_anomaly, lang)} "
+                      f"({result['distance_km']:.0f} km, ≥{result['min_rtt_ms']:.1f} ms, x{result.get('rtt_stretch') or 0:.1f})")
+            for anomaly in result.get("anomalies", []):
+                print(f"    ⚠️  {get_text('anomaly', lang)}: {format_anomaly(anomaly)}")
+
+        elif event.kind == SpeedTestEvent.INTERRUPTED:
+            print(f"\n\n{get_text('interrupted', lang)} ({data['completed']}/{data['total']} {get_text('completed_tests', lang)})")
+            if data["completed"] == 0:
+                print(get_text('no_tests', lang))
+
+def test_single_server(key: str, test_size: str = "100MB", show_progress: bool = True, quick_test: bool = False, lang: str = "en", zone: str = None,
+                       rcvbuf: Optional[int] = None) -> Dict[str, Any]:
+    """測試單一伺服器 (輸出到終端機)"""
+    engine = SpeedTestEngine(test_size, quick_test, lang, zone, show_progress=show_progress, rcvbuf=rcvbuf)
+    engine.subscribe(ConsoleReporter(lang, show_progress))
+    return engine.run_server(key)
 
 def test_multiple_servers(server_keys: List[str], test_size: str = "100MB",
-                         cooldown: float = 2.0, show_progress: bool = True, quick_test: bool = False, lang: str = "en", zone: str = None) -> List[Dict[str, Any]]:
-    """測試多個伺服器"""
-    results = []
+                         cooldown: float = 2.0, show_progress: bool = True, quick_test: bool = False, lang: str = "en", zone: str = None,
+                         rcvbuf: Optional[int] = None, timeout: int = 30, latency_under_load: bool = False,
+                         probe_host: Optional[str] = None, probe_interval: float = 0.2,
+                         origin: Optional[Tuple[float, float]] = None, sink_dir: Optional[str] = None,
+                         sink_mode: str = "buffered", max_rate: Optional[float] = None,
+                         target_rate: Optional[float] = None, max_age: Optional[float] = None,
+                         cache_file: str = DEFAULT_CACHE_PATH) -> List[Dict[str, Any]]:
+    """測試多個伺服器 (輸出到終端機)；指定 max_age 時沿用不超過 max_age 秒的快取結果"""
+    engine = SpeedTestEngine(test_size, quick_test, lang, zone, cooldown, timeout, show_progress, rcvbuf,
+                             latency_under_load, probe_host, probe_interval, origin, sink_dir, sink_mode,
+                             max_rate, target_rate)
+    if max_age is not None:
+        engine.result_cache, engine.max_age = ResultCache(cache_file), max_age
+    engine.subscribe(ConsoleReporter(lang, show_progress))
+    return engine.run(server_keys)
 
+def read_sysctl(path: str) -> Optional[str]:
+    """讀取 /proc/sys 下的核心參數，無法讀取時回傳 None"""
     try:
-        for i, key in enumerate(server_keys):
-            result = test_single_server(key, test_size, show_progress, quick_test, lang, zone)
-            results.append(result)
-
-            # 顯示結果
-            if "download_mbps" in result:
-                print(f"{result['server_name']}: "
-                      f"{get_text('download', lang)} {result['download_mbps']:.1f} Mbps | "
-                      f"{get_text('ping', lang)} {result['ping_ms']:.1f} ms")
-            else:
-                print(f"{result['server_name']}: {get_text('test_failed', lang)} - {result.get('error', get_text('unknown_error', lang))}")
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
 
-            # 等待間隔（除了最後一個）
-            if i < len(server_keys) - 1 and cooldown > 0:
-                time.sleep(cooldown)
+def recommend_tcp_rmem(bdp_bytes: float) -> Dict[str, Any]:
+    """依頻寬延遲乘積建議 net.ipv4.tcp_rmem / net.core.rmem_max"""
+    # 核心只把約一半的接收緩衝區當作視窗 (tcp_adv_win_scale)，因此取 2 倍 BDP，
+    # 再進位到 2 的次方，且不低於 Linux 預設的 6MB 上限
+    required = 1 << max(int(2 * bdp_bytes) - 1, 1).bit_length()
+    max_bytes = max(required, 6 * 1024 * 1024)
+    current_rmem = read_sysctl("/proc/sys/net/ipv4/tcp_rmem")
+    current_max = read_sysctl("/proc/sys/net/core/rmem_max")
+    min_default = "4096 131072"
+    if current_rmem and len(current_rmem.split()) == 3:
+        fields = current_rmem.split()
+        current_rmem = " ".join(fields)
+        min_default = " ".join(fields[:2])
+        # 不建議調降已經足夠大的設定
+        max_bytes = max(max_bytes, int(fields[2]))
+    return {
+        "current_tcp_rmem": current_rmem,
+        "current_rmem_max": int(current_max) if current_max else None,
+        "required_bytes": required,
+        "tcp_rmem": f"{min_default} {max_bytes}",
+        "rmem_max": max_bytes,
+        "sysctl": [
+            f"net.ipv4.tcp_rmem = {min_default} {max_bytes}",
+            f"net.core.rmem_max = {max_bytes}",
+        ]
+    }
+
+def advise_socket_buffers(key: str, test_size: str = "100MB", show_progress: bool = True, quick_test: bool = False,
+                          lang: str = "en", zone: str = None, link_mbps: float = 1000.0) -> Dict[str, Any]:
+    """量測 RTT 與吞吐量、計算 BDP，以調整後的 SO_RCVBUF 重測並回報增益"""
+    baseline = test_single_server(key, test_size, show_progress, quick_test, lang, zone)
+    advice = {"server_key": key, "baseline": baseline, "link_mbps": link_mbps}
+    if "download_mbps" not in baseline:
+        advice["error"] = baseline.get("error", get_text("unknown_error", lang))
+        return advice
+
+    # RTT 優先採用 ping，失敗時改用 TCP_INFO 的接收端 RTT
+    rtt_ms = baseline["ping_ms"]
+    if rtt_ms <= 0:
+        rtt_ms = (baseline.get("tcp_info") or {}).get("rcv_rtt_ms") or 0
+    if rtt_ms <= 0:
+        advice["error"] = get_text("rtt_unavailable", lang)
+        return advice
+
+    rtt_s = rtt_ms / 1000
+    measured_bdp = baseline["download_mbps"] * 1024 * 1024 / 8 * rtt_s
+    link_bdp = link_mbps * 1e6 / 8 * rtt_s
+    tuned_rcvbuf = max(int(2 * link_bdp), 256 * 1024)
+
+    tuned = test_single_server(key, test_size, show_progress, quick_test, lang, zone, tuned_rcvbuf)
+    advice.update({
+        "rtt_ms": rtt_ms,
+        "measured_bdp_bytes": int(measured_bdp),
+        "link_bdp_bytes": int(link_bdp),
+        "tuned_rcvbuf": tuned_rcvbuf,
+        "tuned": tuned,
+        "recommendation": recommend_tcp_rmem(link_bdp)
+    })
+    if "download_mbps" in tuned:
+        advice["gain_pct"] = (tuned["download_mbps"] / baseline["download_mbps"] - 1) * 100
+    return advice
+
+def print_buffer_advice(advice: Dict[str, Any], lang: str = "en"):
+    """顯示緩衝區調整建議"""
+    if "error" in advice:
+        print(f"{advice['server_key']}: {get_text('test_failed', lang)} - {advice['error']}")
+        return
+    baseline = advice["baseline"]
+    tuned = advice["tuned"]
+    print(f"\n{get_text('buffer_advice', lang)} - {baseline['server_name']}")
+    print(f"    RTT {advice['rtt_ms']:.1f} ms | BDP {advice['measured_bdp_bytes'] / 1024:.0f} KB "
+          f"(@ {baseline['download_mbps']:.1f} Mbps) / {advice['link_bdp_bytes'] / 1024:.0f} KB (@ {advice['link_mbps']:.0f} Mbps)")
+    print(f"    {get_text('default_buffers', lang)}: {baseline['download_mbps']:.1f} Mbps")
+    if "download_mbps" in tuned:
+        effective = tuned.get("rcvbuf_effective") or 0
+        print(f"    SO_RCVBUF {advice['tuned_rcvbuf'] / 1024:.0f} KB (effective {effective / 1024:.0f} KB): "
+              f"{tuned['download_mbps']:.1f} Mbps ({advice['gain_pct']:+.1f}%)")
+    else:
+        print(f"    SO_RCVBUF {advice['tuned_rcvbuf'] / 1024:.0f} KB: {get_text('test_failed', lang)} - {tuned.get('error', '')}")
+    recommendation = advice["recommendation"]
+    if recommendation["current_tcp_rmem"]:
+        print(f"    {get_text('current_setting', lang)}: net.ipv4.tcp_rmem = {recommendation['current_tcp_rmem']}")
+    print(f"    {get_text('recommended_sysctl', lang)}:")
+    for line in recommendation["sysctl"]:
+        print(f"        {line}")
 
-    except KeyboardInterrupt:
-        print(f"\n\n{get_text('interrupted', lang)} ({len(results)}/{len(server_keys)} {get_text('completed_tests', lang)})")
-        if len(results) == 0:
-            print(get_text('no_tests', lang))
-            return results
+def print_summary(results: List[SpeedTestResult], lang: str = "en"):
+    """顯示多台伺服器測試的摘要"""
+    successful_tests = [r for r in results if r.success]
+    if successful_tests:
+        print(f"\n{get_text('successful_tests', lang)} {len(successful_tests)}/{len(results)} {get_text('servers', lang)}")
+        avg_speed = sum(r.download_mbps for r in successful_tests) / len(successful_tests)
+        print(f"{get_text('avg_download_speed', lang)}: {avg_speed:.1f} Mbps")
+        steady_tests = [r for r in successful_tests if r.steady_mbit_s is not None]
+        if steady_tests:
+            avg_steady = sum(r.steady_mbit_s for r in steady_tests) / len(steady_tests)
+            print(f"{get_text('avg_steady_speed', lang)}: {avg_steady:.1f} Mbit/s")
+        sink_tests = [r for r in successful_tests if r.get("end_to_end_mbit_s") is not None]
+        if sink_tests:
+            avg_end_to_end = sum(r["end_to_end_mbit_s"] for r in sink_tests) / len(sink_tests)
+            print(f"{get_text('avg_end_to_end_speed', lang)}: {avg_end_to_end:.1f} Mbit/s")
+        partial_tests = [r for r in successful_tests if r.partial]
+        if partial_tests:
+            print(f"{get_text('partial_results', lang)}: {len(partial_tests)} "
+                  f"({', '.join(f'{r.server_key}={r.partial_reason}' for r in partial_tests)})")
+        bloat_tests = [r for r in successful_tests if r.bufferbloat_ms is not None]
+        if bloat_tests:
+            avg_bloat = sum(r.bufferbloat_ms for r in bloat_tests) / len(bloat_tests)
+            print(f"{get_text('avg_bufferbloat', lang)}: {avg_bloat:+.1f} ms "
+                  f"({', '.join(f'{r.server_key}={r.bufferbloat_ms:+.1f}' for r in bloat_tests)})")
+        target_tests = [r for r in successful_tests if r.target_met is not None]
+        if target_tests:
+            missed = [r.server_key for r in target_tests if not r.target_met]
+            rates = "/".join(f"{rate:.1f}" for rate in sorted({r["target_rate"]["target_mbit_s"] for r in target_tests}))
+            print(f"{get_text('target_met_summary', lang)} ({rates} Mbit/s): "
+                  f"{len(target_tests) - len(missed)}/{len(target_tests)}"
+                  + (f" ({get_text('target_missed', lang)}: {', '.join(missed)})" if missed else ""))
+        cached_tests = [f"{r.server_key}={format_age(r['cached_age_s'])}" for r in successful_tests if r.get("cached")]
+        if cached_tests:
+            print(f"{get_text('cached_results', lang)}: {len(cached_tests)}/{len(successful_tests)} "
+                  f"({', '.join(cached_tests)})")
+        limited_tests = [r for r in successful_tests if r.client_limited]
+        if limited_tests:
+            print(f"⚠️  {get_text('client_limited_results', lang)}: {len(limited_tests)}/{len(successful_tests)} "
+                  f"({', '.join(r.server_key for r in limited_tests)})")
+    anomalies = [r for r in results if r.rtt_anomaly in ("slow_path", "below_minimum")]
+    if anomalies:
+        flagged = [f"{r.server_key}={r.rtt_anomaly} (x{r.get('rtt_stretch') or 0:.1f})" for r in anomalies]
+        print(f"{get_text('rtt_anomalies', lang)}: {', '.join(flagged)}")
+    departures = [f"{r.server_key} {a['metric']} ({a['detector']})" for r in results for a in r.get("anomalies", [])]
+    if departures:
+        print(f"⚠️  {get_text('anomalies_summary', lang)}: {', '.join(departures)}")
+
+def create_detector(args) -> Optional[AnomalyDetector]:
+    """--anomaly-state：逐筆更新各伺服器的基準，偏離時在結果中加上 anomalies"""
+    if not args.anomaly_state:
+        return None
+    on_anomaly = AnomalyLog(args.anomaly_log) if args.anomaly_log else None
+    return AnomalyDetector(args.anomaly_state, on_anomaly=on_anomaly)
+
+def attach_result_cache(engine: SpeedTestEngine, args, cache: Optional[ResultCache] = None) -> SpeedTestEngine:
+    """--max-age：沿用快取中夠新的結果，其餘照常測試並更新快取 (多個引擎應共用同一個 cache)"""
+    if args.max_age is not None:
+        engine.result_cache = cache or ResultCache(args.cache_file)
+        engine.max_age = args.max_age
+    return engine
 
-    return results
+def run_plan_file(args):
+    """--plan：伺服器、大小與預算由測試計畫決定，量測相關參數沿用命令列"""
+    from test_plan import PlanError, PlanRunner, describe_plan, format_result, load_plan
+    try:
+        plan = load_plan(args.plan)
+    except (OSError, PlanError) as e:
+        print(f"{get_text('invalid_plan', args.lang)} {args.plan}:")
+        for error in getattr(e, "errors", [str(e)]):
+            print(f"  - {error}")
+        return
+    print("\n".join(describe_plan(plan)))
+    print("=" * 50)
+
+    show_progress = not args.no_progress
+    if args.trace:
+        start_tracing("vultr_speedtest")
+    create_engine = functools.partial(SpeedTestEngine, rcvbuf=args.rcvbuf, latency_under_load=args.latency_under_load,
+                                      probe_host=args.probe_host, probe_interval=args.probe_interval,
+                                      origin=args.origin, sink_dir=args.sink, sink_mode=args.sink_mode)
+
+    # 並行步驟的每個目標各有一個引擎，快取共用一份
+    result_cache = ResultCache(args.cache_file) if args.max_age is not None else None
+
+    def engine_factory(*factory_args, max_rate=None, target_rate=None, **kwargs) -> SpeedTestEngine:
+        # 計畫沒有設定速率的步驟沿用命令列的 --max-rate / --target-rate (兩者一起沿用，避免目標超過上限)
+        if max_rate is None and target_rate is None:
+            max_rate, target_rate = args.max_rate, args.target_rate
+        engine = create_engine(*factory_args, max_rate=max_rate, target_rate=target_rate, **kwargs)
+        return attach_result_cache(engine, args, result_cache)
+
+    detector = create_detector(args)
+
+    def on_result(record: Dict[str, Any]):
+        # 下載結果由 ConsoleReporter 顯示 (基準已由引擎事件更新)
+        if record.get("kind") != "download" or record.get("skipped"):
+            if detector is not None:
+                detector.observe(record)
+            print(format_result(record), flush=True)
+            for anomaly in record.get("anomalies", []):
+                print(f"    ⚠️  {get_text('anomaly', args.lang)}: {format_anomaly(anomaly)}")
+
+    health = None
+    if not args.include_bad and os.path.exists(args.health_file):
+        # 延遲匯入：catalog_doctor 本身會匯入本模組
+        from catalog_doctor import HealthCache
+        health = HealthCache(args.health_file)
+
+    def exclude(step: Dict[str, Any], server: Dict[str, Any]) -> Optional[str]:
+        """與一般測試相同的 --max-distance 與已知失效測試檔略過規則，套用到計畫的每個機房"""
+        if args.max_distance is not None and not within_distance(server, args.origin, args.max_distance):
+            return f"{get_text('pruned_by_distance', args.lang)} ({args.max_distance:.0f} km)"
+        url = get_test_url(server, step["test_size"]) if health is not None and step["kind"] == "download" else None
+        record = health.known_bad(url) if url else None
+        if record is not None:
+            return (f"{get_text('skipped_known_bad', args.lang)}: {'; '.join(record['problems'])}, "
+                    f"{format_age(record['cached_age_s'])}")
+        return None
+
+    listeners = ([detector] if detector is not None else []) + [ConsoleReporter(args.lang, show_progress)]
+    runner = PlanRunner(plan, args.lang, show_progress, engine_factory, listeners=listeners, on_result=on_result,
+                        exclude=exclude)
+    results = runner.run()
+    if runner.interrupted:
+        print(f"\n\n{get_text('interrupted', args.lang)} ({len(results)} {get_text('completed_tests', args.lang)})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n{get_text('result_saved_to', args.lang)} {args.output}")
+    if export_tracing(args.trace, args.trace_format):
+        print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
+    print_summary([r for r in results if r.get("kind") == "download" and not r.get("skipped")], args.lang)
 
 def main():
     parser = argparse.ArgumentParser(description="Vultr Global Speed Test Tool")
@@ -757,11 +2597,80 @@ def main():
                        help="Quick test mode (partial download, default is full download)")
     parser.add_argument("--lang", choices=["en", "zh", "ja"], default="en",
                        help="Display language: en(English), zh(Traditional Chinese), ja(Japanese)")
+    parser.add_argument("--rcvbuf", type=parse_size,
+                       help="Socket receive buffer size, e.g. 4M (disables Linux receive autotuning for the test socket)")
+    parser.add_argument("--tune-buffers", action="store_true",
+                       help="Advisory mode: measure RTT/throughput, compute BDP, re-test with tuned buffers and recommend tcp_rmem")
+    parser.add_argument("--link-mbps", type=float, default=1000.0,
+                       help="Link capacity used for BDP sizing in --tune-buffers mode (default: 1000)")
+    parser.add_argument("--latency-under-load", action="store_true",
+                       help="Probe RTT before and during the download and report the increase under load (bufferbloat)")
+    parser.add_argument("--probe-host",
+                       help="Reference host[:port] for --latency-under-load (default: the download server)")
+    parser.add_argument("--probe-interval", type=float, default=0.2,
+                       help="Seconds between latency probes (default: 0.2)")
+    parser.add_argument("--origin", type=parse_origin, metavar="LAT,LON",
+                       help="Your location, used for distance, minimum RTT and RTT anomaly flags")
+    parser.add_argument("--max-distance", type=float, metavar="KM",
+                       help="Skip servers farther than this great-circle distance from --origin")
+    parser.add_argument("--sink", nargs="?", const="", metavar="DIR",
+                       help="Write downloaded data to a temporary file in DIR (default: system temp dir) "
+                            "and report network, disk and end-to-end rates; the file is removed afterwards")
+    parser.add_argument("--sink-mode", choices=SINK_MODES, default="buffered",
+                       help="Disk write mode for --sink: buffered (page cache), fdatasync, direct (O_DIRECT) (default: buffered)")
+    parser.add_argument("--max-rate", type=float, metavar="MBIT",
+                       help="Pace downloads with a token bucket to at most this rate (SI Mbit/s)")
+    parser.add_argument("--target-rate", type=float, metavar="MBIT",
+                       help="Check whether each path sustains this rate (SI Mbit/s); paces at the target unless --max-rate is given")
+    parser.add_argument("--anomaly-state", metavar="FILE",
+                       help="Learn a per-server baseline (EWMA + CUSUM) of throughput and latency, kept in FILE across runs, "
+                            "and flag results that depart from it")
+    parser.add_argument("--anomaly-log", metavar="FILE", help="Append anomaly records to FILE as NDJSON")
+    parser.add_argument("--interval", type=float, metavar="SECONDS",
+                       help="Long-running mode: repeat the test round every SECONDS until Ctrl+C "
+                            "(--output is appended as NDJSON after every round)")
+    parser.add_argument("--rounds", type=int, default=0,
+                       help="With --interval: stop after this many rounds (default: unlimited)")
+    parser.add_argument("--record", metavar="FILE",
+                       help="Record per-read timings, connection phases and ping of every download to a compact "
+                            "binary trace (replay with session_trace.py)")
+    parser.add_argument("--max-age", type=parse_duration, metavar="AGE",
+                       help="Reuse results from the local result cache that are newer than AGE (e.g. 90s, 15m, 2h) "
+                            "and only re-test stale servers; reused results are marked \"cached\": true")
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_PATH, metavar="FILE",
+                       help=f"Result cache used by --max-age (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--health-file", default=DEFAULT_HEALTH_PATH, metavar="FILE",
+                       help="Catalog check results from catalog_doctor.py; servers whose test file was found broken "
+                            f"are skipped (default: {DEFAULT_HEALTH_PATH})")
+    parser.add_argument("--include-bad", action="store_true",
+                       help="Test servers even if catalog_doctor.py found their test file broken")
+    parser.add_argument("--plan", metavar="FILE",
+                       help="Run a JSON test plan (server groups, test kinds, sizes, concurrency, budgets, outputs) "
+                            "instead of selecting servers on the command line")
+    parser.add_argument("--trace", metavar="FILE",
+                       help="Record phase timings (resolve/connect/TLS/request/transfer/cooldown) to a trace file")
+    parser.add_argument("--trace-format", choices=TRACE_FORMATS, default="chrome",
+                       help="Trace file format: chrome (Perfetto / chrome://tracing) or otlp (OTLP-JSON) (default: chrome)")
 
     args = parser.parse_args()
 
+    if args.max_distance is not None and args.origin is None:
+        parser.error(get_text("max_distance_needs_origin", args.lang))
+    if args.anomaly_log and not args.anomaly_state:
+        parser.error("--anomaly-log requires --anomaly-state")
+    if args.rounds and args.interval is None:
+        parser.error("--rounds requires --interval")
+    if args.record and args.plan:
+        parser.error("--record cannot be combined with --plan")
+    if ((args.max_rate is not None and args.max_rate <= 0) or (args.target_rate is not None and args.target_rate <= 0)
+            or (args.max_rate and args.target_rate and args.target_rate > args.max_rate)):
+        parser.error(get_text("invalid_rate", args.lang))
+
     if args.list:
-        list_all_servers(args.lang)
+        list_all_servers(args.lang, args.origin)
+        return
+    if args.plan:
+        run_plan_file(args)
         return
 
     # 決定要測試的伺服器
@@ -794,27 +2703,93 @@ def main():
         print(get_text("use_list_to_see", args.lang))
         return
 
+    if not args.include_bad and os.path.exists(args.health_file):
+        # 延遲匯入：catalog_doctor 本身會匯入本模組
+        from catalog_doctor import HealthCache, skip_known_bad
+        server_keys, known_bad = skip_known_bad(server_keys, args.zone, args.size, HealthCache(args.health_file))
+        for key, record in known_bad:
+            print(f"{get_text('skipped_known_bad', args.lang)}: {key} ({'; '.join(record['problems'])}, "
+                  f"{format_age(record['cached_age_s'])})")
+
+    if args.max_distance is not None:
+        server_keys, pruned = prune_by_distance(server_keys, args.zone, args.origin, args.max_distance)
+        if pruned:
+            print(f"{get_text('pruned_by_distance', args.lang)} ({args.max_distance:.0f} km): {', '.join(pruned)}")
+
     print(f"{get_text('starting_test', args.lang)} {len(server_keys)} {get_text('servers', args.lang)}...")
     print("=" * 50)
 
     # 執行測試
-    SpeedTest.timeout = args.timeout
     show_progress = not args.no_progress
     quick_test = args.quick
-    results = test_multiple_servers(server_keys, args.size, args.cooldown, show_progress, quick_test, args.lang, args.zone)
+    if args.trace:
+        start_tracing("vultr_speedtest")
 
-    # 儲存結果
-    if args.output:
-        with open(args.output, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        print(f"\n{get_text('result_saved_to', args.lang)} {args.output}")
+    if args.tune_buffers:
+        advices = []
+        try:
+            for key in server_keys:
+                advice = advise_socket_buffers(key, args.size, show_progress, quick_test, args.lang, args.zone, args.link_mbps)
+                print_buffer_advice(advice, args.lang)
+                advices.append(advice)
+        except KeyboardInterrupt:
+            print(f"\n\n{get_text('interrupted', args.lang)} ({len(advices)}/{len(server_keys)} {get_text('completed_tests', args.lang)})")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(advices, f, ensure_ascii=False, indent=2)
+            print(f"\n{get_text('result_saved_to', args.lang)} {args.output}")
+        if export_tracing(args.trace, args.trace_format):
+            print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
+        return
 
-    # 顯示摘要
-    successful_tests = [r for r in results if "download_mbps" in r]
-    if successful_tests:
-        print(f"\n{get_text('successful_tests', args.lang)} {len(successful_tests)}/{len(results)} {get_text('servers', args.lang)}")
-        avg_speed = sum(r["download_mbps"] for r in successful_tests) / len(successful_tests)
-        print(f"{get_text('avg_download_speed', args.lang)}: {avg_speed:.1f} Mbps")
+    engine = SpeedTestEngine(args.size, quick_test, args.lang, args.zone, args.cooldown, args.timeout, show_progress,
+                             args.rcvbuf, args.latency_under_load, args.probe_host, args.probe_interval, args.origin,
+                             args.sink, args.sink_mode, args.max_rate, args.target_rate)
+    attach_result_cache(engine, args)
+    detector = create_detector(args)
+    if detector is not None:
+        # 在 ConsoleReporter 之前訂閱，輸出結果時已帶有基準與異常
+        engine.subscribe(detector)
+    engine.subscribe(ConsoleReporter(args.lang, show_progress))
+    if args.record:
+        # 延遲匯入：session_trace 本身會匯入本模組
+        from session_trace import SessionRecorder, TraceWriter
+        engine.recorder = SessionRecorder(TraceWriter(args.record), {"test_size": args.size, "quick_test": quick_test,
+                                                                     "timeout": args.timeout})
+        engine.subscribe(engine.recorder)
+
+    round_number = 0
+    while True:
+        round_number += 1
+        if args.interval is not None:
+            print(f"\n{get_text('round', args.lang)} {round_number} ({dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
+        results = engine.run(server_keys)
+
+        # 儲存結果 (長時間執行時每輪附加，不重寫整個檔案)
+        if args.output and args.interval is not None:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                for result in results:
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            print(f"\n{get_text('result_appended_to', args.lang)} {args.output}")
+        elif args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"\n{get_text('result_saved_to', args.lang)} {args.output}")
+        if export_tracing(args.trace, args.trace_format):
+            print(f"{get_text('trace_saved_to', args.lang)} {args.trace}")
+        if args.record:
+            print(f"{get_text('sessions_recorded_to', args.lang)} {args.record}")
+
+        print_summary(results, args.lang)
+
+        if args.interval is None or engine.interrupted or (args.rounds and round_number >= args.rounds):
+            break
+        print(f"{get_text('next_round_in', args.lang)} {args.interval:.0f}s")
+        try:
+            time.sleep(args.interval)
+        except KeyboardInterrupt:
+            print(f"\n{get_text('interrupted', args.lang)}")
+            break
 
 if __name__ == "__main__":
     main()
\ No newline at end of file